@@ -0,0 +1,132 @@
+"""
+Backend logging: leveled, written off the request threads, with sampled payloads.
+
+Everything logs through the "webtools" logger (`log`). Records go onto an
+in-process queue and a QueueListener thread formats and writes them, so a
+request thread only pays for building the record. Messages use %-style
+arguments, which are only formatted if the record is written, and a disabled
+level costs one isEnabledFor check.
+
+Full AWS responses and decoded device payloads go to `payload_log`
+("webtools.payload"), which keeps only a sampled fraction of its records.
+
+Each record carries the request ID of the trace it was logged in (see tracing),
+or "-" outside a request.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+from .tracing import current_request_id
+
+log = logging.getLogger("webtools")
+payload_log = logging.getLogger("webtools.payload")
+
+TEXT_FORMAT = "[%(asctime)s] %(levelname)s [%(request_id)s] %(message)s"
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request ID. Runs on the thread that logged, before the record is queued."""
+
+    def filter(self, record):
+        record.request_id = current_request_id() or "-"
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Lets through a random `rate` (0..1) of the records it sees."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, request_id, message (and exception)."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread. The stock prepare()
+    formats the message on the calling thread so records can be pickled; this queue
+    never leaves the process, so the record goes on as it is. A full queue drops the
+    record (counted in `dropped`) instead of blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+
+
+def configure_logging(level="INFO", payload_sample_rate=0.01, json_format=False, queue_size=10000, stream=None):
+    """(Re)configures the "webtools" loggers. Safe to call more than once."""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        log.removeHandler(_handler)
+    else:
+        atexit.register(stop_logging)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT, "%Y-%m-%d %H:%M:%S"))
+    log_queue = queue.Queue(maxsize=queue_size)
+    _handler = DeferredQueueHandler(log_queue)
+    _handler.addFilter(RequestIdFilter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    log.setLevel(level)
+    log.addHandler(_handler)
+    log.propagate = False
+    payload_log.filters.clear()
+    payload_log.addFilter(SampleFilter(payload_sample_rate))
+
+
+def stop_logging():
+    """Writes out everything still queued and stops the listener thread (runs at exit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        log.removeHandler(_handler)
+
+
+def logging_stats():
+    return {
+        "level": logging.getLevelName(log.level),
+        "payload_sample_rate": next((f.rate for f in payload_log.filters if isinstance(f, SampleFilter)), None),
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
@@ -0,0 +1,151 @@
+"""
+Process-wide boto3 session and client registry.
+
+boto3 sessions aren't thread-safe, but the clients they create are. The
+registry therefore builds one session per profile and creates clients from it
+only while holding its lock. Each client is cached per (profile, service,
+region, endpoint, limits) and reused by every request, together with its
+connection pool.
+
+`limits` is an optional (connect_timeout, read_timeout, total_max_attempts)
+tuple, e.g. from Deadline.client_limits(); without it clients keep botocore's
+default timeouts and retries.
+
+Client hooks (add_client_hook) run once for every new client, which is where
+per-client botocore event handlers get registered.
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+
+
+class AwsClientRegistry:
+    def __init__(self, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS, service_pool_connections=None):
+        self.max_pool_connections = max_pool_connections
+        self.service_pool_connections = dict(service_pool_connections or {})
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+        self._resources = {}
+        self._available_profiles = None
+        self._client_hooks = []
+
+    def add_client_hook(self, hook):
+        """Calls `hook(client, profile, service)` for every client created from now on (resources included)."""
+        self._client_hooks.append(hook)
+
+    def _new_client(self, client, profile, service):
+        for hook in self._client_hooks:
+            hook(client, profile, service)
+        return client
+
+    def configure(self, max_pool_connections=None, service_pool_connections=None):
+        """Sets connection-pool sizes. Clients already created keep the size they were built with."""
+        with self._lock:
+            if max_pool_connections is not None:
+                self.max_pool_connections = max_pool_connections
+            if service_pool_connections is not None:
+                self.service_pool_connections = dict(service_pool_connections)
+
+    def pool_connections(self, service):
+        return self.service_pool_connections.get(service, self.max_pool_connections)
+
+    def _config(self, service, limits=None):
+        if limits is None:
+            return Config(max_pool_connections=self.pool_connections(service))
+        connect_timeout, read_timeout, max_attempts = limits
+        return Config(
+            max_pool_connections=self.pool_connections(service),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries={"total_max_attempts": max_attempts, "mode": "standard"},
+        )
+
+    def _session(self, profile):
+        # Caller holds self._lock
+        session = self._sessions.get(profile)
+        if session is None:
+            session = boto3.Session(profile_name=profile)
+            self._sessions[profile] = session
+        return session
+
+    def session(self, profile):
+        """The shared session for `profile` (None = default credentials). Don't create clients from it directly."""
+        with self._lock:
+            return self._session(profile)
+
+    def client(self, profile, service, region=None, endpoint_url=None, limits=None):
+        """Returns the cached client for (profile, service, region, endpoint_url, limits), creating it on first use."""
+        key = (profile, service, region, endpoint_url, limits)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._session(profile).client(
+                    service,
+                    region_name=region,
+                    endpoint_url=endpoint_url,
+                    config=self._config(service, limits),
+                )
+                self._clients[key] = self._new_client(client, profile, service)
+        return client
+
+    def resource(self, profile, service, region=None, limits=None):
+        """Returns the cached resource (e.g. dynamodb) for (profile, service, region, limits)."""
+        key = (profile, service, region, limits)
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+        with self._lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = self._session(profile).resource(
+                    service,
+                    region_name=region,
+                    config=self._config(service, limits),
+                )
+                self._new_client(resource.meta.client, profile, service)
+                self._resources[key] = resource
+        return resource
+
+    def table(self, profile, name, region=None, limits=None):
+        """Returns the cached DynamoDB Table `name` for (profile, region, limits)."""
+        key = (profile, "dynamodb-table", region, limits, name)
+        table = self._resources.get(key)
+        if table is None:
+            dynamodb = self.resource(profile, "dynamodb", region, limits)
+            with self._lock:
+                table = self._resources.setdefault(key, dynamodb.Table(name))
+        return table
+
+    def available_profiles(self):
+        """Profile names from ~/.aws/config and credentials, read once."""
+        with self._lock:
+            if self._available_profiles is None:
+                self._available_profiles = frozenset(boto3.Session().available_profiles)
+            return self._available_profiles
+
+    def has_profile(self, profile):
+        return profile in self.available_profiles()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": sorted(str(profile) for profile in self._sessions),
+                "clients": sorted(
+                    "/".join(str(part) for part in key[:4] if part is not None)
+                    + (f" (timeouts {key[4][0]}/{key[4][1]}s, {key[4][2]} attempts)" if key[4] else "")
+                    for key in self._clients
+                ),
+                "resources": len(self._resources),
+                "max_pool_connections": self.max_pool_connections,
+                "service_pool_connections": dict(self.service_pool_connections),
+            }
+
+
+AWS_CLIENTS = AwsClientRegistry()
@@ -0,0 +1,399 @@
+"""
+End-to-end latency benchmark: the real FastAPI app (routing, middleware, pools,
+caches, AWS client hooks) served in-process by Starlette's TestClient, with
+moto standing in for AWS and a fixed latency injected into every AWS request.
+
+Seeds moto with a small but realistic estate before the app is imported:
+  - iotbackup bucket: per device, a registration and `--heartbeats-per-day`
+    msgpack heartbeats on each of `--heartbeat-days` day prefixes, the latest
+    day a different number of days ago per device (so day walks vary)
+  - device registration table (ACCOUNTALLOCATION), refurb table rows, IoT
+    things and shadows, the battery replacement list
+  - pat-labels PNG trees under today's date, pat-labels table persons and a
+    "Customer" Cognito user pool
+  - Refurb-Table rows (dev profile) for the modem failure stats
+  - a "...Handler" CloudWatch log group with events for /api/search
+
+Then, per endpoint, reports p50/p95/p99 latency and the AWS calls made per
+request (by service and operation):
+  device_lookup        GET  /api/device_lookup?fresh=1 (cycling through the devices)
+  person_lookup        GET  /api/person_lookup
+  labels_today         GET  /api/labels/today?refresh=1
+  modem_failed_count   GET  /api/tools/modem-failed-count?refresh=1
+  search               POST /api/search (polls once a second, hence its own --search-iterations)
+  csv_split            POST /api/csvsplitter/split
+
+Needs backend/config.py, for the table, bucket and profile names; it doesn't
+need any AWS credentials (the profiles it names are written to a temporary AWS
+config). The heartbeat index goes to a temporary directory and the report
+scheduler and prewarm are turned off, so every run starts from the same state.
+Results are written as JSON with the commit they were measured at; pass an
+earlier result file to --compare to see the difference.
+
+Needs moto and httpx, which aren't backend dependencies:
+    pip install -r backend/benchmarks/requirements.txt
+
+Run from the repository root:
+    python backend/benchmarks/bench_endpoints.py [--iterations 50] [--concurrency 1]
+        [--aws-latency-ms 20] [--only device_lookup,csv_split] [--output results.json]
+        [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, REPO_ROOT)
+
+REGION = "eu-west-1"
+ICCID_BASE = 8943030172210000000
+LOG_GROUP = "/aws/lambda/bench-DeviceStatusHandler"
+LABEL_FOLDERS = ("Anomaly", "CoV", "Manifests", "NewSales", "ReplacementCradle", "ReplacementChargingCable",
+                 "ReplacementDevice", "ReturnQR", "Powerbank", "Returns")
+SHOPS = ("amazon", "shopify", "retail", "ebay", "direct")
+
+
+class AwsStandIn:
+    """AWS_CLIENTS client hook: sleeps `latency` seconds before each AWS request is sent and counts the calls."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def instrument(self, client, profile, service):
+        def before_call(event_name=None, **kwargs):
+            with self._lock:
+                self.calls[f"{service}.{event_name.rsplit('.', 1)[-1]}"] += 1
+
+        def before_send(**kwargs):
+            if self.latency:
+                time.sleep(self.latency)
+
+        client.meta.events.register("before-call", before_call)
+        # Ahead of moto's own before-send handler, which answers the request
+        client.meta.events.register_first("before-send", before_send)
+
+    def take_calls(self):
+        with self._lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+
+def write_aws_config(directory, profiles):
+    """An AWS config with dummy credentials for each profile the app may use."""
+    path = os.path.join(directory, "aws_config")
+    with open(path, "w") as f:
+        for profile in sorted(profiles):
+            f.write(f"[profile {profile}]\nregion = {REGION}\n"
+                    "aws_access_key_id = testing\naws_secret_access_key = testing\n\n")
+    os.environ["AWS_CONFIG_FILE"] = path
+    os.environ["AWS_SHARED_CREDENTIALS_FILE"] = os.path.join(directory, "aws_credentials")
+    os.environ["AWS_DEFAULT_REGION"] = REGION
+    os.environ.pop("AWS_PROFILE", None)
+
+
+def device_iccids(count):
+    return [str(ICCID_BASE + i) for i in range(count)]
+
+
+def person_ids(count):
+    return [f"bench-person-{i:04d}" for i in range(count)]
+
+
+def create_table(dynamodb, name, hash_key, range_key=None, indexes=()):
+    keys = [(hash_key, "HASH")] + ([(range_key, "RANGE")] if range_key else [])
+    attributes = {key for key, _ in keys} | set(indexes)
+    extra = {"GlobalSecondaryIndexes": [
+        {"IndexName": f"{key}-index", "KeySchema": [{"AttributeName": key, "KeyType": "HASH"}], "Projection": {"ProjectionType": "ALL"}}
+        for key in indexes
+    ]} if indexes else {}
+    return dynamodb.create_table(
+        TableName=name,
+        KeySchema=[{"AttributeName": key, "KeyType": kind} for key, kind in keys],
+        AttributeDefinitions=[{"AttributeName": a, "AttributeType": "S"} for a in sorted(attributes)],
+        BillingMode="PAY_PER_REQUEST",
+        **extra,
+    )
+
+
+def seed(config, account_id, args):
+    """Creates the benchmark's AWS estate in moto. Returns the number of objects and items written."""
+    import boto3
+    import msgpack
+
+    written = Counter()
+    gateway = boto3.Session(profile_name=config.AWS_PROFILES["gateway"])
+    account = boto3.Session(profile_name=config.ACCOUNT_TO_PROFILE_MAPPING[account_id])
+    now = datetime.now()
+    iccids = device_iccids(args.devices)
+
+    dynamodb = gateway.resource("dynamodb")
+    registrations = create_table(dynamodb, config.DYNAMODB_TABLES["device_registration"], "ID", "Metadata")
+    refurb = create_table(dynamodb, config.DYNAMODB_TABLES["refurb"], "iccid", "dateTime")
+    pat_labels = create_table(dynamodb, config.DYNAMODB_TABLES["pat_labels"], "ID", "Metadata", indexes=("PersonID",))
+    with registrations.batch_writer() as batch:
+        for i, iccid in enumerate(iccids):
+            batch.put_item(Item={"ID": iccid, "Metadata": "ACCOUNTALLOCATION", "AccountID": account_id,
+                                 "CreatedAt": int((now - timedelta(days=200 + i)).timestamp())})
+            written["dynamodb items"] += 1
+    with refurb.batch_writer() as batch:
+        for i, iccid in enumerate(iccids):
+            for n in range(i % 3):
+                batch.put_item(Item={"iccid": iccid, "dateTime": (now - timedelta(days=30 * (n + 1))).isoformat()})
+                written["dynamodb items"] += 1
+    with pat_labels.batch_writer() as batch:
+        for person_id in person_ids(args.persons):
+            batch.put_item(Item={"ID": person_id, "Metadata": "FULFILMENT#REQUEST", "PersonID": person_id, "AccountID": account_id})
+            written["dynamodb items"] += 1
+
+    s3 = gateway.client("s3")
+    location = {"LocationConstraint": REGION}
+    s3.create_bucket(Bucket=config.S3_BUCKETS["support_bucket"], CreateBucketConfiguration=location)
+    s3.put_object(Bucket=config.S3_BUCKETS["support_bucket"], Key="battery_swap/replacement_battery.txt",
+                  Body="\n".join(iccids[::4]).encode())
+    s3.create_bucket(Bucket="pat-labels", CreateBucketConfiguration=location)
+    today = now.strftime("%Y/%m/%d")
+    for i in range(args.labels):
+        folder = LABEL_FOLDERS[i % len(LABEL_FOLDERS)]
+        key = f"{today}/{folder}/{SHOPS[i % len(SHOPS)]}/{i:05d}.png" if folder in ("NewSales", "Anomaly") else f"{today}/{folder}/{i:05d}.png"
+        s3.put_object(Bucket="pat-labels", Key=key, Body=b"\x89PNG\r\n\x1a\n")
+        written["s3 objects"] += 1
+
+    s3 = account.client("s3")
+    bucket = "bench-iotbackuprule-bucket"
+    s3.create_bucket(Bucket=bucket, CreateBucketConfiguration=location)
+    iot = account.client("iot")
+    iot_data = account.client("iot-data")
+    for i, iccid in enumerate(iccids):
+        latest = now - timedelta(days=i % 7)
+        for day in range(args.heartbeat_days):
+            date = latest - timedelta(days=day)
+            prefix = f"{date:%Y/%m/%d}/Inovia/dev/LittleTheo/{iccid}/v1-0/"
+            start = int(date.replace(hour=0, minute=0, second=0).timestamp())
+            for n in range(args.heartbeats_per_day):
+                ts = start + n * 86400 // args.heartbeats_per_day
+                s3.put_object(Bucket=bucket, Key=f"{prefix}heartbeat/push/{ts}",
+                              Body=msgpack.packb([1, ts, 80 - n % 50, 3900, 1, 2, 3, 1.1, -1.5, 54.9, "1.2.3", 1]))
+                written["s3 objects"] += 1
+        registered = latest - timedelta(days=args.heartbeat_days + 2)
+        ts = int(registered.timestamp())
+        s3.put_object(Bucket=bucket, Key=f"{registered:%Y/%m/%d}/Inovia/dev/LittleTheo/{iccid}/v1-0/registration/push/{ts}",
+                      Body=msgpack.packb([ts, 75] + [0] * 11 + ["1-2-0"]))
+        written["s3 objects"] += 1
+        iot.create_thing(thingName=iccid, attributePayload={"attributes": {"model": "LittleTheo"}})
+        iot_data.update_thing_shadow(thingName=iccid, payload=json.dumps({"state": {"reported": {"debug": 0, "trip-timeout": 5}}}))
+
+    cognito = account.client("cognito-idp")
+    cognito.create_user_pool(PoolName="bench-Internal")
+    pool_id = cognito.create_user_pool(PoolName="bench-Customer")["UserPool"]["Id"]
+    for person_id in person_ids(args.persons):
+        cognito.admin_create_user(UserPoolId=pool_id, Username=person_id,
+                                  UserAttributes=[{"Name": "email", "Value": f"{person_id}@example.com"}])
+
+    refurb_dev = boto3.Session(profile_name="dev").resource("dynamodb")
+    refurb_table = create_table(refurb_dev, "Refurb-Table", "iccid")
+    with refurb_table.batch_writer() as batch:
+        for i in range(args.refurb_rows):
+            item = {"iccid": str(ICCID_BASE + 500000 + i), "dateTime": (now - timedelta(hours=i % 500)).isoformat(),
+                    "3_User-Port": f"cramlington{1 + i % 2}-{i % 8}"}
+            if i % 5 == 0:
+                item["6_GSM FW loaded"] = "1"
+            if i % 7 == 0:
+                item["5_GNSS FW loaded"] = "1"
+            batch.put_item(Item=item)
+            written["dynamodb items"] += 1
+
+    logs = account.client("logs")
+    logs.create_log_group(logGroupName=LOG_GROUP)
+    logs.create_log_group(logGroupName="/aws/lambda/bench-Unrelated")
+    logs.create_log_stream(logGroupName=LOG_GROUP, logStreamName="bench")
+    start = int(time.time() * 1000) - args.log_events * 1000
+    logs.put_log_events(logGroupName=LOG_GROUP, logStreamName="bench", logEvents=[
+        {"timestamp": start + n * 1000, "message": f"{'heartbeat' if n % 3 else 'registration'} from {iccids[n % len(iccids)]}"}
+        for n in range(args.log_events)
+    ])
+    return written
+
+
+def synthetic_csv(rows):
+    lines = ["iccid,person_id,shop,created_at,status"]
+    lines += [f"{ICCID_BASE + i},person-{i:06d},{SHOPS[i % len(SHOPS)]},2025-01-{1 + i % 28:02d}T10:00:00,ok" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def scenarios(args, account_id, profile):
+    """{name: (iterations, request(i) -> (method, url, kwargs))}"""
+    iccids = device_iccids(args.devices)
+    persons = person_ids(args.persons)
+    csv_body = synthetic_csv(args.csv_rows)
+    now = datetime.now()
+    search = {"profile": profile, "handler": "DeviceStatusHandler", "search_term": "heartbeat",
+              "start_time": (now - timedelta(days=1)).isoformat(), "end_time": (now + timedelta(minutes=5)).isoformat()}
+    return {
+        "device_lookup": (args.iterations, lambda i: ("GET", "/api/device_lookup", {"params": {"iccid": iccids[i % len(iccids)], "fresh": 1}})),
+        "person_lookup": (args.iterations, lambda i: ("GET", "/api/person_lookup", {"params": {"person_id": persons[i % len(persons)]}})),
+        "labels_today": (args.iterations, lambda i: ("GET", "/api/labels/today", {"params": {"refresh": 1}})),
+        "modem_failed_count": (args.iterations, lambda i: ("GET", "/api/tools/modem-failed-count", {"params": {"refresh": 1}})),
+        "search": (args.search_iterations, lambda i: ("POST", "/api/search", {"json": search})),
+        "csv_split": (args.iterations, lambda i: ("POST", "/api/csvsplitter/split", {
+            "params": {"rows_per_chunk": args.csv_chunk_rows}, "files": {"file": ("devices.csv", csv_body, "text/csv")}})),
+    }
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+
+def run_scenario(client, stand_in, iterations, make_request, concurrency, warmup):
+    def timed(i):
+        method, url, kwargs = make_request(i)
+        start = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        return time.perf_counter() - start, response.status_code
+
+    for i in range(warmup):
+        timed(i)
+    stand_in.take_calls()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(warmup, warmup + iterations)))
+    wall = time.perf_counter() - started
+    calls = stand_in.take_calls()
+    latencies = [elapsed * 1000 for elapsed, _ in results]
+    statuses = Counter(str(status) for _, status in results)
+    return {
+        "requests": iterations,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": dict(statuses),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "max_ms": round(max(latencies), 2),
+        "throughput_rps": round(iterations / wall, 2),
+        "aws_calls_per_request": round(sum(calls.values()) / iterations, 2),
+        "aws_calls": dict(sorted(calls.items())),
+    }
+
+
+def git_revision():
+    def git(*command):
+        return subprocess.run(["git", *command], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def compare(previous, current):
+    print(f"\ncompared with {previous.get('commit', '?')[:12]} ({previous.get('timestamp', '?')}):")
+    print(f"{'endpoint':<20} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'AWS calls/req':>16}")
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if before is None:
+            continue
+
+        def change(key):
+            old, new = before[key], result[key]
+            delta = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+            return f"{old:.1f}->{new:.1f} {delta:>5}"
+
+        print(f"{name:<20} {change('p50_ms'):>20} {change('p95_ms'):>20} {change('p99_ms'):>20} {change('aws_calls_per_request'):>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50, help="Measured requests per endpoint.")
+    parser.add_argument("--search-iterations", type=int, default=5, help="Measured /api/search requests (each polls for at least a second).")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests per endpoint first.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once.")
+    parser.add_argument("--aws-latency-ms", type=float, default=20.0, help="Latency added to every AWS request.")
+    parser.add_argument("--only", help="Comma-separated endpoints to run (default: all).")
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--heartbeat-days", type=int, default=3)
+    parser.add_argument("--heartbeats-per-day", type=int, default=24)
+    parser.add_argument("--labels", type=int, default=300, help="PNG labels under today's pat-labels prefix.")
+    parser.add_argument("--persons", type=int, default=20)
+    parser.add_argument("--refurb-rows", type=int, default=500, help="Refurb-Table rows for the modem failure stats.")
+    parser.add_argument("--log-events", type=int, default=500)
+    parser.add_argument("--csv-rows", type=int, default=20000)
+    parser.add_argument("--csv-chunk-rows", type=int, default=1000)
+    parser.add_argument("--output", help="Write the results JSON here (default: print it).")
+    parser.add_argument("--compare", help="Earlier results JSON to compare this run with.")
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory(prefix="bench_endpoints_")
+    # generate_report writes label.txt to the working directory
+    output = os.path.abspath(args.output) if args.output else None
+    previous_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(workdir.name)
+
+    try:
+        from backend import config
+    except ImportError:
+        sys.exit("backend/config.py is needed (copy it from backend/config.py.example).")
+    config.HEARTBEAT_INDEX_PATH = os.path.join(workdir.name, "heartbeat_index.sqlite3")
+    config.REPORT_SCHEDULER_ENABLED = False
+    config.PREWARM_ACCOUNTS_ON_STARTUP = False
+    config.LOG_LEVEL = "ERROR"
+    account_id, profile = next(iter(config.ACCOUNT_TO_PROFILE_MAPPING.items()))
+    write_aws_config(workdir.name, {"dev", "gateway", *config.AWS_PROFILES.values(), *config.ACCOUNT_TO_PROFILE_MAPPING.values()})
+
+    from moto import mock_aws
+
+    with mock_aws():
+        seed_started = time.perf_counter()
+        written = seed(config, account_id, args)
+        print(f"seeded {dict(written)} in {time.perf_counter() - seed_started:.1f}s", file=sys.stderr)
+
+        from fastapi.testclient import TestClient
+        import backend.main as app_main
+
+        stand_in = AwsStandIn(args.aws_latency_ms / 1000)
+        app_main.AWS_CLIENTS.add_client_hook(stand_in.instrument)
+        # moto only answers IoT data calls on the regional endpoint, not on the account
+        # endpoint describe_endpoint returns, so that discovery is answered up front
+        app_main.discovery_cache.get_or_load(account_id, "iot_data_endpoint", lambda: f"https://data-ats.iot.{REGION}.amazonaws.com")
+        selected = set(args.only.split(",")) if args.only else None
+        results = {}
+        with TestClient(app_main.app) as client:
+            for name, (iterations, make_request) in scenarios(args, account_id, profile).items():
+                if selected is not None and name not in selected:
+                    continue
+                results[name] = run_scenario(client, stand_in, iterations, make_request, args.concurrency, args.warmup)
+                r = results[name]
+                print(f"{name:<20} p50 {r['p50_ms']:8.1f} ms  p95 {r['p95_ms']:8.1f} ms  p99 {r['p99_ms']:8.1f} ms  "
+                      f"{r['aws_calls_per_request']:6.1f} AWS calls/req  errors {r['errors']}", file=sys.stderr)
+
+    report = {
+        **git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "only")},
+        "seeded": dict(written),
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if previous_path:
+        with open(previous_path) as f:
+            compare(json.load(f), report)
+    workdir.cleanup()
+    if any(r["errors"] for r in results.values()):
+        sys.exit("some requests failed; see the statuses in the results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark for heartbeat_codec.decode_heartbeat across the three heartbeat
+layouts, against the previous decode path that unpacked each payload twice
+(once to read the version, once more to decode). `decode+info` also builds the
+heartbeat summary shown by device lookups.
+
+Run from the repository root:
+    python backend/benchmarks/bench_heartbeat_codec.py [--number 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+import msgpack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from heartbeat_codec import decode_heartbeat, format_coordinate  # noqa: E402
+
+TIMESTAMP = 1760000000
+
+PAYLOADS = {
+    "v1-dict": msgpack.packb([1, {
+        "timestamp": TIMESTAMP, "battery_percentage": 80, "battery_voltage": 3900,
+        "ax": 1, "ay": 2, "az": 3, "hdop": 1.1, "lng": -1.5, "lat": 54.9,
+        "firmware_version": "1.2.3", "gps_connected": True,
+    }]),
+    "v1-list": msgpack.packb([1, TIMESTAMP, 80, 3900, 1, 2, 3, 1.1, -1.5, 54.9, "1.2.3", 1]),
+    "unversioned-list": msgpack.packb([TIMESTAMP, 80, 3900, 1, 2, 3, 1.1, -1.5, 54.9, "1.2.3", 1]),
+}
+
+
+def legacy_decode(data):
+    """The decode path get_latest_heartbeat_info used before heartbeat_codec."""
+    vals = msgpack.unpackb(data, raw=False)
+    fw_version = int(str(vals[0]))
+    if fw_version > 1000:
+        return msgpack.unpackb(data, raw=False)
+    unpacked = msgpack.unpackb(data, raw=False)
+    if isinstance(unpacked[1], dict):
+        return unpacked[1]
+    return {
+        'timestamp': unpacked[1], 'battery_percentage': unpacked[2], 'battery_voltage': unpacked[3],
+        'ax': unpacked[4], 'ay': unpacked[5], 'az': unpacked[6], 'hdop': unpacked[7],
+        'lng': unpacked[8], 'lat': unpacked[9], 'firmware_version': unpacked[10],
+        'gps_connected': bool(unpacked[11]),
+    }
+
+
+def legacy_info(data):
+    """legacy_decode plus the heartbeat_info dict get_latest_heartbeat_info then built from it."""
+    hb = legacy_decode(data)
+    if isinstance(hb, dict):
+        return {
+            'last_seen': datetime.fromtimestamp(hb['timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
+            'battery_percentage': hb.get('battery_percentage', 'N/A'),
+            'battery_voltage': hb.get('battery_voltage', 'N/A'),
+            'gps_connected': hb.get('gps_connected', False),
+            'lat': format_coordinate(hb.get('lat', 'N/A')),
+            'lng': format_coordinate(hb.get('lng', 'N/A')),
+            'firmware_version': hb.get('firmware_version', 'N/A'),
+        }
+    return {
+        'last_seen': datetime.fromtimestamp(hb[0]).strftime('%Y-%m-%d %H:%M:%S'),
+        'battery_percentage': hb[1],
+        'battery_voltage': hb[2],
+        'gps_connected': bool(hb[10]),
+        'lat': format_coordinate(hb[8]),
+        'lng': format_coordinate(hb[7]),
+        'firmware_version': hb[9],
+    }
+
+
+def codec_info(data):
+    return decode_heartbeat(data).to_info()
+
+
+def best_per_call(func, data, number, repeat=5):
+    return min(timeit.repeat(lambda: func(data), number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing run (best of 5 runs is reported).")
+    args = parser.parse_args()
+
+    print(f"{'layout':<18} {'step':<15} {'codec (us)':>11} {'legacy (us)':>12} {'speedup':>8}")
+    for layout, data in PAYLOADS.items():
+        record = decode_heartbeat(data)
+        assert record is not None and record.layout == layout, f"{layout} decoded as {record!r}"
+        assert codec_info(data) == legacy_info(data), f"{layout}: codec and legacy heartbeat_info differ"
+        for step, codec_func, legacy_func in (("decode", decode_heartbeat, legacy_decode), ("decode+info", codec_info, legacy_info)):
+            codec = best_per_call(codec_func, data, args.number)
+            legacy = best_per_call(legacy_func, data, args.number)
+            print(f"{layout:<18} {step:<15} {codec * 1e6:>11.2f} {legacy * 1e6:>12.2f} {legacy / codec:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
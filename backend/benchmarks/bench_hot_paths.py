@@ -0,0 +1,242 @@
+"""
+Micro-benchmarks with budgets for the backend's pure hot paths: battery
+weighting, heartbeat and registration decoding, coordinate formatting, the
+PNG/base64 sniffing of label objects and CSV splitting.
+
+Each case is timed (best of --repeat runs) and its peak allocation per call is
+measured with tracemalloc, then compared with the stored baseline in
+hot_paths_baseline.json. Times are stored relative to a fixed pure-Python
+calibration loop timed in turn with them, so a baseline recorded on one
+machine is still meaningful on another. A case fails if it is slower than its baseline
+by more than its time tolerance, or allocates more than its allocation
+tolerance allows; the script then exits 1. Allocations are only compared on
+the Python version the baseline was recorded with.
+
+Runs offline: no AWS calls are made. Needs backend/config.py (the example one
+will do), since portal_battery and decode_png_content live in backend.main.
+
+Run from the repository root:
+    python backend/benchmarks/bench_hot_paths.py [--only format_coordinate] [--repeat 7] [--retries 2]
+After an intended change in speed or allocations, record new baselines with:
+    python backend/benchmarks/bench_hot_paths.py --update
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import msgpack
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, REPO_ROOT)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hot_paths_baseline.json")
+
+TIME_TOLERANCE = 0.30  # fraction above the baseline time a case may take
+ALLOC_TOLERANCE = 0.10  # fraction above the baseline peak allocation
+ALLOC_SLACK = 512  # bytes always allowed on top, so tiny peaks don't fail on noise
+
+TIMESTAMP = 1760000000
+HEARTBEATS = {
+    "v1-dict": msgpack.packb([1, {
+        "timestamp": TIMESTAMP, "battery_percentage": 80, "battery_voltage": 3900,
+        "ax": 1, "ay": 2, "az": 3, "hdop": 1.1, "lng": -1.5, "lat": 54.9,
+        "firmware_version": "1.2.3", "gps_connected": True,
+    }]),
+    "v1-list": msgpack.packb([1, TIMESTAMP, 80, 3900, 1, 2, 3, 1.1, -1.5, 54.9, "1.2.3", 1]),
+    "unversioned-list": msgpack.packb([TIMESTAMP, 80, 3900, 1, 2, 3, 1.1, -1.5, 54.9, "1.2.3", 1]),
+}
+REGISTRATION = msgpack.packb([TIMESTAMP, 75] + [0] * 11 + ["1-2-0"])
+COORDINATES = [54.9783, -1.6178, "54.978300", "-1.6", 0, None, "N/A", "not a number"]
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 64
+PNG_BASE64 = base64.b64encode(PNG)
+PNG_DATA_URL = b"data:image/png;base64," + base64.encodebytes(PNG)  # wrapped at 76 columns, as some uploads are
+
+
+class Case:
+    def __init__(self, name, func, time_tolerance=TIME_TOLERANCE, alloc_tolerance=ALLOC_TOLERANCE):
+        self.name = name
+        self.func = func
+        self.time_tolerance = time_tolerance
+        self.alloc_tolerance = alloc_tolerance
+
+
+def calibration():
+    """Fixed pure-Python work (arithmetic, dicts, strings) that times are expressed in."""
+    total = 0
+    counts = {}
+    for i in range(2000):
+        total += i * i % 7
+        key = str(i % 50)
+        counts[key] = counts.get(key, 0) + 1
+    return total, len(",".join(counts))
+
+
+def csv_split_case(directory, rows=20000, rows_per_chunk=2000):
+    from backend.csv_splitter import split_csv_and_zip
+
+    input_path = Path(directory) / "devices.csv"
+    with open(input_path, "w") as f:
+        f.write("iccid,person_id,shop,created_at,status\n")
+        for i in range(rows):
+            f.write(f"{8943030172210000000 + i},person-{i:06d},shop{i % 5},2025-01-{1 + i % 28:02d}T10:00:00,ok\n")
+    output_dir = Path(directory) / "out"
+    output_dir.mkdir()
+    return lambda: split_csv_and_zip(input_path, rows_per_chunk, output_dir)
+
+
+def build_cases(workdir):
+    from backend.heartbeat_codec import decode_heartbeat, decode_registration, format_coordinate, unpack
+    from backend.main import decode_png_content, portal_battery
+
+    portal_battery(50)  # loads BatteryWeightings.csv
+    percentages = list(range(-5, 106)) + [None, "42"]
+    cases = [
+        Case("portal_battery[0..100]", lambda: [portal_battery(p) for p in percentages]),
+        Case("unpack[v1-list]", lambda: unpack(HEARTBEATS["v1-list"])),
+    ]
+    for layout, data in HEARTBEATS.items():
+        cases.append(Case(f"decode_heartbeat[{layout}]", lambda data=data: decode_heartbeat(data)))
+    cases += [
+        Case("decode_heartbeat+info[v1-dict]", lambda: decode_heartbeat(HEARTBEATS["v1-dict"]).to_info()),
+        Case("decode_registration", lambda: decode_registration(REGISTRATION)),
+        Case("format_coordinate", lambda: [format_coordinate(c) for c in COORDINATES]),
+        Case("decode_png_content[png]", lambda: decode_png_content(PNG)),
+        Case("decode_png_content[base64]", lambda: decode_png_content(PNG_BASE64)),
+        Case("decode_png_content[data-url]", lambda: decode_png_content(PNG_DATA_URL)),
+        # Disk and zlib bound, so noisier
+        Case("split_csv_and_zip[20k rows]", csv_split_case(workdir), time_tolerance=0.50, alloc_tolerance=0.25),
+    ]
+    assert decode_png_content(PNG) == decode_png_content(PNG_BASE64) == decode_png_content(PNG_DATA_URL) == PNG
+    assert all(decode_heartbeat(data).timestamp == TIMESTAMP for data in HEARTBEATS.values())
+    return cases
+
+
+def measure_time(func, repeat):
+    """
+    (best seconds per call, median time in calibration units) over `repeat` rounds.
+    Each round times the calibration loop and then `func`, ~0.2 s each, so a change
+    in machine speed during the run affects both sides of each ratio alike.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    calibration_timer = timeit.Timer(calibration)
+    calibration_number, _ = calibration_timer.autorange()
+    seconds = []
+    units = []
+    for _ in range(repeat):
+        unit = calibration_timer.timeit(calibration_number) / calibration_number
+        seconds.append(timer.timeit(number) / number)
+        units.append(seconds[-1] / unit)
+    return min(seconds), statistics.median(units)
+
+
+def peak_allocation(func, runs=5):
+    """Smallest peak of memory traced by tracemalloc during one call, in bytes, over `runs` calls."""
+    func()  # lazy imports and caches
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(runs):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        return min(peaks)
+    finally:
+        tracemalloc.stop()
+
+
+def git_commit():
+    return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=7, help="Timing runs per case (the best one counts).")
+    parser.add_argument("--only", help="Comma-separated case names (or name prefixes) to run.")
+    parser.add_argument("--retries", type=int, default=2, help="Extra measurements of a case over its time budget before it fails.")
+    parser.add_argument("--update", action="store_true", help="Record this run as the new baseline for the cases run.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    baseline = {"cases": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    python = ".".join(platform.python_version_tuple()[:2])
+    compare_allocations = baseline.get("python") == python
+    if baseline["cases"] and not compare_allocations and not args.update:
+        print(f"note: baseline recorded on Python {baseline.get('python')}, this is {python}; allocations not compared", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix="bench_hot_paths_") as workdir:
+        cases = build_cases(workdir)
+        if args.only:
+            prefixes = tuple(args.only.split(","))
+            cases = [case for case in cases if case.name.startswith(prefixes)]
+
+        print(f"{'case':<36} {'time (us)':>11} {'budget':>11} {'peak alloc':>11} {'budget':>11}  status")
+        measured = {}
+        failures = []
+        for case in cases:
+            stored = baseline["cases"].get(case.name)
+            time_budget = stored["time_units"] * (1 + case.time_tolerance) if stored else None
+            seconds, units = measure_time(case.func, args.repeat)
+            for _ in range(args.retries if not args.update else 0):
+                # A time over budget is measured again before it counts, in case the machine was just busy
+                if time_budget is None or units <= time_budget:
+                    break
+                seconds, units = min((seconds, units), measure_time(case.func, args.repeat), key=lambda m: m[1])
+            allocated = peak_allocation(case.func)
+            measured[case.name] = {"time_us": round(seconds * 1e6, 3), "time_units": round(units, 5), "alloc_peak_bytes": allocated}
+
+            alloc_budget = None
+            status = "new (no baseline)"
+            if stored:
+                alloc_budget = int(stored["alloc_peak_bytes"] * (1 + case.alloc_tolerance)) + ALLOC_SLACK
+                problems = []
+                if units > time_budget:
+                    problems.append(f"{units / stored['time_units']:.2f}x slower")
+                if compare_allocations and allocated > alloc_budget:
+                    problems.append(f"{allocated / max(stored['alloc_peak_bytes'], 1):.2f}x allocations")
+                if problems:
+                    failures.append(f"{case.name}: {', '.join(problems)} than baseline")
+                    status = "FAIL " + ", ".join(problems)
+                elif units < stored["time_units"] * (1 - case.time_tolerance):
+                    status = f"ok ({stored['time_units'] / units:.2f}x faster, consider --update)"
+                else:
+                    status = "ok"
+            elif not args.update:
+                failures.append(f"{case.name}: no baseline (run with --update)")
+            # The time budget in this machine's microseconds
+            budget_us = time_budget * seconds / units * 1e6 if stored else 0
+            print(f"{case.name:<36} {seconds * 1e6:>11.2f} {budget_us:>11.2f} {allocated:>11} {alloc_budget or 0:>11}  {status}")
+
+    if args.update:
+        if not compare_allocations:
+            baseline["cases"] = {}  # allocations from another Python version don't carry over
+        baseline.update({
+            "python": python,
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+        })
+        baseline["cases"].update(measured)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+    elif failures:
+        print("\nPERFORMANCE BUDGET EXCEEDED:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
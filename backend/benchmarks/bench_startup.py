@@ -0,0 +1,95 @@
+"""
+Startup-time benchmark: how long a fresh backend process takes from start to
+serving its first request.
+
+Each run starts a new interpreter and reports:
+  import   time to import backend.main
+  first    time from interpreter start to the first GET /health response
+           (import + app startup + the request itself), served in-process by
+           Starlette's TestClient
+  serve    with --uvicorn, time from spawning `uvicorn backend.main:app` until
+           GET /health answers 200 over HTTP
+
+Needs backend/config.py. No AWS calls are made unless the config turns on
+PREWARM_ACCOUNTS_ON_STARTUP.
+
+Run from the repository root:
+    python backend/benchmarks/bench_startup.py [--runs 5] [--uvicorn] [--port 8765]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHILD = r"""
+import json, time
+start = time.perf_counter()
+import backend.main as main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    status = client.get("/health").status_code
+first = time.perf_counter()
+heavy = [name for name in ("pandas", "numpy", "msgpack") if name in __import__("sys").modules]
+print(json.dumps({"import": imported - start, "first": first - start, "status": status, "heavy_modules": heavy}))
+"""
+
+
+def run_in_process():
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=REPO_ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_uvicorn(port, timeout=60):
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"no response from {url} after {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summary(values):
+    return f"min {min(values) * 1000:8.1f} ms   median {statistics.median(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes started per measurement.")
+    parser.add_argument("--uvicorn", action="store_true", help="Also time a real uvicorn server until /health answers.")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = [run_in_process() for _ in range(args.runs)]
+    assert all(r["status"] == 200 for r in results), results
+    print(f"import  {summary([r['import'] for r in results])}")
+    print(f"first   {summary([r['first'] for r in results])}")
+    print(f"heavy modules loaded at startup: {', '.join(results[-1]['heavy_modules']) or 'none'}")
+    if args.uvicorn:
+        print(f"serve   {summary([run_uvicorn(args.port) for _ in range(args.runs)])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Circuit breakers around AWS calls, one per (account, service).
+
+A breaker watches the outcomes of recent calls. Once enough of them fail it
+opens, and calls fail straight away with CircuitOpenError instead of waiting
+out botocore's timeouts and retries. After `open_seconds` it lets a few probe
+calls through (half-open): if they succeed it closes again, if one fails it
+reopens.
+
+Breakers are attached to boto3 clients through botocore's before-call /
+after-call / after-call-error events (see CircuitBreakers.instrument), so
+every call a client makes is counted once, after botocore's own retries.
+"""
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Error codes that count as the dependency failing; anything else (NoSuchKey,
+# ResourceNotFoundException, validation errors...) is a healthy answer
+FAILURE_ERROR_CODES = frozenset({
+    "ExpiredToken", "ExpiredTokenException", "InvalidClientTokenId", "UnrecognizedClientException",
+    "InvalidAccessKeyId", "SignatureDoesNotMatch", "RequestExpired",
+    "Throttling", "ThrottlingException", "ThrottledException", "TooManyRequestsException",
+    "RequestLimitExceeded", "SlowDown", "ProvisionedThroughputExceededException",
+    "ServiceUnavailable", "InternalError", "InternalFailure", "InternalServerError",
+})
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, account, service, retry_in):
+        self.account = account
+        self.service = service
+        self.retry_in = retry_in
+        super().__init__(
+            f"AWS {service} for account {account} is failing; calls are paused for another {retry_in:.0f}s (circuit open)"
+        )
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate=0.5, min_calls=10, window_seconds=60, open_seconds=30, half_open_calls=1):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.opened_at = None
+        self.last_error = None
+        self._outcomes = deque()  # (time, failed)
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def retry_in(self):
+        """Seconds until an open breaker lets probe calls through (0 unless open)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - time.time())
+
+    def is_open(self):
+        """True while calls would be refused. Doesn't take a half-open probe slot."""
+        with self._lock:
+            return self.state == OPEN and self.retry_in() > 0
+
+    def allow(self):
+        """Whether a call may go ahead now. In half-open state this takes one of the probe slots."""
+        with self._lock:
+            if self.state == OPEN:
+                if self.retry_in() > 0:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def release_probe(self):
+        """Gives back a half-open probe slot taken by a call that ended without saying anything about AWS."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record(self, failed, error=None):
+        now = time.time()
+        with self._lock:
+            if failed:
+                self.last_error = error
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self.state = CLOSED
+                        self._outcomes.clear()
+                return
+            if self.state == OPEN:
+                return  # a call that started before the breaker opened
+            self._outcomes.append((now, failed))
+            self._trim(now)
+            failures = sum(1 for _, f in self._outcomes if f)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self._outcomes.clear()
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.opened_at = None
+            self._outcomes.clear()
+
+    def stats(self):
+        with self._lock:
+            self._trim(time.time())
+            return {
+                "state": self.state,
+                "calls": len(self._outcomes),
+                "failures": sum(1 for _, f in self._outcomes if f),
+                "retry_in": round(self.retry_in(), 1),
+                "last_error": self.last_error,
+            }
+
+
+class CircuitBreakers:
+    """The breakers by (account, service), created on first use with the shared settings."""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """Changes the settings new breakers are created with."""
+        self.settings.update(settings)
+
+    def get(self, account, service):
+        key = (account, service)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(**self.settings))
+        return breaker
+
+    def check(self, account, service):
+        """Raises CircuitOpenError if the (account, service) breaker is open, without using a probe slot."""
+        breaker = self.get(account, service)
+        if breaker.is_open():
+            raise CircuitOpenError(account, service, breaker.retry_in())
+
+    def instrument(self, client, account, service):
+        """Routes every call `client` makes through the (account, service) breaker."""
+        breaker = self.get(account, service)
+
+        def before_call(**kwargs):
+            if not breaker.allow():
+                raise CircuitOpenError(account, service, breaker.retry_in())
+
+        def after_call(http_response=None, parsed=None, model=None, **kwargs):
+            code = (parsed or {}).get("Error", {}).get("Code")
+            status = getattr(http_response, "status_code", 200)
+            failed = status >= 500 or code in FAILURE_ERROR_CODES
+            breaker.record(failed, f"{model.name if model else ''}: {code or status}" if failed else None)
+
+        def after_call_error(exception=None, **kwargs):
+            if getattr(exception, "breaker_neutral", False):
+                # e.g. our own outbound rate limiting, which says nothing about AWS
+                breaker.release_probe()
+                return
+            breaker.record(True, f"{type(exception).__name__}: {exception}")
+
+        client.meta.events.register("before-call", before_call)
+        client.meta.events.register("after-call", after_call)
+        client.meta.events.register("after-call-error", after_call_error)
+
+    def stats(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return [
+            {"account": account, "service": service, **breaker.stats()}
+            for (account, service), breaker in sorted(breakers.items())
+        ]
+
+    def reset(self, account=None, service=None):
+        """Closes the matching breakers (all of them by default). Returns how many were reset."""
+        with self._lock:
+            breakers = dict(self._breakers)
+        count = 0
+        for (breaker_account, breaker_service), breaker in breakers.items():
+            if account not in (None, breaker_account) or service not in (None, breaker_service):
+                continue
+            breaker.reset()
+            count += 1
+        return count
+
+
+# One breaker per (account, service), whichever client the call went through
+CIRCUIT_BREAKERS = CircuitBreakers()
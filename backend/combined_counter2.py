@@ -1,13 +1,13 @@
-import boto3
 from datetime import datetime, timedelta
 from math import ceil
 
+from .aws_clients import AWS_CLIENTS
+
 
 
 
 def init_s3_client():
-    session = boto3.Session(profile_name="gateway")
-    return session.client("s3")
+    return AWS_CLIENTS.client("gateway", "s3")
 
 
 def count_png_files(s3_client, bucket_name, prefix):
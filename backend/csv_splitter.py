@@ -1,4 +1,3 @@
-import pandas as pd
 import zipfile
 import os
 from pathlib import Path
@@ -9,6 +8,9 @@ def split_csv_and_zip(input_file_path: Path, rows_per_chunk: int, output_dir: Pa
     Splits a CSV file into multiple chunks and zips each chunk.
     Returns the path to the final ZIP file containing all zipped chunks.
     """
+    # Imported here so the backend doesn't load pandas at startup
+    import pandas as pd
+
     base_name = input_file_path.stem
     
     # Create a temporary directory for chunks and zips
@@ -52,6 +54,8 @@ def split_csv_and_zip(input_file_path: Path, rows_per_chunk: int, output_dir: Pa
     return master_zip_filename
 
 if __name__ == "__main__":
+    import pandas as pd
+
     # Example usage (for testing purposes)
     # Create a dummy CSV file
     dummy_data = {
@@ -0,0 +1,50 @@
+"""
+Per-request time budgets. A Deadline is created when a request arrives and is
+passed down to everything the request waits on. The orchestrators stop waiting
+when it runs out, the day walks stop listing, and AWS clients built for it get
+connect/read timeouts and a retry budget that fit in the time left.
+"""
+import math
+import time
+
+# Read timeouts (seconds) AWS clients are built with under a deadline. Clients are
+# cached per tier, so only a handful of extra clients exist per (profile, service).
+TIMEOUT_TIERS = (1, 2, 3, 5, 10, 20, 30, 60)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raises DeadlineExceeded once the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s exceeded")
+
+    def client_limits(self, max_attempts=3, max_connect_timeout=5):
+        """
+        Returns (connect_timeout, read_timeout, total_max_attempts) for an AWS client
+        used with the time left: the largest timeout tier that leaves room for
+        `max_attempts` attempts, and as many attempts as fit at that timeout.
+        """
+        remaining = self.remaining()
+        read_timeout = TIMEOUT_TIERS[0]
+        for tier in TIMEOUT_TIERS:
+            if tier * max_attempts <= remaining:
+                read_timeout = tier
+        attempts = max(1, min(max_attempts, math.floor(remaining / read_timeout)))
+        return min(read_timeout, max_connect_timeout), read_timeout, attempts
+
+    def skipped_message(self, sections):
+        return f"Request deadline of {self.seconds:g}s exceeded; skipped: {', '.join(sections)}"
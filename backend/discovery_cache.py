@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class DiscoveryCache:
+    """
+    Per-account cache for AWS resources that are looked up by listing and
+    scanning, like the iotbackup bucket name, the Customer Cognito user pool
+    and the IoT data endpoint. These effectively never change, so each is
+    fetched once per account and kept for `ttl_seconds`.
+
+    Values (including None for "not found") are cached; exceptions raised by
+    a loader are not, so a transient AWS error is retried on the next call.
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}  # (account_id, resource) -> (value, fetched_at)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, account_id, resource, loader):
+        """Returns the cached value for (account_id, resource), calling `loader()` if it's missing or expired."""
+        key = (account_id, resource)
+        entry = self._entries.get(key)
+        if entry and time.time() - entry[1] < self.ttl_seconds:
+            return entry[0]
+
+        # One loader per key at a time, so concurrent lookups for the same account share a single discovery call
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[1] < self.ttl_seconds:
+                return entry[0]
+            value = loader()
+            self._entries[key] = (value, time.time())
+            return value
+
+    def invalidate(self, account_id=None):
+        """Drops every cached resource for one account, or for all accounts. Returns the number of entries dropped."""
+        with self._lock:
+            keys = [key for key in self._entries if account_id is None or key[0] == account_id]
+            for key in keys:
+                self._entries.pop(key, None)
+        return len(keys)
+
+    def snapshot(self):
+        """Returns the cached entries as {account_id: {resource: {"value", "age_seconds"}}}."""
+        now = time.time()
+        accounts = {}
+        for (account_id, resource), (value, fetched_at) in list(self._entries.items()):
+            accounts.setdefault(account_id, {})[resource] = {
+                "value": value,
+                "age_seconds": round(now - fetched_at, 1),
+            }
+        return accounts
@@ -1,8 +1,9 @@
 
-import boto3
 from boto3.dynamodb.conditions import Key
 from datetime import datetime, timedelta
 
+from .aws_clients import AWS_CLIENTS
+
 def query_dynamodb():
     """
     Queries the 'Refurb-Table' for entries in the last 2 weeks and provides a breakdown
@@ -11,8 +12,7 @@ def query_dynamodb():
     table_name = 'Refurb-Table'
     try:
         # Use the 'dev' profile for AWS credentials
-        session = boto3.Session(profile_name='dev')
-        dynamodb = session.resource('dynamodb')
+        dynamodb = AWS_CLIENTS.resource('dev', 'dynamodb')
         table = dynamodb.Table(table_name)
 
         # Calculate the date 2 weeks ago
@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .profiling import run_profiled
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    A ThreadPoolExecutor that runs each task in a copy of the submitter's
+    contextvars context (like asyncio.to_thread does), so the request's trace
+    and, with ?profile=1, its profiler follow its work onto the pool.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, run_profiled, fn, *args, **kwargs)
+
+
+class EndpointPool:
+    """
+    A named, fixed-size thread pool that async endpoints hand their blocking
+    (boto3) work to, so slow AWS calls queue here instead of on Starlette's
+    shared threadpool, which then stays free for the cheap endpoints.
+
+    Keeps counts of queued, running and completed calls for /api/admin/pools.
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ContextThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"endpoint-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+
+    async def run(self, func, *args, **kwargs):
+        """Runs `func(*args, **kwargs)` on the pool and awaits its result (or exception)."""
+        started = [False]
+
+        def call():
+            with self._lock:
+                if not started[0]:
+                    started[0] = True
+                    self._queued -= 1
+                self._active += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        with self._lock:
+            self._queued += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(call))
+        except asyncio.CancelledError:
+            # Client went away while the call was still queued; it may never start
+            with self._lock:
+                if not started[0]:
+                    started[0] = True
+                    self._queued -= 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "completed": self._completed,
+            }
+
+
+def executor_stats(executor):
+    """
+    Size and queue depth of a plain ThreadPoolExecutor. It has no public
+    stats API, so this reads its private worker set and work queue.
+    """
+    return {
+        "max_workers": executor._max_workers,
+        "threads": len(executor._threads),
+        "queued": executor._work_queue.qsize(),
+    }
+
+
+# Pools by name, filled in by configure_pools() once config is loaded
+POOLS = {}
+
+
+def configure_pools(sizes):
+    """Creates one EndpointPool per {name: max_workers} entry."""
+    for name, max_workers in sizes.items():
+        POOLS[name] = EndpointPool(name, max_workers)
+
+
+def in_pool(name):
+    """
+    Turns a sync endpoint into an async one whose body runs on the named pool.
+    The signature is kept (functools.wraps), so FastAPI still sees the same parameters.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        async def endpoint(*args, **kwargs):
+            return await POOLS[name].run(func, *args, **kwargs)
+        return endpoint
+    return decorate
@@ -0,0 +1,200 @@
+"""
+Decoding of the MessagePack heartbeat and registration objects devices push
+to the iotbackup bucket. Shared by the backend and the GOD-Tool Slack daemon
+(python_scripts/v2), which imports this module directly from the backend
+directory, so keep it free of relative imports and backend config.
+
+Each payload is unpacked exactly once. A heartbeat's first element is its
+format version, or for the older unversioned layout its timestamp; the
+matching decoder is looked up in HEARTBEAT_DECODERS.
+"""
+from datetime import datetime
+
+import msgpack
+
+UNVERSIONED = "unversioned"
+
+# A leading value above this is a Unix timestamp (unversioned layout), not a version
+MAX_HEARTBEAT_VERSION = 1000
+
+
+def format_coordinate(coord):
+    """Format coordinate to 6 decimal places"""
+    if coord == 'N/A' or coord is None:
+        return 'N/A'
+    try:
+        return f"{float(coord):.6f}"
+    except (ValueError, TypeError):
+        return 'N/A'
+
+
+class HeartbeatRecord:
+    """One decoded heartbeat. Fields a layout doesn't carry are None."""
+
+    __slots__ = (
+        "timestamp", "battery_percentage", "battery_voltage", "ax", "ay", "az",
+        "hdop", "lng", "lat", "firmware_version", "gps_connected", "layout",
+    )
+
+    def __init__(self, timestamp, battery_percentage=None, battery_voltage=None, ax=None, ay=None, az=None,
+                 hdop=None, lng=None, lat=None, firmware_version=None, gps_connected=None, layout=None):
+        self.timestamp = timestamp
+        self.battery_percentage = battery_percentage
+        self.battery_voltage = battery_voltage
+        self.ax = ax
+        self.ay = ay
+        self.az = az
+        self.hdop = hdop
+        self.lng = lng
+        self.lat = lat
+        self.firmware_version = firmware_version
+        self.gps_connected = gps_connected
+        self.layout = layout
+
+    def to_info(self):
+        """The heartbeat summary shown by device lookups (last seen, battery, GPS, firmware)."""
+        return {
+            'last_seen': datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+            'battery_percentage': 'N/A' if self.battery_percentage is None else self.battery_percentage,
+            'battery_voltage': 'N/A' if self.battery_voltage is None else self.battery_voltage,
+            'gps_connected': bool(self.gps_connected),
+            'lat': format_coordinate(self.lat),
+            'lng': format_coordinate(self.lng),
+            'firmware_version': 'N/A' if self.firmware_version is None else self.firmware_version,
+        }
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"HeartbeatRecord({fields})"
+
+
+class RegistrationRecord:
+    """One decoded registration: its timestamp plus either named `fields` (dict layout) or the `raw` list."""
+
+    __slots__ = ("timestamp", "fields", "raw")
+
+    def __init__(self, timestamp, fields=None, raw=None):
+        self.timestamp = timestamp
+        self.fields = fields
+        self.raw = raw
+
+    def to_info(self):
+        """The registration summary shown by device lookups: last_seen plus the fields, or `raw` for the list layout."""
+        info = {'last_seen': datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')}
+        if self.fields is not None:
+            info.update(self.fields)
+        else:
+            info['raw'] = self.raw
+        return info
+
+    def __repr__(self):
+        return f"RegistrationRecord(timestamp={self.timestamp!r}, fields={self.fields!r}, raw={self.raw!r})"
+
+
+# Heartbeat format version (or UNVERSIONED) -> decoder taking the unpacked payload
+HEARTBEAT_DECODERS = {}
+
+
+def heartbeat_decoder(version):
+    """Registers the decoder for a heartbeat format version."""
+    def register(decoder):
+        HEARTBEAT_DECODERS[version] = decoder
+        return decoder
+    return register
+
+
+def unpack(data):
+    """Unpacks MessagePack bytes, or returns None if they aren't valid MessagePack."""
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except Exception:
+        return None
+
+
+def heartbeat_version(unpacked):
+    """Returns the format version of an unpacked heartbeat, UNVERSIONED for the timestamp-first layout, or None."""
+    if not isinstance(unpacked, (list, tuple)) or not unpacked:
+        return None
+    version = unpacked[0]
+    if type(version) is not int:
+        try:
+            version = int(str(version))
+        except ValueError:
+            return None
+    return UNVERSIONED if version > MAX_HEARTBEAT_VERSION else version
+
+
+def decode_heartbeat(data):
+    """Decodes heartbeat bytes into a HeartbeatRecord, or None if the payload is unreadable or has an unknown version."""
+    unpacked = unpack(data)
+    if unpacked is None:
+        return None
+    decoder = HEARTBEAT_DECODERS.get(heartbeat_version(unpacked))
+    if decoder is None:
+        return None
+    try:
+        return decoder(unpacked)
+    except (TypeError, ValueError, KeyError, IndexError):
+        return None
+
+
+@heartbeat_decoder(1)
+def decode_heartbeat_v1(unpacked):
+    """
+    Version 1: [1, {field: value, ...}] or the positional
+    [1, timestamp, battery_percentage, battery_voltage, ax, ay, az, hdop, lng, lat, firmware_version, gps_connected].
+    """
+    if len(unpacked) > 1 and isinstance(unpacked[1], dict):
+        fields = unpacked[1]
+        if 'timestamp' not in fields:
+            return None
+        return HeartbeatRecord(
+            fields['timestamp'],
+            battery_percentage=fields.get('battery_percentage'),
+            battery_voltage=fields.get('battery_voltage'),
+            ax=fields.get('ax'),
+            ay=fields.get('ay'),
+            az=fields.get('az'),
+            hdop=fields.get('hdop'),
+            lng=fields.get('lng'),
+            lat=fields.get('lat'),
+            firmware_version=fields.get('firmware_version'),
+            gps_connected=fields.get('gps_connected', False),
+            layout="v1-dict",
+        )
+    if len(unpacked) >= 12:
+        return HeartbeatRecord(*unpacked[1:11], bool(unpacked[11]), "v1-list")
+    return None
+
+
+@heartbeat_decoder(UNVERSIONED)
+def decode_heartbeat_unversioned(unpacked):
+    """
+    Unversioned: [timestamp, battery_percentage, battery_voltage, ax, ay, az, hdop, lng, lat,
+    firmware_version, gps_connected].
+    """
+    if len(unpacked) < 11:
+        return None
+    return HeartbeatRecord(*unpacked[:10], bool(unpacked[10]), "unversioned-list")
+
+
+def decode_registration(data):
+    """
+    Decodes registration bytes into a RegistrationRecord, or None if there's no timestamp.
+    The payload is a dict, a list holding a dict first or second, or a positional list
+    starting with the timestamp.
+    """
+    unpacked = unpack(data)
+    if not unpacked:
+        return None
+    reg = unpacked
+    if isinstance(unpacked, list):
+        if isinstance(unpacked[0], dict):
+            reg = unpacked[0]
+        elif len(unpacked) > 1 and isinstance(unpacked[1], dict):
+            reg = unpacked[1]
+    if isinstance(reg, dict) and 'timestamp' in reg:
+        return RegistrationRecord(reg['timestamp'], fields={k: v for k, v in reg.items() if k != 'timestamp'})
+    if isinstance(reg, list) and isinstance(reg[0], (int, float)):
+        return RegistrationRecord(reg[0], raw=reg)
+    return None
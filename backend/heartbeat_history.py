@@ -0,0 +1,143 @@
+"""
+Columnar decoding and summarising of a device's heartbeat history, for
+GET /api/device/{iccid}/heartbeats. Heartbeats are turned into one NumPy
+array per field so battery conversion, downsampling and stats run
+vectorized instead of once per heartbeat.
+"""
+import numpy as np
+
+# Numeric columns, in response order; `firmware` is kept as strings alongside them
+NUMERIC_COLUMNS = ("timestamp", "battery_percentage", "battery_voltage", "lat", "lng", "hdop", "ax", "ay", "az")
+HEARTBEAT_COLUMNS = NUMERIC_COLUMNS + ("firmware",)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def heartbeat_row(hb):
+    """
+    Returns a HeartbeatRecord (see heartbeat_codec) as a tuple in HEARTBEAT_COLUMNS order.
+    Missing or non-numeric fields become NaN.
+    """
+    firmware = hb.firmware_version
+    return (
+        _number(hb.timestamp), _number(hb.battery_percentage), _number(hb.battery_voltage),
+        _number(hb.lat), _number(hb.lng), _number(hb.hdop), _number(hb.ax), _number(hb.ay), _number(hb.az),
+        "" if firmware is None else str(firmware),
+    )
+
+
+def heartbeat_columns(heartbeats):
+    """
+    Turns HeartbeatRecords into {column: ndarray}, sorted by timestamp with duplicate
+    timestamps dropped. Numeric columns are float64 (NaN where missing), except
+    `timestamp` which is int64; `firmware` is an array of strings.
+    """
+    rows = [row for row in map(heartbeat_row, heartbeats) if not np.isnan(row[0])]
+    if not rows:
+        columns = {column: np.empty(0) for column in NUMERIC_COLUMNS}
+        columns["timestamp"] = np.empty(0, dtype=np.int64)
+        columns["firmware"] = np.empty(0, dtype=object)
+        return columns
+    numeric = np.array([row[:-1] for row in rows], dtype=np.float64)
+    firmware = np.array([row[-1] for row in rows], dtype=object)
+    timestamps, first = np.unique(numeric[:, 0].astype(np.int64), return_index=True)
+    columns = {"timestamp": timestamps}
+    for i, column in enumerate(NUMERIC_COLUMNS[1:], start=1):
+        columns[column] = numeric[first, i]
+    columns["firmware"] = firmware[first]
+    return columns
+
+
+def portal_battery_array(reported, weightings):
+    """
+    Vectorized portal_battery: maps reported percentages to portal percentages by
+    interpolating the (reported, desired) `weightings`, clamped at both ends and
+    rounded. NaN stays NaN.
+    """
+    reported = np.trunc(np.asarray(reported, dtype=np.float64))
+    xs = np.array([w[0] for w in weightings], dtype=np.float64)
+    ys = np.array([w[1] for w in weightings], dtype=np.float64)
+    portal = np.round(np.interp(reported, xs, ys))
+    portal[np.isnan(reported)] = np.nan
+    return portal
+
+
+def downsample_columns(columns, max_points):
+    """
+    Reduces the columns to at most `max_points` rows by splitting the time span into
+    equal buckets. Numeric columns become the bucket mean (ignoring NaN), the
+    timestamp the bucket's last heartbeat and firmware the bucket's last value.
+    """
+    timestamps = columns["timestamp"]
+    if max_points is None or len(timestamps) <= max_points:
+        return columns
+    span = int(timestamps[-1] - timestamps[0]) + 1
+    buckets = ((timestamps - timestamps[0]) * max_points // span).astype(np.int64)
+    # Rows are sorted by time, so each bucket is a contiguous run; keep the non-empty ones
+    last = np.flatnonzero(np.r_[buckets[1:] != buckets[:-1], True])
+    index = np.searchsorted(np.unique(buckets), buckets)
+    result = {"timestamp": timestamps[last], "firmware": columns["firmware"][last]}
+    for column, values in columns.items():
+        if column in result:
+            continue
+        present = ~np.isnan(values)
+        sums = np.bincount(index, weights=np.where(present, values, 0.0))
+        counts = np.bincount(index, weights=present)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[column] = sums / counts
+    return {column: result[column] for column in columns}
+
+
+def summarize_columns(columns):
+    """Returns count, time range, and min/max/mean/last for the battery columns, as plain Python values."""
+    timestamps = columns["timestamp"]
+    summary = {
+        "count": int(len(timestamps)),
+        "first_timestamp": int(timestamps[0]) if len(timestamps) else None,
+        "last_timestamp": int(timestamps[-1]) if len(timestamps) else None,
+    }
+    for column in ("battery_percentage", "portal_battery", "battery_voltage"):
+        values = columns.get(column)
+        if values is None:
+            continue
+        present = values[~np.isnan(values)]
+        summary[column] = {
+            "min": _json_number(present.min()) if len(present) else None,
+            "max": _json_number(present.max()) if len(present) else None,
+            "mean": _json_number(round(float(present.mean()), 2)) if len(present) else None,
+            "last": _json_number(present[-1]) if len(present) else None,
+        }
+    summary["gps_fix_ratio"] = (
+        round(float(np.mean(~np.isnan(columns["lat"]) & ~np.isnan(columns["lng"]))), 3) if len(timestamps) else None
+    )
+    return summary
+
+
+def _json_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def columns_to_json(columns, decimals=None):
+    """
+    Returns {column: list} ready for json.dumps: NaN becomes None, whole numbers
+    become ints and `decimals` ({column: places}) rounds the given columns.
+    """
+    decimals = decimals or {}
+    result = {}
+    for column, values in columns.items():
+        if values.dtype == object:
+            result[column] = values.tolist()
+            continue
+        if column in decimals:
+            values = np.round(values, decimals[column])
+        if values.dtype.kind in "iu":
+            result[column] = values.tolist()
+            continue
+        result[column] = [None if v != v else (int(v) if v.is_integer() else v) for v in values.tolist()]
+    return result
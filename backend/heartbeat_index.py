@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import time
+
+
+class LatestKeyIndex:
+    """
+    Persistent record of the newest known S3 object per device, so lookups
+    don't have to rediscover it by walking day prefixes.
+
+    One row per (iccid, account_id, kind), where kind is the message type
+    ('heartbeat', 'registration'). A row either holds the newest object key
+    and the date of the day prefix it was found under, or is a negative
+    result: nothing was found in `searched_days` days as of `checked_at`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS latest_keys (
+                    iccid TEXT NOT NULL,
+                    account_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    object_key TEXT,
+                    object_date TEXT,
+                    searched_days INTEGER,
+                    checked_at REAL NOT NULL,
+                    PRIMARY KEY (iccid, account_id, kind)
+                )"""
+            )
+
+    def get(self, iccid, account_id, kind):
+        """Returns the row for a device as a dict, or None if it has never been indexed."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM latest_keys WHERE iccid = ? AND account_id = ? AND kind = ?",
+                (iccid, account_id or "", kind),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record_hit(self, iccid, account_id, kind, object_key, object_date):
+        """Stores the newest object found for a device and the YYYY-MM-DD day it was under."""
+        self._upsert(iccid, account_id, kind, object_key, object_date, None)
+
+    def record_miss(self, iccid, account_id, kind, searched_days):
+        """Stores that nothing was found for a device in the last `searched_days` days."""
+        self._upsert(iccid, account_id, kind, None, None, searched_days)
+
+    def _upsert(self, iccid, account_id, kind, object_key, object_date, searched_days):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO latest_keys VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (iccid, account_id or "", kind, object_key, object_date, searched_days, time.time()),
+            )
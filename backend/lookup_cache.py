@@ -0,0 +1,105 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class SectionCache:
+    """
+    In-memory cache of lookup results split into independently expiring sections,
+    e.g. a device lookup's general/registration/heartbeat/iot parts.
+
+    Each section has its own TTL. Once a section is older than its TTL it is
+    "stale": it can still be served while a refresh runs in the background.
+    Once it is older than TTL + `max_stale_seconds`, or has been invalidated,
+    it is "missing" and has to be fetched before it can be served.
+
+    Holds at most `max_entries` keys, dropping the least recently used.
+
+    Invalidating a key also bumps its generation. A fetch takes the generation
+    before it starts and passes it to put(), which drops the values if the key
+    was invalidated meanwhile, so a refresh already in flight can't store what
+    it read before the change that caused the invalidation.
+    """
+
+    def __init__(self, section_ttls, max_stale_seconds, max_entries=5000):
+        self.section_ttls = dict(section_ttls)
+        self.max_stale_seconds = max_stale_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> {section: (value, errors, fetched_at)}
+        self._refreshing = set()
+        self._generations = OrderedDict()  # key -> generation of its last invalidation
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns (sections, missing, stale): the cached {section: (value, errors)} that
+        can be served, the sections that must be fetched first, and the servable
+        sections that should be refreshed.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key, {})
+            if entry:
+                self._entries.move_to_end(key)
+            sections, missing, stale = {}, [], []
+            for section, ttl in self.section_ttls.items():
+                cached = entry.get(section)
+                age = now - cached[2] if cached else None
+                if cached is None or age > ttl + self.max_stale_seconds:
+                    missing.append(section)
+                    continue
+                sections[section] = (cached[0], cached[1])
+                if age > ttl:
+                    stale.append(section)
+        return sections, missing, stale
+
+    def generation(self, key):
+        """The key's current generation, to pass to put() with the values fetched from now on."""
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def put(self, key, values, errors, generation=None):
+        """
+        Stores freshly fetched sections: `values` is {section: value}, `errors` is {section: [errors]}.
+        Nothing is stored if `generation` is given and the key has been invalidated since.
+        """
+        now = time.time()
+        with self._lock:
+            if generation is not None and self._generations.get(key, 0) != generation:
+                return
+            entry = self._entries.setdefault(key, {})
+            for section, value in values.items():
+                entry[section] = (value, list(errors.get(section, [])), now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key, sections=None):
+        """Forgets some (or all) sections of a key, so the next get() reports them as missing."""
+        with self._lock:
+            self._generations[key] = next(self._counter)
+            self._generations.move_to_end(key)
+            while len(self._generations) > self.max_entries:
+                self._generations.popitem(last=False)
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if sections is None:
+                del self._entries[key]
+            else:
+                for section in sections:
+                    entry.pop(section, None)
+
+    def begin_refresh(self, key):
+        """Claims the background refresh for a key. Returns False if one is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
@@ -1,8 +1,8 @@
-from fastapi import FastAPI, HTTPException, Query, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Header, Depends, UploadFile, File, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 import configparser
-from typing import List, Set, Dict, Any
+from typing import List, Set, Dict, Any, Optional
 from pydantic import BaseModel
 import boto3
 import time
@@ -13,10 +13,13 @@ from botocore.exceptions import ClientError
 import base64
 import tempfile
 import shutil
+import threading
+import asyncio
+import anyio
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 
 # New imports for godtool functions
 import json
-import msgpack
 import sys
 import signal
 import csv
@@ -25,12 +28,40 @@ import subprocess
 from .dynamo_query import query_dynamodb
 from .combined_counter2 import generate_report
 from .csv_splitter import split_csv_and_zip
-from fastapi.responses import StreamingResponse
+from .heartbeat_index import LatestKeyIndex
+from .discovery_cache import DiscoveryCache
+from .s3_scan import DeviceHistoryScanner, device_day_prefix, keys_under_prefix
+from .lookup_cache import SectionCache
+from .endpoint_pools import POOLS, ContextThreadPoolExecutor, configure_pools, in_pool, executor_stats
+from .single_flight import SINGLE_FLIGHT, coalesced
+from .report_scheduler import ReportScheduler
+from .aws_clients import AWS_CLIENTS
+from .deadlines import Deadline, DeadlineExceeded
+from .circuit_breakers import CIRCUIT_BREAKERS, CircuitOpenError
+from .rate_limits import RATE_LIMITS, OutboundRateLimited
+from .metrics import MetricsMiddleware, instrument_aws_client, latest as latest_metrics
+from .tracing import TRACES, TracingMiddleware, trace_aws_client, traced
+from .app_logging import configure_logging, log, logging_stats, payload_log
+from .profiling import ProfilerBusy, collapsed, memory_diff, request_profile, sample_cpu, speedscope
+from fastapi.responses import StreamingResponse, Response, JSONResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 import io
 import tempfile
 from pathlib import Path
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    if getattr(config, "PREWARM_ACCOUNTS_ON_STARTUP", False):
+        start_prewarm()
+    if getattr(config, "REPORT_SCHEDULER_ENABLED", True):
+        REPORTS.start()
+    yield
+    REPORTS.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow requests from the frontend
 app.add_middleware(
@@ -41,29 +72,38 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Latency and in-flight requests per route, served by /metrics
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+
 @app.get("/api/tools/modem-failed-count")
-def get_modem_failed_count():
+@coalesced(lambda refresh: (refresh,))
+@in_pool("reports")
+def get_modem_failed_count(refresh: bool = Query(False, description="Recompute the stats instead of returning the stored ones.")):
     try:
-        stats = query_dynamodb()
-        return stats
+        stats, generated_at = REPORTS.get("modem_failed_count", refresh=refresh)
+        return {**stats, "generated_at": generated_at}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
 @app.get("/api/labels/today")
-def get_labels_today():
+@coalesced(lambda refresh: (refresh,))
+@in_pool("reports")
+def get_labels_today(refresh: bool = Query(False, description="Recompute the report instead of returning the stored one.")):
     try:
-        report = generate_report(date_offset='today')
-        return {"output": report}
+        report, generated_at = REPORTS.get("labels_today", refresh=refresh)
+        return {"output": report, "generated_at": generated_at}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
 @app.get("/api/labels/tomorrow")
-def get_labels_tomorrow():
+@coalesced(lambda refresh: (refresh,))
+@in_pool("reports")
+def get_labels_tomorrow(refresh: bool = Query(False, description="Recompute the report instead of returning the stored one.")):
     try:
-        report = generate_report(date_offset='tomorrow')
-        return {"output": report}
+        report, generated_at = REPORTS.get("labels_tomorrow", refresh=refresh)
+        return {"output": report, "generated_at": generated_at}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
@@ -75,49 +115,199 @@ except ImportError:
     print("FATAL: Could not import config.py. Please create this file from config.py.example.")
     sys.exit(1)
 
-# AWS Sessions
-dev_session = boto3.Session(profile_name=config.AWS_PROFILES['dev'])
-gateway_session = boto3.Session(profile_name=config.AWS_PROFILES['gateway'])
+# Leveled logging, written by a background thread; raw AWS responses and decoded
+# payloads are only logged at DEBUG, and then only a sampled fraction of them
+configure_logging(
+    level=getattr(config, "LOG_LEVEL", "INFO"),
+    payload_sample_rate=getattr(config, "LOG_PAYLOAD_SAMPLE_RATE", 0.01),
+    json_format=getattr(config, "LOG_JSON", False),
+)
 
-dev_dynamodb = dev_session.resource("dynamodb")
-gateway_dynamodb = gateway_session.resource("dynamodb")
+# AWS sessions and clients: one session per profile, clients cached and shared across requests
+AWS_CLIENTS.configure(
+    max_pool_connections=getattr(config, "AWS_MAX_POOL_CONNECTIONS", 50),
+    service_pool_connections=getattr(config, "AWS_SERVICE_POOL_CONNECTIONS", {}),
+)
 
-# DynamoDB Tables
-refurb_table = dev_dynamodb.Table(config.DYNAMODB_TABLES['refurb'])
-device_reg_table = gateway_dynamodb.Table(config.DYNAMODB_TABLES['device_registration'])
-pat_labels_table = gateway_dynamodb.Table(config.DYNAMODB_TABLES['pat_labels'])
+# Every AWS client goes through a circuit breaker per (account, service). Clients
+# of a profile mapped to a single account are counted under that account's ID,
+# anything else (dev, gateway...) under the profile name.
+CIRCUIT_BREAKERS.configure(**getattr(config, "CIRCUIT_BREAKER", {}))
 
-# S3 Setup
-s3_client = gateway_session.client("s3")
-dev_s3_client = dev_session.client("s3")
+def breaker_account(profile):
+    accounts = [account_id for account_id, p in config.ACCOUNT_TO_PROFILE_MAPPING.items() if p == profile]
+    return accounts[0] if len(accounts) == 1 else str(profile)
 
-# Load account mapping
-ACCOUNT_MAPPING = {} # Initialize
-try:
-    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "accounts.json"), "r") as file:
-        accounts_data = json.load(file)
-        ACCOUNT_MAPPING = {account["aws_account_id"]: account for account in accounts_data}
-except FileNotFoundError:
-    print("Warning: accounts.json file not found in backend directory.")
-except Exception as e:
-    print(f"Error loading accounts.json: {e}")
+AWS_CLIENTS.add_client_hook(lambda client, profile, service: CIRCUIT_BREAKERS.instrument(client, breaker_account(profile), service))
 
-# --- End Configuration Loading ---
+# ...and takes a token from an adaptive per-(account, service, operation) rate limit
+RATE_LIMITS.configure(
+    max_rates=getattr(config, "OUTBOUND_RATE_LIMITS", {}), **getattr(config, "OUTBOUND_RATE_LIMIT_SETTINGS", {})
+)
+AWS_CLIENTS.add_client_hook(lambda client, profile, service: RATE_LIMITS.instrument(client, breaker_account(profile), service))
 
-# --- GOD-Tool Helper Functions (adapted from godtool_with_cognito_release.py) ---
+# ...and is counted and timed per (service, operation, account) for /metrics
+AWS_CLIENTS.add_client_hook(lambda client, profile, service: instrument_aws_client(client, breaker_account(profile), service))
 
-# Note: debug_print and print_info are adapted to use standard print for FastAPI context
-def debug_print(message):
-    """Print debug messages only if debug mode is enabled (always off in FastAPI unless explicitly set)"""
-    # For FastAPI, we'll assume debug mode is off unless a global flag is set
-    # For now, just print if you want to see debug messages in FastAPI logs
-    # if DEBUG_MODE: # DEBUG_MODE is not defined globally in this context
-    print(f"[DEBUG] {message}")
+# ...and, inside a request, is a span of that request's trace
+AWS_CLIENTS.add_client_hook(lambda client, profile, service: trace_aws_client(client, breaker_account(profile), service))
 
-def print_info(message):
-    """Print info messages with timestamp"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] {message}")
+# A span tree per request (phases and AWS calls), summarized in a Server-Timing
+# header; the last TRACE_BUFFER_SIZE traces are kept for /api/admin/traces
+TRACES.resize(getattr(config, "TRACE_BUFFER_SIZE", 200))
+app.add_middleware(
+    TracingMiddleware,
+    max_spans=getattr(config, "TRACE_MAX_SPANS", 2000),
+    skip_paths=("/metrics", "/health", "/api/admin/traces"),
+)
+
+def open_breaker_error(account_id, service):
+    """The error to report if the account's `service` breaker is open, else None."""
+    try:
+        CIRCUIT_BREAKERS.check(account_id, service)
+        return None
+    except CircuitOpenError as e:
+        return str(e)
+
+# The dev/gateway tables and clients are created on first use, not at import,
+# so the server can start answering before boto3 has built anything.
+def gateway_dynamodb():
+    return AWS_CLIENTS.resource(config.AWS_PROFILES['gateway'], "dynamodb")
+
+def refurb_table(limits=None):
+    return AWS_CLIENTS.table(config.AWS_PROFILES['dev'], config.DYNAMODB_TABLES['refurb'], limits=limits)
+
+def device_reg_table(limits=None):
+    return AWS_CLIENTS.table(config.AWS_PROFILES['gateway'], config.DYNAMODB_TABLES['device_registration'], limits=limits)
+
+def pat_labels_table(limits=None):
+    return AWS_CLIENTS.table(config.AWS_PROFILES['gateway'], config.DYNAMODB_TABLES['pat_labels'], limits=limits)
+
+def dev_s3_client():
+    return AWS_CLIENTS.client(config.AWS_PROFILES['dev'], "s3")
+
+# Account mapping from accounts.json, loaded on first use
+_account_mapping = None
+_account_mapping_lock = threading.Lock()
+
+def account_mapping():
+    """Returns {aws_account_id: account} from accounts.json ({} if it can't be read), loading it once."""
+    global _account_mapping
+    with _account_mapping_lock:
+        if _account_mapping is None:
+            _account_mapping = {}
+            try:
+                with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "accounts.json"), "r") as file:
+                    accounts_data = json.load(file)
+                    _account_mapping = {account["aws_account_id"]: account for account in accounts_data}
+            except FileNotFoundError:
+                log.warning("accounts.json file not found in backend directory.")
+            except Exception as e:
+                log.error("Error loading accounts.json: %s", e)
+        return _account_mapping
+
+# Request deadlines: device, person and log lookups get a time budget, from the
+# `deadline` query parameter or X-Request-Deadline header (seconds), else the default
+REQUEST_DEADLINE_SECONDS = getattr(config, "REQUEST_DEADLINE_SECONDS", 25)
+REQUEST_DEADLINE_MAX_SECONDS = getattr(config, "REQUEST_DEADLINE_MAX_SECONDS", 120)
+
+async def request_deadline(
+    deadline: Optional[float] = Query(None, gt=0, description="Time budget for this request in seconds. Sections not finished in time are skipped and listed in `errors`."),
+    x_request_deadline: Optional[float] = Header(None, gt=0),
+) -> Deadline:
+    seconds = deadline or x_request_deadline or REQUEST_DEADLINE_SECONDS
+    return Deadline(min(seconds, REQUEST_DEADLINE_MAX_SECONDS))
+
+def deadline_limits(deadline):
+    """AWS client limits (timeouts, attempts) for the time left on `deadline`, or None for botocore's defaults."""
+    if deadline is None:
+        return None
+    return deadline.client_limits(max_attempts=getattr(config, "AWS_DEADLINE_MAX_ATTEMPTS", 3))
+
+# Reports precomputed in the background (see REPORT_SCHEDULE in config.py.example).
+# The label reports are stored per calendar day, so "today" never serves yesterday's counts.
+REPORT_SCHEDULE = {
+    "labels_today": 300,
+    "labels_tomorrow": 900,
+    "modem_failed_count": 600,
+    **getattr(config, "REPORT_SCHEDULE", {}),
+}
+REPORTS = ReportScheduler()
+REPORTS.add_job(
+    "labels_today", lambda: generate_report(date_offset='today'), REPORT_SCHEDULE["labels_today"],
+    version=lambda: datetime.now().strftime("%Y-%m-%d"),
+)
+REPORTS.add_job(
+    "labels_tomorrow", lambda: generate_report(date_offset='tomorrow'), REPORT_SCHEDULE["labels_tomorrow"],
+    version=lambda: datetime.now().strftime("%Y-%m-%d"),
+)
+# query_dynamodb reports failures as {"error": ...}; those are returned but never stored
+REPORTS.add_job(
+    "modem_failed_count", query_dynamodb, REPORT_SCHEDULE["modem_failed_count"],
+    keep=lambda stats: "error" not in stats,
+)
+
+# Worker pool for the independent AWS calls made by a single device lookup.
+# Only leaf calls are submitted here; the code that waits on them runs in the
+# request thread, so a saturated pool can never deadlock on itself.
+lookup_executor = ContextThreadPoolExecutor(
+    max_workers=getattr(config, "LOOKUP_MAX_WORKERS", 16),
+    thread_name_prefix="device-lookup",
+)
+
+# Devices processed concurrently by /api/device_lookup/batch. Each of them still
+# fans its own AWS calls out onto lookup_executor.
+batch_executor = ContextThreadPoolExecutor(
+    max_workers=getattr(config, "DEVICE_BATCH_WORKERS", 8),
+    thread_name_prefix="device-batch",
+)
+
+# Device lookup responses per ICCID, each section expiring on its own TTL.
+# Stale sections are served immediately and refreshed on cache_refresh_executor.
+device_lookup_cache = SectionCache(
+    section_ttls=getattr(config, "DEVICE_CACHE_TTL_SECONDS", {"general": 3600, "registration": 3600, "heartbeat": 60, "iot": 30}),
+    max_stale_seconds=getattr(config, "DEVICE_CACHE_MAX_STALE_SECONDS", 900),
+    max_entries=getattr(config, "DEVICE_CACHE_MAX_ENTRIES", 5000),
+)
+cache_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+
+# Separate pool for S3 day-prefix listings. Heartbeat walks run inside
+# lookup_executor workers, so their probes must not queue on that same pool.
+day_probe_executor = ContextThreadPoolExecutor(
+    max_workers=getattr(config, "HEARTBEAT_PROBE_WORKERS", 16),
+    thread_name_prefix="day-probe",
+)
+
+# Object downloads for /api/device/{iccid}/heartbeats. A month of heartbeats is
+# thousands of small GETs, so they get their own pool rather than lookup_executor.
+heartbeat_fetch_executor = ContextThreadPoolExecutor(
+    max_workers=getattr(config, "HEARTBEAT_HISTORY_FETCH_WORKERS", 16),
+    thread_name_prefix="heartbeat-fetch",
+)
+
+# Thread pools the slow AWS-bound endpoints run on (see endpoint_pools.py), each
+# sized separately so a burst of log searches can't hold up device lookups, and
+# none of them can use up Starlette's default threadpool that the cheap endpoints share.
+ENDPOINT_POOL_WORKERS = {"device": 16, "logs": 4, "reports": 4, "accounts": 4, "s3": 8, "files": 2}
+configure_pools({**ENDPOINT_POOL_WORKERS, **getattr(config, "ENDPOINT_POOL_WORKERS", {})})
+
+# Per-account bucket / user pool / IoT endpoint discovery results
+discovery_cache = DiscoveryCache(ttl_seconds=getattr(config, "DISCOVERY_CACHE_TTL_SECONDS", 3600))
+
+# Newest known heartbeat/registration object per device, so repeat lookups only
+# list days newer than what they already know. Relative paths are resolved
+# against the backend directory; set HEARTBEAT_INDEX_PATH = None to disable.
+HEARTBEAT_INDEX_PATH = getattr(config, "HEARTBEAT_INDEX_PATH", "heartbeat_index.sqlite3")
+latest_key_index = None
+if HEARTBEAT_INDEX_PATH:
+    try:
+        latest_key_index = LatestKeyIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), HEARTBEAT_INDEX_PATH))
+    except Exception as e:
+        log.warning("Could not open heartbeat index at %s: %s", HEARTBEAT_INDEX_PATH, e)
+
+# --- End Configuration Loading ---
+
+# --- GOD-Tool Helper Functions (adapted from godtool_with_cognito_release.py) ---
 
 BATTERY_WEIGHTINGS_DATA = None
 def load_battery_weightings():
@@ -137,21 +327,21 @@ def load_battery_weightings():
                         desired_percentage = int(row[1])
                         weightings.append((reported_percentage, desired_percentage))
                     except ValueError:
-                        print_info(f"WARNING: Skipping malformed row in {BATTERY_WEIGHTINGS_FILE_PATH}: {row}")
+                        log.warning("Skipping malformed row in %s: %s", BATTERY_WEIGHTINGS_FILE_PATH, row)
         
         if weightings:
             # Sort by reported percentage just in case the file is not ordered
             weightings.sort(key=lambda x: x[0])
             BATTERY_WEIGHTINGS_DATA = weightings
-            print_info(f"Successfully loaded battery weightings from {BATTERY_WEIGHTINGS_FILE_PATH}")
+            log.info("Successfully loaded battery weightings from %s", BATTERY_WEIGHTINGS_FILE_PATH)
         else:
-            print_info(f"WARNING: No valid battery weightings found in {BATTERY_WEIGHTINGS_FILE_PATH}. Using fallback.")
+            log.warning("No valid battery weightings found in %s. Using fallback.", BATTERY_WEIGHTINGS_FILE_PATH)
             BATTERY_WEIGHTINGS_DATA = [(0,0), (100,100)] # Fallback to 1:1 mapping
     except FileNotFoundError:
-        print_info(f"ERROR: {BATTERY_WEIGHTINGS_FILE_PATH} not found. Using fallback battery weightings.")
+        log.error("%s not found. Using fallback battery weightings.", BATTERY_WEIGHTINGS_FILE_PATH)
         BATTERY_WEIGHTINGS_DATA = [(0,0), (100,100)] # Fallback to 1:1 mapping
     except Exception as e:
-        print_info(f"ERROR: Could not load {BATTERY_WEIGHTINGS_FILE_PATH}: {e}. Using fallback battery weightings.")
+        log.error("Could not load %s: %s. Using fallback battery weightings.", BATTERY_WEIGHTINGS_FILE_PATH, e)
         BATTERY_WEIGHTINGS_DATA = [(0,0), (100,100)] # Fallback to 1:1 mapping
 
 def portal_battery(reported_percentage):
@@ -195,7 +385,7 @@ def portal_battery(reported_percentage):
         return weightings[-1][1]
 
     except (ValueError, TypeError) as e:
-        debug_print(f"Error in portal_battery: {e} with reported_percentage {reported_percentage}")
+        log.warning("Error in portal_battery: %s with reported_percentage %s", e, reported_percentage)
         return "N/A"
 
 def extract_year_of_manufacture(iccid):
@@ -208,27 +398,41 @@ def extract_year_of_manufacture(iccid):
     except Exception:
         return "N/A"
 
-def find_customer_user_pool_id(session: boto3.Session) -> str | None:
+def discover_customer_user_pool_id(cognito_client) -> str | None:
     """
-    Lists Cognito User Pools for a given session and returns the ID of the first one
-    whose name contains 'Customer'.
+    Lists Cognito User Pools with the given client (all pages) and returns the ID of
+    the first one whose name contains 'Customer'. Raises on AWS errors.
     """
-    try:
-        cognito_client = session.client("cognito-idp")
-        response = cognito_client.list_user_pools(MaxResults=60) # MaxResults up to 60
-        
-        for user_pool in response.get('UserPools', []):
+    paginator = cognito_client.get_paginator("list_user_pools")
+    for page in paginator.paginate(MaxResults=60): # MaxResults up to 60 per page
+        for user_pool in page.get('UserPools', []):
             if "Customer" in user_pool.get('Name', ''):
-                debug_print(f"PERSON: Found Customer User Pool: {user_pool['Name']} ({user_pool['Id']})")
+                log.debug("PERSON: Found Customer User Pool: %s (%s)", user_pool['Name'], user_pool['Id'])
                 return user_pool['Id']
-        debug_print("PERSON: No 'Customer' User Pool found.")
-        return None
+    log.debug("PERSON: No 'Customer' User Pool found.")
+    return None
+
+def find_customer_user_pool_id(cognito_client, account_id: str | None = None) -> str | None:
+    """
+    Returns the ID of the account's 'Customer' Cognito User Pool. Cached per
+    account in discovery_cache when `account_id` is given.
+    """
+    try:
+        if not account_id:
+            return discover_customer_user_pool_id(cognito_client)
+        return discovery_cache.get_or_load(
+            account_id, "customer_user_pool_id", lambda: discover_customer_user_pool_id(cognito_client)
+        )
     except Exception as e:
-        debug_print(f"PERSON: Error finding Customer User Pool: {e}")
+        log.warning("PERSON: Error finding Customer User Pool: %s", e)
         return None
 
-def perform_person_lookup(person_id: str) -> Dict[str, Any]:
-    """Perform Person ID lookup and return a structured dictionary of results."""
+@traced("person lookup")
+def perform_person_lookup(person_id: str, deadline: Deadline | None = None) -> Dict[str, Any]:
+    """
+    Perform Person ID lookup and return a structured dictionary of results.
+    If `deadline` runs out, the steps not started yet are skipped and named in `errors`.
+    """
     
     person_data = {
         "person_id": person_id,
@@ -241,14 +445,16 @@ def perform_person_lookup(person_id: str) -> Dict[str, Any]:
         # 1. Query pat-labels table to get account ID
         account_id = None
         try:
-            response = pat_labels_table.query(
+            response = pat_labels_table(deadline_limits(deadline)).query(
                 IndexName="PersonID-index",
                 KeyConditionExpression=boto3.dynamodb.conditions.Key("PersonID").eq(person_id)
             )
             items = response.get("Items", [])
             
             if not items:
-                response = pat_labels_table.get_item(
+                if deadline:
+                    deadline.check()
+                response = pat_labels_table(deadline_limits(deadline)).get_item(
                     Key={"ID": person_id, "Metadata": "FULFILMENT#REQUEST"}
                 )
                 item = response.get("Item")
@@ -270,25 +476,37 @@ def perform_person_lookup(person_id: str) -> Dict[str, Any]:
                 person_data["errors"].append("Person ID not found in pat-labels table.")
                 return person_data # Exit early if no account found
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             person_data["errors"].append(f"Error querying pat-labels: {str(e)}")
             return person_data # Exit early on error
 
-        # 2. Get AWS session for the account
-        session = get_aws_session_for_account(account_id)
-        if not session:
+        # 2. Get the AWS profile for the account
+        profile = get_aws_profile_for_account(account_id)
+        if not profile:
             person_data["errors"].append("Could not determine AWS profile for the account. Cannot retrieve Cognito data.")
             return person_data
 
         # 3. Find Customer User Pool ID
-        user_pool_id = find_customer_user_pool_id(session)
+        if deadline:
+            deadline.check()
+        try:
+            CIRCUIT_BREAKERS.check(account_id, "cognito-idp")
+        except CircuitOpenError as e:
+            person_data["errors"].append(str(e))
+            return person_data
+        cognito_client = AWS_CLIENTS.client(profile, "cognito-idp", limits=deadline_limits(deadline))
+        user_pool_id = find_customer_user_pool_id(cognito_client, account_id)
         if not user_pool_id:
             person_data["errors"].append(f"No 'Customer' Cognito User Pool found for account {person_data['account']['name']}.")
             return person_data
 
         # 4. Get Cognito User Details
+        if deadline:
+            deadline.check()
+            cognito_client = AWS_CLIENTS.client(profile, "cognito-idp", limits=deadline_limits(deadline))
         try:
-            cognito_client = session.client("cognito-idp")
             user_response = cognito_client.admin_get_user(
                 UserPoolId=user_pool_id,
                 Username=person_id
@@ -318,6 +536,9 @@ def perform_person_lookup(person_id: str) -> Dict[str, Any]:
         except Exception as e:
             person_data["errors"].append(f"Error retrieving Cognito user details: {str(e)}")
 
+    except DeadlineExceeded:
+        skipped = [field for field in ("account", "cognito_user") if person_data[field] is None]
+        person_data["errors"].append(deadline.skipped_message(skipped))
     except Exception as e:
         person_data["errors"].append(f"An unexpected error occurred during person lookup: {str(e)}")
     
@@ -327,67 +548,76 @@ def log_battery_data(iccid, voltage):
     """Appends a new voltage reading to the battery data log. (Placeholder for FastAPI)"""
     # In a FastAPI context, logging to a local CSV might not be desired or possible.
     # This function is kept for compatibility but its behavior might need adjustment.
-    print_info(f"Battery data logging (placeholder): ICCID={iccid}, Voltage={voltage}")
+    log.debug("Battery data logging (placeholder): ICCID=%s, Voltage=%s", iccid, voltage)
+
+def profiled_response(result, profile):
+    """The ?profile=1 response: the endpoint's result next to its cProfile summary."""
+    return JSONResponse({"result": jsonable_encoder(result), "profile": profile.summary()})
 
 @app.get("/api/person_lookup")
-def person_lookup(person_id: str = Query(..., description="The Person ID (UUID) to lookup.")):
+@in_pool("accounts")
+def person_lookup(
+    person_id: str = Query(..., description="The Person ID (UUID) to lookup."),
+    profile: bool = Query(False, description="Profile the lookup and return {result, profile} instead."),
+    deadline: Deadline = Depends(request_deadline),
+):
     try:
-        return perform_person_lookup(person_id)
+        with request_profile(profile) as request_prof:
+            result = perform_person_lookup(person_id, deadline)
+        return profiled_response(result, request_prof) if request_prof else result
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def get_iot_info_for_thing(thing_name: str, iot_client_instance, iot_data_client_instance) -> Dict:
-    """
-    Retrieves a summary of the last 6 IoT Job executions, the Thing Shadow,
-    and the Thing's description for a given thing.
-    Returns a dictionary containing all this information.
-    """
-    output = {"jobs": [], "shadow": None, "description": None}
-
-    # 1. Describe the Thing itself
+@traced("iot describe")
+def describe_iot_thing(thing_name: str, iot_client_instance) -> Dict | None:
+    """Describe the Thing itself. Returns None if it doesn't exist or can't be described."""
     try:
-        debug_print(f"IoT Describe: Attempting to describe thing: {thing_name}")
+        log.debug("IoT Describe: Attempting to describe thing: %s", thing_name)
         thing_description = iot_client_instance.describe_thing(thingName=thing_name)
-        debug_print(f"IoT Describe: Raw response for {thing_name}: {thing_description}")
-        
+        payload_log.debug("IoT Describe: Raw response for %s: %s", thing_name, thing_description)
+
         # Filter what we want to keep
-        output["description"] = {
+        return {
             "thingName": thing_description.get("thingName"),
             "attributes": thing_description.get("attributes", {}),
             "version": thing_description.get("version")
         }
 
+    except (CircuitOpenError, OutboundRateLimited):
+        raise  # reported as a lookup error, not as a missing thing
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
-            debug_print(f"IoT Describe: Thing {thing_name} not found in AWS IoT Core.")
+            log.debug("IoT Describe: Thing %s not found in AWS IoT Core.", thing_name)
         else:
-            debug_print(f"IoT Describe: ClientError describing thing {thing_name}: {e}")
-        # If the thing doesn't exist, no point in looking for jobs or shadow
-        return output
+            log.warning("IoT Describe: ClientError describing thing %s: %s", thing_name, e)
+        return None
     except Exception as e:
-        debug_print(f"IoT Describe: Unexpected error describing thing {thing_name}: {e}")
-        return output
-
+        log.warning("IoT Describe: Unexpected error describing thing %s: %s", thing_name, e)
+        return None
 
-    # 2. Get IoT Jobs
+@traced("iot jobs")
+def list_recent_iot_jobs(thing_name: str, iot_client_instance) -> List[Dict]:
+    """Returns a summary of the last 6 IoT Job executions for a thing."""
     try:
-        debug_print(f"IoT Jobs: Attempting to list jobs for thingName: {thing_name}")
+        log.debug("IoT Jobs: Attempting to list jobs for thingName: %s", thing_name)
         response = iot_client_instance.list_job_executions_for_thing(
             thingName=thing_name,
             maxResults=6
         )
-        debug_print(f"IoT Jobs: Raw response for {thing_name}: {response}")
-        
+        payload_log.debug("IoT Jobs: Raw response for %s: %s", thing_name, response)
+
         jobs_summary = []
         execution_summaries = response.get('executionSummaries', [])
-        debug_print(f"IoT Jobs: Execution summaries for {thing_name}: {execution_summaries}")
+        payload_log.debug("IoT Jobs: Execution summaries for %s: %s", thing_name, execution_summaries)
 
         for job_execution in execution_summaries:
             summary = job_execution.get('jobExecutionSummary', {})
             job_id = job_execution['jobId']
             status = summary.get('status')
             last_updated_at = summary.get('lastUpdatedAt')
-            
+
             simplified_status = "queued"
             if status in ["SUCCEEDED", "CANCELED", "REMOVED"]:
                 simplified_status = "pass"
@@ -402,259 +632,665 @@ def get_iot_info_for_thing(thing_name: str, iot_client_instance, iot_data_client
                 "simplified_status": simplified_status,
                 "lastUpdatedAt": last_updated_at.strftime("%Y-%m-%d %H:%M:%S") if last_updated_at else "N/A"
             })
-        output["jobs"] = jobs_summary
+        return jobs_summary
+    except (CircuitOpenError, OutboundRateLimited):
+        raise
     except ClientError as e:
-        debug_print(f"IoT Jobs: ClientError getting IoT jobs for thing {thing_name}: {e}")
+        log.warning("IoT Jobs: ClientError getting IoT jobs for thing %s: %s", thing_name, e)
     except Exception as e:
-        debug_print(f"IoT Jobs: Unexpected error getting IoT jobs for thing {thing_name}: {e}")
+        log.warning("IoT Jobs: Unexpected error getting IoT jobs for thing %s: %s", thing_name, e)
+    return []
 
-    # 3. Get Thing Shadow
+@traced("shadow")
+def get_iot_thing_shadow(thing_name: str, iot_data_client_instance) -> Dict | None:
+    """Returns the parsed Thing Shadow document, or None if there isn't one."""
     try:
-        debug_print(f"IoT Shadow: Attempting to get shadow for thingName: {thing_name}")
+        log.debug("IoT Shadow: Attempting to get shadow for thingName: %s", thing_name)
         shadow_response = iot_data_client_instance.get_thing_shadow(thingName=thing_name)
-        debug_print(f"IoT Shadow: Raw response for {thing_name}: {shadow_response}")
-        
+        payload_log.debug("IoT Shadow: Raw response for %s: %s", thing_name, shadow_response)
+
         payload = shadow_response.get('payload')
         if payload:
-            shadow_data = json.loads(payload.read())
-            output["shadow"] = shadow_data
-            
+            return json.loads(payload.read())
+
+    except (CircuitOpenError, OutboundRateLimited):
+        raise
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
-            debug_print(f"IoT Shadow: No shadow found for thing {thing_name}")
+            log.debug("IoT Shadow: No shadow found for thing %s", thing_name)
         else:
-            debug_print(f"IoT Shadow: ClientError getting shadow for thing {thing_name}: {e}")
+            log.warning("IoT Shadow: ClientError getting shadow for thing %s: %s", thing_name, e)
     except Exception as e:
-        debug_print(f"IoT Shadow: Unexpected error getting shadow for thing {thing_name}: {e}")
-        
-    return output
+        log.warning("IoT Shadow: Unexpected error getting shadow for thing %s: %s", thing_name, e)
+    return None
 
+def start_iot_info(thing_name: str, iot_client_instance, iot_data_client_instance) -> Future:
+    """
+    Starts the describe, jobs and shadow calls for a thing concurrently on lookup_executor
+    and returns a Future of the get_iot_info_for_thing dictionary, without blocking.
+    Jobs and shadow are discarded if the thing can't be described, as before.
+    """
+    describe_future = lookup_executor.submit(describe_iot_thing, thing_name, iot_client_instance)
+    jobs_future = lookup_executor.submit(list_recent_iot_jobs, thing_name, iot_client_instance)
+    shadow_future = lookup_executor.submit(get_iot_thing_shadow, thing_name, iot_data_client_instance)
+    info_future = Future()
 
-def perform_device_lookup(iccid, user_id=None):
-    """Perform ICCID lookup and return a structured dictionary of results."""
-    
-    result_data = {
-        "general": {},
-        "registration": None,
-        "heartbeat": None,
-        "iot": None,
-        "errors": []
+    def combine(_):
+        try:
+            output = {"jobs": [], "shadow": None, "description": describe_future.result()}
+            # If the thing doesn't exist, its jobs and shadow aren't meaningful
+            if output["description"] is not None:
+                output["jobs"] = jobs_future.result()
+                output["shadow"] = shadow_future.result()
+            info_future.set_result(output)
+        except Exception as e:
+            info_future.set_exception(e)
+
+    when_all_done(describe_future, jobs_future, shadow_future).add_done_callback(combine)
+    return info_future
+
+def get_iot_info_for_thing(thing_name: str, iot_client_instance, iot_data_client_instance) -> Dict:
+    """
+    Retrieves a summary of the last 6 IoT Job executions, the Thing Shadow,
+    and the Thing's description for a given thing.
+    Returns a dictionary containing all this information.
+
+    The three calls run concurrently on lookup_executor (see start_iot_info).
+    Must not be called from a lookup_executor worker.
+    """
+    return start_iot_info(thing_name, iot_client_instance, iot_data_client_instance).result()
+
+
+@traced("refurb records")
+def lookup_refurb_records(iccid, limits=None):
+    """Returns the number of Refurb-Table records for an ICCID."""
+    response = refurb_table(limits).query(KeyConditionExpression=boto3.dynamodb.conditions.Key("iccid").eq(iccid))
+    return len(response.get("Items", []))
+
+@traced("account allocation")
+def lookup_account_allocation(iccid, limits=None):
+    """Returns the ACCOUNTALLOCATION item for an ICCID, or None."""
+    response = device_reg_table(limits).get_item(Key={"ID": iccid, "Metadata": "ACCOUNTALLOCATION"})
+    return response.get("Item")
+
+def get_device_type(iccid):
+    """Returns the device type implied by the ICCID range, or None."""
+    if iccid.startswith("894303017220"):
+        return "ST Device"
+    elif iccid > "8943030172210000":
+        return "GD Device"
+    return None
+
+def build_registration_section(item, account_name, latest_s3_reg_info):
+    """Builds the `registration` section from the allocation item and the latest S3 registration."""
+    registration_data = {
+        "account_name": account_name,
+        "registration_time": format_timestamp(item.get("CreatedAt")) if item.get("CreatedAt") else "N/A",
+        "firmware_on_registration": None,
+        "battery_on_registration": None
     }
 
+    if latest_s3_reg_info and latest_s3_reg_info.get('raw'):
+        reg_raw = latest_s3_reg_info['raw']
+        if isinstance(reg_raw, list) and len(reg_raw) >= 14:
+            install_battery = reg_raw[1]
+            install_fw = reg_raw[13].replace('-', '.') if isinstance(reg_raw[13], str) else reg_raw[13]
+            portal_install_batt = portal_battery(install_battery)
+
+            registration_data["firmware_on_registration"] = install_fw
+            registration_data["battery_on_registration"] = portal_install_batt
+
+    return registration_data
+
+def build_heartbeat_section(iccid, heartbeat_info):
+    """Builds the `heartbeat` section from get_latest_heartbeat_info output."""
+    if not heartbeat_info:
+        return None
+
+    raw_voltage = heartbeat_info.get("battery_voltage")
+    log_battery_data(iccid, raw_voltage)
+
+    lat = heartbeat_info.get('lat')
+    lng = heartbeat_info.get('lng')
+    location = "N/A"
+    maps_url = None
+    if lat and lng and lat != 'nan' and lng != 'nan':
+        location = f"{lat}, {lng}"
+        maps_url = f"https://maps.google.com/?q={lat},{lng}"
+
+    return {
+        "last_seen": heartbeat_info.get('last_seen'),
+        "firmware": heartbeat_info.get('firmware_version', 'N/A'),
+        "battery_percentage": portal_battery(heartbeat_info.get("battery_percentage")),
+        "gps_status": "Connected" if heartbeat_info.get('gps_connected') else "Disconnected",
+        "location": location,
+        "location_url": maps_url
+    }
+
+def build_iot_section(iot_info):
+    """Builds the `iot` section (jobs plus the displayed shadow fields) from get_iot_info_for_thing output."""
+    iot_result = {"jobs": iot_info.get("jobs"), "shadow": None}
+
+    # Process Shadow
+    shadow = iot_info.get("shadow")
+    if shadow and 'state' in shadow and 'reported' in shadow['state']:
+        reported_state = shadow['state'].get('reported', {})
+
+        desired_keys_map = {
+            "latest-bootloader": "Latest-Bootloader",
+            "latest-firmware": "Latest-Firmware",
+            "latest-fallback": "Latest-Fallback",
+            "debug": "Debug",
+            "heartbeat-interval": "Heartbeat-Interval",
+            "battery-low-threshold": "Battery-Low-Threshold",
+            "trip-timeout": "Trip-Timeout",
+            "after-trip-reports": "After-Trip-Reports",
+            "heartbeat-tod": "Heartbeat-Tod",
+            "heartbeat-enable": "Heartbeat-Enable",
+            "daily-upload-time": "Daily-Upload-Time"
+        }
+
+        processed_shadow = {}
+        try:
+            metadata = shadow.get('metadata', {}).get('reported', {})
+            if metadata:
+                for key, value in metadata.items():
+                    if isinstance(value, dict) and 'timestamp' in value:
+                        ts = value['timestamp']
+                        processed_shadow["Last Updated"] = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+                        break
+        except Exception:
+            pass
+
+        for key, display_key in desired_keys_map.items():
+            processed_shadow[display_key] = reported_state.get(key, "Null")
+
+        iot_result["shadow"] = processed_shadow
+
+    return iot_result
+
+
+@traced("account clients")
+def build_account_clients(account_id, deadline=None):
+    """
+    Returns the {"s3", "iot", "iot_data"} clients used for an account's device lookups,
+    or None if the account has no usable AWS profile. Clients are thread-safe and
+    can be shared by every lookup for the account. With a `deadline` their timeouts
+    and retries are sized to the time it has left.
+    """
+    profile = get_aws_profile_for_account(account_id)
+    if not profile:
+        return None
+    limits = deadline_limits(deadline)
+    iot_client = AWS_CLIENTS.client(profile, "iot", region='eu-west-1', limits=limits)
+    return {
+        "s3": AWS_CLIENTS.client(profile, "s3", limits=limits),
+        "iot": iot_client,
+        "iot_data": iot_data_client_for_account(profile, iot_client, account_id, limits),
+    }
+
+def when_all_done(*futures):
+    """Returns a Future that resolves (to None) once every one of `futures` is done, whatever their outcome."""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def one_done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            combined.set_result(None)
+
+    if not futures:
+        combined.set_result(None)
+    for future in futures:
+        future.add_done_callback(one_done)
+    return combined
+
+def completed_future(result=None, exception=None):
+    """Returns an already-resolved Future, for feeding prefetched data into collect_device_sections."""
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+DEVICE_LOOKUP_SECTIONS = ("general", "registration", "heartbeat", "iot")
+
+def perform_device_lookup(iccid, user_id=None, sections=DEVICE_LOOKUP_SECTIONS):
+    """
+    Perform ICCID lookup and return a structured dictionary of results.
+
+    Each AWS call is started on lookup_executor as soon as its inputs are known:
+    the Refurb-Table query, ACCOUNTALLOCATION get_item and battery replacement
+    check start immediately; the registration walk, heartbeat walk and IoT calls
+    start together once the account is known. Results are merged in the same
+    order as the sequential lookup, so `errors` reads the same.
+    """
     try:
-        # --- General Info ---
-        result_data["general"]["iccid"] = iccid
-        result_data["general"]["year_of_manufacture"] = extract_year_of_manufacture(iccid)
+        values, errors = lookup_device_sections(iccid, sections)
+        return merge_device_sections(iccid, values, errors)
+    except Exception as e:
+        # log.debug("Major error in perform_device_lookup: %s", e)
+        return {"error": f"An unexpected error occurred: {str(e)}"}
+
+def lookup_device_sections(iccid, sections=DEVICE_LOOKUP_SECTIONS, on_section=None, deadline=None):
+    """Starts only the calls the requested sections need and returns collect_device_sections output."""
+    refurb_future = None
+    allocation_future = None
+    battery_future = None
+    limits = deadline_limits(deadline)
+    if "general" in sections:
+        refurb_future = lookup_executor.submit(lookup_refurb_records, iccid, limits)
+        battery_future = lookup_executor.submit(check_battery_replacement, iccid)
+    if any(section != "general" for section in sections):
+        allocation_future = lookup_executor.submit(lookup_account_allocation, iccid, limits)
+    return collect_device_sections(
+        iccid, sections, refurb_future, allocation_future, battery_future,
+        lambda account_id: build_account_clients(account_id, deadline), on_section=on_section, deadline=deadline,
+    )
+
+def collect_device_sections(iccid, sections, refurb_future, allocation_future, battery_future, account_clients_for, on_section=None, deadline=None):
+    """
+    Runs the account-specific part of a device lookup for the requested sections and
+    returns ({section: value}, {section: [errors]}). The Refurb-Table count,
+    ACCOUNTALLOCATION item and battery replacement flag are passed in as futures, and
+    `account_clients_for` returns the clients for an account (see build_account_clients),
+    so the batch endpoint can feed in prefetched data and shared clients.
+
+    Each section is built as soon as the calls it needs have completed, and
+    `on_section(section, value, errors)` is called right away if given, which is
+    what /api/device_lookup/stream sends on. Only this thread waits; everything
+    it waits for runs on lookup_executor.
+
+    An error that affects several sections (e.g. no AWS profile) is listed under each
+    of them; merge_device_sections drops the duplicates.
+
+    Once `deadline` runs out, this stops waiting: sections not finished by then are
+    returned as None, each with the same error naming all the skipped sections.
+    The day walks check the deadline too and stop listing.
+    """
+    values = {}
+    errors = {section: [] for section in sections}
+    account_sections = [section for section in sections if section != "general"]
+    device_sections = [section for section in ("heartbeat", "iot") if section in sections]
+    waiting = {}  # future -> callback to run in this thread once it's done
+    history = []
+
+    def finish(section, value):
+        values[section] = value
+        if on_section:
+            on_section(section, value, errors[section])
+
+    def finish_general(_):
+        general = {"iccid": iccid, "year_of_manufacture": extract_year_of_manufacture(iccid)}
+        try:
+            general["refurb_records"] = refurb_future.result()
+        except Exception as e:
+            errors["general"].append(f"Error checking Refurb-Table: {str(e)}")
+
+        # --- Device Type & Battery Replacement ---
+        try:
+            device_type = get_device_type(iccid)
+            if device_type:
+                general["device_type"] = device_type
+
+            if battery_future.result():
+                general["battery_replaced"] = True
+        except Exception:
+            pass
+        finish("general", general)
+
+    def finish_registration(item, account_name, registration_future):
+        registration = None
+        if item:
+            try:
+                latest_s3_reg_info = registration_future.result() if registration_future else None
+                registration = build_registration_section(item, account_name, latest_s3_reg_info)
+            except DeadlineExceeded:
+                return
+            except Exception as e:
+                errors["registration"].append(f"Error checking registration: {str(e)}")
+        finish("registration", registration)
+
+    def finish_heartbeat(heartbeat_future):
+        heartbeat = None
+        try:
+            if heartbeat_future:
+                heartbeat = build_heartbeat_section(iccid, heartbeat_future.result())
+        except DeadlineExceeded:
+            return
+        except Exception as e:
+            errors["heartbeat"].append(f"Error during account-specific lookups: {str(e)}")
+        finish("heartbeat", heartbeat)
 
-        # --- Refurb Table Check ---
+    def finish_iot(iot_future):
+        iot = None
         try:
-            response = refurb_table.query(KeyConditionExpression=boto3.dynamodb.conditions.Key("iccid").eq(iccid))
-            result_data["general"]["refurb_records"] = len(response.get("Items", []))
+            if iot_future:
+                iot = build_iot_section(iot_future.result())
+        except (CircuitOpenError, OutboundRateLimited) as e:
+            errors["iot"].append(str(e))
         except Exception as e:
-            result_data["errors"].append(f"Error checking Refurb-Table: {str(e)}")
+            errors["iot"].append(f"Error during account-specific lookups: {str(e)}")
+        finish("iot", iot)
 
+    def start_account_sections(_):
         # --- Device Registration Check ---
         account_id = None
         account_name = None
+        item = None
         try:
-            response = device_reg_table.get_item(Key={"ID": iccid, "Metadata": "ACCOUNTALLOCATION"})
-            item = response.get("Item")
+            item = allocation_future.result()
             if item:
                 account_id = item.get("AccountID")
-                print(f"INFO: Device lookup for ICCID {iccid} found AccountID: {account_id}. Verifying this ID exists in your config's ACCOUNT_TO_PROFILE_MAPPING.")
+                log.info("Device lookup for ICCID %s found AccountID: %s. Verifying this ID exists in your config's ACCOUNT_TO_PROFILE_MAPPING.", iccid, account_id)
                 account_name = get_account_name(account_id) if account_id else "Unknown"
-                
-                # Initialize registration data
-                registration_data = {
-                    "account_name": account_name,
-                    "registration_time": format_timestamp(item.get("CreatedAt")) if item.get("CreatedAt") else "N/A",
-                    "firmware_on_registration": None,
-                    "battery_on_registration": None
-                }
-
-                # Get account-specific session for S3 lookup
-                session_for_s3 = get_aws_session_for_account(account_id)
-                if session_for_s3:
-                    s3_client_for_reg = session_for_s3.client("s3")
-                    latest_s3_reg_info = get_latest_registration_info(iccid, account_id, s3_client_for_reg)
-                    
-                    if latest_s3_reg_info and latest_s3_reg_info.get('raw'):
-                        reg_raw = latest_s3_reg_info['raw']
-                        if isinstance(reg_raw, list) and len(reg_raw) >= 14:
-                            install_battery = reg_raw[1]
-                            install_fw = reg_raw[13].replace('-', '.') if isinstance(reg_raw[13], str) else reg_raw[13]
-                            portal_install_batt = portal_battery(install_battery)
-
-                            registration_data["firmware_on_registration"] = install_fw
-                            registration_data["battery_on_registration"] = portal_install_batt
-
-                result_data["registration"] = registration_data
-
         except Exception as e:
-            result_data["errors"].append(f"Error checking registration: {str(e)}")
+            for section in account_sections:
+                errors[section].append(f"Error checking registration: {str(e)}")
 
-        # --- Device Type & Battery Replacement ---
+        # --- Account-Specific Lookups (Registration, Heartbeat & IoT) ---
+        registration_future = None
+        heartbeat_future = None
+        iot_future = None
         try:
-            if iccid.startswith("894303017220"):
-                result_data["general"]["device_type"] = "ST Device"
-            elif iccid > "8943030172210000":
-                result_data["general"]["device_type"] = "GD Device"
-            
-            if check_battery_replacement(iccid):
-                result_data["general"]["battery_replaced"] = True
-        except Exception:
-            pass
+            clients = account_clients_for(account_id) if account_id else None
+            if clients:
+                # Calls whose circuit breaker is open are skipped; they would only fail after their timeouts
+                s3_open = open_breaker_error(account_id, "s3")
+                iot_open = open_breaker_error(account_id, "iot") or open_breaker_error(account_id, "iot-data")
+                if s3_open:
+                    for section in ("registration", "heartbeat"):
+                        if section in sections and (item or section == "heartbeat"):
+                            errors[section].append(s3_open)
+                if iot_open and "iot" in sections:
+                    errors["iot"].append(iot_open)
+                # Registration and heartbeat walk the same days; one scanner lists each day once for both
+                if not s3_open and ((item and "registration" in sections) or "heartbeat" in sections):
+                    scanner = open_device_history(iccid, account_id, clients["s3"])
+                    if scanner:
+                        history.append(scanner)
+                if item and "registration" in sections and not s3_open:
+                    registration_future = lookup_executor.submit(
+                        get_latest_registration_info, iccid, account_id, clients["s3"], scanner=history[0], deadline=deadline
+                    ) if history else completed_future(None)
+                if "heartbeat" in sections and not s3_open:
+                    heartbeat_future = lookup_executor.submit(
+                        get_latest_heartbeat_info, iccid, account_id, clients["s3"], max_search=config.HEARTBEAT_MAX_SEARCH_DAYS,
+                        scanner=history[0], deadline=deadline,
+                    ) if history else completed_future(None)
+                if "iot" in sections and not iot_open:
+                    iot_future = start_iot_info(iccid, clients["iot"], clients["iot_data"])
+            else:
+                for section in device_sections:
+                    errors[section].append("Could not determine AWS profile for the account. Cannot retrieve Heartbeat or IoT data.")
+        except Exception as e:
+            for section in device_sections:
+                errors[section].append(f"Error during account-specific lookups: {str(e)}")
+
+        for section, future, finisher in (
+            ("registration", registration_future, lambda f: finish_registration(item, account_name, f)),
+            ("heartbeat", heartbeat_future, finish_heartbeat),
+            ("iot", iot_future, finish_iot),
+        ):
+            if section not in sections:
+                continue
+            if future is None:
+                finisher(None)
+            else:
+                waiting[future] = finisher
 
-        # --- Account-Specific Lookups (Heartbeat & IoT) ---
-        session = get_aws_session_for_account(account_id)
-        if session:
-            try:
-                # Heartbeat
-                s3_client_local = session.client("s3")
-                heartbeat_info = get_latest_heartbeat_info(iccid, account_id, s3_client_local, max_search=config.HEARTBEAT_MAX_SEARCH_DAYS)
-                if heartbeat_info:
-                    raw_voltage = heartbeat_info.get("battery_voltage")
-                    log_battery_data(iccid, raw_voltage)
-                    
-                    lat = heartbeat_info.get('lat')
-                    lng = heartbeat_info.get('lng')
-                    location = "N/A"
-                    maps_url = None
-                    if lat and lng and lat != 'nan' and lng != 'nan':
-                        location = f"{lat}, {lng}"
-                        maps_url = f"https://maps.google.com/?q={lat},{lng}"
-
-                    result_data["heartbeat"] = {
-                        "last_seen": heartbeat_info.get('last_seen'),
-                        "firmware": heartbeat_info.get('firmware_version', 'N/A'),
-                        "battery_percentage": portal_battery(heartbeat_info.get("battery_percentage")),
-                        "gps_status": "Connected" if heartbeat_info.get('gps_connected') else "Disconnected",
-                        "location": location,
-                        "location_url": maps_url
-                    }
+    if "general" in sections:
+        waiting[when_all_done(refurb_future, battery_future)] = finish_general
+    if account_sections:
+        waiting[allocation_future] = start_account_sections
 
-                # IoT Info
-                iot_client_local = session.client("iot", region_name='eu-west-1')
-                iot_data_client_local = session.client("iot-data", region_name='eu-west-1')
-                iot_info = get_iot_info_for_thing(iccid, iot_client_local, iot_data_client_local)
-                
-                iot_result = {"jobs": iot_info.get("jobs"), "shadow": None}
-
-                # Process Shadow
-                shadow = iot_info.get("shadow")
-                if shadow and 'state' in shadow and 'reported' in shadow['state']:
-                    reported_state = shadow['state'].get('reported', {})
-                    
-                    desired_keys_map = {
-                        "latest-bootloader": "Latest-Bootloader",
-                        "latest-firmware": "Latest-Firmware",
-                        "latest-fallback": "Latest-Fallback",
-                        "debug": "Debug",
-                        "heartbeat-interval": "Heartbeat-Interval",
-                        "battery-low-threshold": "Battery-Low-Threshold",
-                        "trip-timeout": "Trip-Timeout",
-                        "after-trip-reports": "After-Trip-Reports",
-                        "heartbeat-tod": "Heartbeat-Tod",
-                        "heartbeat-enable": "Heartbeat-Enable",
-                        "daily-upload-time": "Daily-Upload-Time"
-                    }
-                    
-                    processed_shadow = {}
-                    try:
-                        metadata = shadow.get('metadata', {}).get('reported', {})
-                        if metadata:
-                            for key, value in metadata.items():
-                                if isinstance(value, dict) and 'timestamp' in value:
-                                    ts = value['timestamp']
-                                    processed_shadow["Last Updated"] = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-                                    break
-                    except Exception:
-                        pass
-
-                    for key, display_key in desired_keys_map.items():
-                        processed_shadow[display_key] = reported_state.get(key, "Null")
-                    
-                    iot_result["shadow"] = processed_shadow
-
-                result_data["iot"] = iot_result
+    try:
+        while waiting:
+            done, _ = wait(list(waiting), timeout=deadline.remaining() if deadline else None, return_when=FIRST_COMPLETED)
+            if not done:
+                break  # deadline reached
+            for future in done:
+                callback = waiting.pop(future)
+                callback(future)
+    finally:
+        for scanner in history:
+            scanner.close()
+
+    skipped = [section for section in sections if section not in values]
+    if skipped and deadline is not None:
+        message = deadline.skipped_message(skipped)
+        for section in skipped:
+            errors[section].append(message)
+            finish(section, None)
+
+    return values, errors
+
+def merge_device_sections(iccid, values, errors):
+    """Builds the DeviceLookupResponse dict from per-section values and errors, errors in section order without duplicates."""
+    result_data = {
+        "general": values.get("general") or {"iccid": iccid, "year_of_manufacture": extract_year_of_manufacture(iccid)},
+        "registration": values.get("registration"),
+        "heartbeat": values.get("heartbeat"),
+        "iot": values.get("iot"),
+        "errors": []
+    }
+    for section in DEVICE_LOOKUP_SECTIONS:
+        for error in errors.get(section, []):
+            if error not in result_data["errors"]:
+                result_data["errors"].append(error)
+    return result_data
 
-            except Exception as e:
-                result_data["errors"].append(f"Error during account-specific lookups: {str(e)}")
-        else:
-            result_data["errors"].append("Could not determine AWS profile for the account. Cannot retrieve Heartbeat or IoT data.")
-        
-        return result_data
 
+def store_device_lookup_sections(iccid, values, errors, generation):
+    """
+    Caches freshly fetched sections. Sections that came back with errors aren't cached, so they're
+    retried next time; nothing is cached if the ICCID was invalidated after `generation` was taken.
+    """
+    device_lookup_cache.put(iccid, {section: value for section, value in values.items() if not errors.get(section)}, errors, generation)
+
+def refresh_device_lookup_sections(iccid, sections):
+    """Background refresh of stale cached sections (runs on cache_refresh_executor)."""
+    try:
+        generation = device_lookup_cache.generation(iccid)
+        values, errors = lookup_device_sections(iccid, sections)
+        store_device_lookup_sections(iccid, values, errors, generation)
     except Exception as e:
-        # debug_print(f"Major error in perform_device_lookup: {e}")
-        return {"error": f"An unexpected error occurred: {str(e)}"}
+        log.warning("CACHE: Error refreshing %s for %s: %s", sections, iccid, e)
+    finally:
+        device_lookup_cache.end_refresh(iccid)
+
+def cached_device_lookup(iccid, fresh=False, on_section=None, deadline=None):
+    """
+    Device lookup served from device_lookup_cache (stale-while-revalidate).
 
+    Missing or expired sections are fetched before responding, together with any
+    stale ones. If every section can be served, stale ones are returned as-is and
+    refreshed in the background. `fresh` bypasses the cache and re-fetches everything.
+
+    If given, `on_section(section, value, errors)` is called for each section as soon
+    as it's available: cached ones first, then fetched ones as they complete.
+    `deadline` bounds the fetch (see collect_device_sections); background refreshes have none.
+    """
+    generation = device_lookup_cache.generation(iccid)
+    if fresh:
+        sections, missing, stale = {}, list(DEVICE_LOOKUP_SECTIONS), []
+    else:
+        sections, missing, stale = device_lookup_cache.get(iccid)
+
+    to_fetch = [section for section in DEVICE_LOOKUP_SECTIONS if section in missing or section in stale] if missing else []
+    if on_section:
+        for section in DEVICE_LOOKUP_SECTIONS:
+            if section in sections and section not in to_fetch:
+                on_section(section, *sections[section])
+
+    if missing:
+        values, errors = lookup_device_sections(iccid, to_fetch, on_section=on_section, deadline=deadline)
+        store_device_lookup_sections(iccid, values, errors, generation)
+        sections.update({section: (values[section], errors[section]) for section in values})
+    elif stale and device_lookup_cache.begin_refresh(iccid):
+        cache_refresh_executor.submit(refresh_device_lookup_sections, iccid, stale)
+
+    return merge_device_sections(
+        iccid,
+        {section: value for section, (value, _) in sections.items()},
+        {section: section_errors for section, (_, section_errors) in sections.items()},
+    )
+
+def batch_get_account_allocations(iccids):
+    """
+    Fetches ACCOUNTALLOCATION items for many ICCIDs with DynamoDB BatchGetItem,
+    100 keys per request, retrying unprocessed keys. Returns {iccid: item} for the
+    ICCIDs that have one; a failed chunk maps each of its ICCIDs to the exception.
+    """
+    table_name = config.DYNAMODB_TABLES['device_registration']
+    allocations = {}
+    for start in range(0, len(iccids), 100):
+        chunk = iccids[start:start + 100]
+        request_items = {table_name: {"Keys": [{"ID": iccid, "Metadata": "ACCOUNTALLOCATION"} for iccid in chunk]}}
+        try:
+            attempt = 0
+            while request_items:
+                response = gateway_dynamodb().batch_get_item(RequestItems=request_items)
+                for item in response.get("Responses", {}).get(table_name, []):
+                    allocations[item["ID"]] = item
+                request_items = response.get("UnprocessedKeys") or {}
+                if request_items:
+                    attempt += 1
+                    if attempt > 8:
+                        raise RuntimeError("DynamoDB kept returning unprocessed keys")
+                    time.sleep(min(0.05 * 2 ** attempt, 2))
+        except Exception as e:
+            log.warning("BATCH: Error fetching account allocations: %s", e)
+            for iccid in chunk:
+                allocations.setdefault(iccid, e)
+    return allocations
+
+def load_battery_replacements():
+    """Returns the set of ICCIDs in the battery replacement list, or an empty set if it can't be read."""
+    try:
+        response = dev_s3_client().get_object(Bucket=config.S3_BUCKETS['support_bucket'], Key="battery_swap/replacement_battery.txt")
+        return set(response['Body'].read().decode('utf-8').strip().splitlines())
+    except Exception as e:
+        log.warning("Error checking battery replacement: %s", e)
+        return set()
+
+def perform_batch_device_lookup(iccids):
+    """
+    Looks up many ICCIDs and yields each DeviceLookupResponse-shaped result as soon
+    as it completes (in completion order, not input order).
+
+    Account allocations come from BatchGetItem, the battery replacement list is read
+    once, and devices are dispatched grouped by account so each account's clients are
+    built once and shared. At most DEVICE_BATCH_WORKERS devices run at a time and only
+    a few more results are buffered, so memory doesn't grow with the batch size.
+    """
+    allocations = batch_get_account_allocations(iccids)
+    replacements = load_battery_replacements()
+
+    by_account = {}
+    for iccid in iccids:
+        allocation = allocations.get(iccid)
+        account_id = allocation.get("AccountID") if isinstance(allocation, dict) else None
+        by_account.setdefault(account_id, []).append(iccid)
+
+    clients_lock = threading.Lock()
+    clients_by_account = {}
+
+    def account_clients_for(account_id):
+        with clients_lock:
+            if account_id not in clients_by_account:
+                try:
+                    clients_by_account[account_id] = completed_future(build_account_clients(account_id))
+                except Exception as e:
+                    clients_by_account[account_id] = completed_future(exception=e)
+        return clients_by_account[account_id].result()
+
+    def lookup_one(iccid):
+        allocation = allocations.get(iccid)
+        allocation_future = completed_future(exception=allocation) if isinstance(allocation, Exception) else completed_future(allocation)
+        try:
+            values, errors = collect_device_sections(
+                iccid,
+                DEVICE_LOOKUP_SECTIONS,
+                lookup_executor.submit(lookup_refurb_records, iccid),
+                allocation_future,
+                completed_future(iccid in replacements),
+                account_clients_for,
+            )
+            return merge_device_sections(iccid, values, errors)
+        except Exception as e:
+            return {"error": f"An unexpected error occurred: {str(e)}"}
+
+    ordered = [iccid for account_iccids in by_account.values() for iccid in account_iccids]
+    max_in_flight = getattr(config, "DEVICE_BATCH_WORKERS", 8) * 2
+    in_flight = {}
+    position = 0
+    while position < len(ordered) or in_flight:
+        while position < len(ordered) and len(in_flight) < max_in_flight:
+            iccid = ordered[position]
+            in_flight[batch_executor.submit(lookup_one, iccid)] = iccid
+            position += 1
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            iccid = in_flight.pop(future)
+            yield iccid, future.result()
 
 
 def get_account_name(account_id):
     """Get account name from account ID"""
-    account = ACCOUNT_MAPPING.get(account_id, {})
+    account = account_mapping().get(account_id, {})
     return account.get("name", "Unknown Account")
 
 def get_user_pool_id(account_id):
     """Get Cognito User Pool ID from account mapping"""
-    account = ACCOUNT_MAPPING.get(account_id, {})
+    account = account_mapping().get(account_id, {})
     return account.get("user_pool_id")
 
-def get_aws_session_for_account(account_id: str) -> boto3.Session | None:
-    """
-    Finds the correct AWS profile for a given Account ID by looking up the explicit
-    mapping in the config file and returns a boto3 Session.
-    """
+def discover_iotbackup_bucket(s3_client):
+    """Lists the account's buckets and returns the IoT backup bucket name, or None. Raises on AWS errors."""
+    response = s3_client.list_buckets()
+    for bucket in response['Buckets']:
+        bucket_name = bucket['Name']
+        if 'iotbackuprule' in bucket_name.lower() or 'iotbackuprul' in bucket_name.lower():
+            return bucket_name
+    return None
+
+def find_iotbackup_bucket(s3_client, account_id=None):
+    """Find the IoT backup bucket. Cached per account in discovery_cache when `account_id` is given."""
     try:
         if not account_id:
-            debug_print("SESSION: No account_id provided to get_aws_session_for_account.")
-            return None
-
-        # Look up the profile name from the mapping in config.py
-        profile_name = config.ACCOUNT_TO_PROFILE_MAPPING.get(account_id)
-
-        if profile_name:
-            debug_print(f"SESSION: Found profile '{profile_name}' for Account '{account_id}' in config mapping.")
-            # Verify the profile exists before trying to use it
-            if profile_name not in boto3.Session().available_profiles:
-                debug_print(f"SESSION: WARNING - Profile '{profile_name}' for Account '{account_id}' is defined in config but NOT FOUND in system's AWS profiles.")
-                return None
-            return boto3.Session(profile_name=profile_name)
-        else:
-            debug_print(f"SESSION: No profile mapping found for Account '{account_id}' in config.ACCOUNT_TO_PROFILE_MAPPING.")
-            return None
+            return discover_iotbackup_bucket(s3_client)
+        return discovery_cache.get_or_load(account_id, "iotbackup_bucket", lambda: discover_iotbackup_bucket(s3_client))
     except Exception as e:
-        debug_print(f"SESSION: Error getting session for Account {account_id}: {e}")
+        log.warning("Error finding iotbackup bucket: %s", e)
         return None
 
-def find_iotbackup_bucket(s3_client):
-    """Find the IoT backup bucket"""
+def get_iot_data_endpoint(iot_client_instance, account_id=None):
+    """
+    Returns the account's IoT data (ATS) endpoint URL, cached per account in
+    discovery_cache. Returns None if it can't be described, in which case
+    boto3's regional default endpoint is used.
+    """
+    def describe():
+        response = iot_client_instance.describe_endpoint(endpointType="iot:Data-ATS")
+        return f"https://{response['endpointAddress']}"
+
     try:
-        response = s3_client.list_buckets()
-        for bucket in response['Buckets']:
-            bucket_name = bucket['Name']
-            if 'iotbackuprule' in bucket_name.lower() or 'iotbackuprul' in bucket_name.lower():
-                return bucket_name
-        return None
+        if not account_id:
+            return describe()
+        return discovery_cache.get_or_load(account_id, "iot_data_endpoint", describe)
     except Exception as e:
-        debug_print(f"Error finding iotbackup bucket: {e}")
+        log.warning("Error describing IoT data endpoint: %s", e)
         return None
 
-def list_all_s3_objects(s3_client, bucket_name, prefix):
-    """List all S3 objects with given prefix"""
-    try:
-        paginator = s3_client.get_paginator('list_objects_v2')
-        page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-        objects = []
-        for page in page_iterator:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    objects.append(obj['Key'])
-        return objects
-    except Exception as e:
-        debug_print(f"Error listing objects: {e}")
-        return []
+def iot_data_client_for_account(profile, iot_client_instance, account_id, limits=None):
+    """Returns the profile's iot-data client pointed at the account's discovered data endpoint."""
+    endpoint_url = get_iot_data_endpoint(iot_client_instance, account_id)
+    return AWS_CLIENTS.client(profile, "iot-data", region='eu-west-1', endpoint_url=endpoint_url, limits=limits)
 
 def download_from_s3(s3_client, bucket_name, key):
     """Download object from S3"""
@@ -662,47 +1298,13 @@ def download_from_s3(s3_client, bucket_name, key):
         response = s3_client.get_object(Bucket=bucket_name, Key=key)
         return response['Body'].read()
     except Exception as e:
-        debug_print(f"Error downloading from S3: {e}")
-        return None
-
-def decode_messagepack(data):
-    """Decode MessagePack data"""
-    try:
-        return msgpack.unpackb(data, raw=False)
-    except Exception as e:
-        debug_print(f"Error decoding MessagePack: {e}")
-        return None
-
-def decode_heartbeat_v1(data):
-    """Decode version 1 heartbeat data"""
-    try:
-        unpacked = msgpack.unpackb(data, raw=False)
-        if isinstance(unpacked, (list, tuple)) and len(unpacked) > 1 and isinstance(unpacked[1], dict):
-            return unpacked[1]
-        if isinstance(unpacked, dict):
-            return unpacked
-        if isinstance(unpacked, list) and len(unpacked) >= 12:
-            return {
-                'timestamp': unpacked[1],
-                'battery_percentage': unpacked[2],
-                'battery_voltage': unpacked[3],
-                'ax': unpacked[4],
-                'ay': unpacked[5],
-                'az': unpacked[6],
-                'hdop': unpacked[7],
-                'lng': unpacked[8],
-                'lat': unpacked[9],
-                'firmware_version': unpacked[10],
-                'gps_connected': bool(unpacked[11]) if len(unpacked) > 11 else False
-            }
-        debug_print(f"Unexpected unpacked type in decode_heartbeat_v1: {type(unpacked)} - {unpacked}")
-        return None
-    except Exception as e:
-        debug_print(f"Error decoding heartbeat v1: {e}")
+        log.warning("Error downloading from S3: %s", e)
         return None
 
 def format_gps_location(lat, lng):
     """Format GPS coordinates with Google Maps link (not used in current perform_slack_lookup output)"""
+    from .heartbeat_codec import format_coordinate
+
     if lat == 'N/A' or lng == 'N/A' or lat is None or lng is None:
         return "N/A"
 
@@ -717,225 +1319,291 @@ def format_gps_location(lat, lng):
 
         return f"{lat_formatted}, {lng_formatted} {maps_url}"
     except Exception as e:
-        debug_print(f"Error formatting GPS location: {e}")
+        log.warning("Error formatting GPS location: %s", e)
         return f"{lat}, {lng}"
 
-def format_coordinate(coord):
-    """Format coordinate to 6 decimal places"""
-    if coord == 'N/A' or coord is None:
-        return 'N/A'
-    try:
-        return f"{float(coord):.6f}"
-    except (ValueError, TypeError):
-        return 'N/A'
+def device_history_dates(max_search, now=None):
+    """Returns the YYYY-MM-DD days a device history walk covers, newest first."""
+    now = now or datetime.now()
+    return [(now - timedelta(days=search_count)).strftime("%Y-%m-%d") for search_count in range(max_search)]
 
-def get_latest_heartbeat_info(box_id, account_id, s3_client, max_search=31):
-    """Get latest heartbeat information for a device"""
-    try:
-        bucket_name = find_iotbackup_bucket(s3_client)
-        debug_print(f"Found bucket: {bucket_name}")
-        if not bucket_name:
-            debug_print("No iotbackup bucket found")
-            return None
+def open_device_history(box_id, account_id, s3_client):
+    """
+    Returns a DeviceHistoryScanner over the account's iotbackup bucket, or None if
+    there is no bucket. Share one between the registration and heartbeat walks of
+    a lookup so each day is listed once, and close() it when both are done.
+    """
+    bucket_name = find_iotbackup_bucket(s3_client, account_id)
+    log.debug("Found bucket: %s", bucket_name)
+    if not bucket_name:
+        return None
+    return DeviceHistoryScanner(s3_client, bucket_name, box_id, executor=day_probe_executor, log=log.warning)
+
+def indexed_day_walk(scanner, box_id, account_id, kind, max_search, probe_window):
+    """
+    Yields (date_str, prefix, keys) for a device's `{kind}/push/` messages per day, newest
+    first, skipping the listings that latest_key_index already answers.
+
+    - Known newest object on day D: only days from today back to D are listed (D
+      itself too, since it may have received newer objects). If those are all empty
+      the stored key is yielded as D's listing, followed by the older days.
+    - Known miss ("nothing in N days as of T"), younger than
+      HEARTBEAT_INDEX_NEGATIVE_TTL_HOURS: only days from today back to T's day are listed.
+    - Otherwise the full window is listed.
+
+    Day listings come from `scanner`, so a day another walk already listed costs nothing.
+    """
+    message_path = f"{kind}/push/"
+    dates = device_history_dates(max_search)
+    entry = None
+    if latest_key_index:
+        try:
+            entry = latest_key_index.get(box_id, account_id, kind)
+        except Exception as e:
+            log.warning("INDEX: Error reading %s index for %s: %s", kind, box_id, e)
+
+    if entry and entry["object_key"] is None:
+        negative_ttl = getattr(config, "HEARTBEAT_INDEX_NEGATIVE_TTL_HOURS", 24) * 3600
+        if time.time() - entry["checked_at"] < negative_ttl and (entry["searched_days"] or 0) >= max_search:
+            checked_date = datetime.fromtimestamp(entry["checked_at"]).strftime("%Y-%m-%d")
+            log.debug("INDEX: No %s for %s as of %s, listing newer days only", kind, box_id, checked_date)
+            yield from scanner.walk(message_path, [d for d in dates if d >= checked_date], probe_window)
+            return
+    elif entry and entry["object_date"] >= dates[-1]:
+        known_date = entry["object_date"]
+        log.debug("INDEX: Latest %s for %s was on %s, listing newer days first", kind, box_id, known_date)
+        found_any = False
+        for date_str, prefix, keys in scanner.walk(message_path, [d for d in dates if d >= known_date], probe_window):
+            found_any = found_any or bool(keys)
+            yield date_str, prefix, keys
+        if not found_any:
+            yield known_date, entry["object_key"], [entry["object_key"]]
+        yield from scanner.walk(message_path, [d for d in dates if d < known_date], probe_window)
+        return
+
+    yield from scanner.walk(message_path, dates, probe_window)
+
+def record_index_hit(box_id, account_id, kind, object_key, date_str):
+    """Stores the newest object found for a device. Index errors never fail a lookup."""
+    if latest_key_index:
+        try:
+            latest_key_index.record_hit(box_id, account_id, kind, object_key, date_str)
+        except Exception as e:
+            log.warning("INDEX: Error recording %s hit for %s: %s", kind, box_id, e)
+
+def record_index_miss(box_id, account_id, kind, max_search):
+    """Stores that nothing was found for a device in the window. Index errors never fail a lookup."""
+    if latest_key_index:
+        try:
+            latest_key_index.record_miss(box_id, account_id, kind, max_search)
+        except Exception as e:
+            log.warning("INDEX: Error recording %s miss for %s: %s", kind, box_id, e)
 
-        search_count = 0
-        now = datetime.now()
+@traced("heartbeat walk")
+def get_latest_heartbeat_info(box_id, account_id, s3_client, max_search=31, probe_window=None, scanner=None, deadline=None):
+    """
+    Get latest heartbeat information for a device.
 
-        while search_count < max_search:
-            date_to_search = now - timedelta(days=search_count)
-            search_count += 1
-            date_str = date_to_search.strftime("%Y-%m-%d")
-            year, month, day = date_str.split('-')
-            base_path = f"{year}/{month}/{day}/Inovia/dev/LittleTheo/"
-            heartbeat_path = f"{base_path}{box_id}/v1-0/heartbeat/push/"
+    Days are listed `probe_window` at a time (config HEARTBEAT_PROBE_WINDOW);
+    the newest day with a decodable heartbeat wins, same as a one-day-at-a-time walk.
+    Pass the lookup's `scanner` (see open_device_history) to share day listings
+    with the registration walk. Raises DeadlineExceeded if `deadline` runs out mid-walk.
+    """
+    # The codec brings in msgpack, which isn't imported at startup
+    from .heartbeat_codec import decode_heartbeat
 
-            debug_print(f"Searching date {date_str}, path: {heartbeat_path}")
+    owns_scanner = scanner is None
+    try:
+        if owns_scanner:
+            scanner = open_device_history(box_id, account_id, s3_client)
+        if not scanner:
+            log.debug("No iotbackup bucket found")
+            return None
+        bucket_name = scanner.bucket_name
 
-            objects = list_all_s3_objects(s3_client, bucket_name, heartbeat_path)
-            debug_print(f"Found {len(objects)} objects in {heartbeat_path}")
+        if probe_window is None:
+            probe_window = getattr(config, "HEARTBEAT_PROBE_WINDOW", 7)
 
+        for date_str, heartbeat_path, objects in indexed_day_walk(
+            scanner, box_id, account_id, "heartbeat", max_search, probe_window
+        ):
+            if deadline:
+                deadline.check()
+            log.debug("Searched date %s, path: %s", date_str, heartbeat_path)
             if objects:
-                latest_obj = max(objects)
-                debug_print(f"Latest object: {latest_obj}")
+                latest_obj = objects[0]
+                log.debug("Latest object: %s", latest_obj)
 
                 data = download_from_s3(s3_client, bucket_name, latest_obj)
                 if not data:
-                    debug_print(f"Failed to download data from {latest_obj}")
+                    log.warning("Failed to download data from %s", latest_obj)
                     continue
 
-                debug_print(f"Downloaded {len(data)} bytes")
+                log.debug("Downloaded %s bytes", len(data))
 
-                vals = decode_messagepack(data)
-                if not vals or len(vals) == 0:
-                    debug_print("Failed to decode messagepack or empty data")
+                hb = decode_heartbeat(data)
+                payload_log.debug("Decoded heartbeat: %s", hb)
+                if hb is None:
+                    log.warning("Failed to decode heartbeat, unknown version or format is unrecognized")
                     continue
 
-                debug_print(f"Decoded messagepack, first value: {vals[0] if len(vals) > 0 else 'None'}")
+                heartbeat_info = hb.to_info()
+                record_index_hit(box_id, account_id, "heartbeat", latest_obj, date_str)
+                return heartbeat_info
 
-                try:
-                    fw_version = int(str(vals[0]))
-                    debug_print(f"Firmware version: {fw_version}")
-                except (ValueError, IndexError):
-                    debug_print(f"Failed to parse firmware version from {vals[0] if len(vals) > 0 else 'None'}")
-                    continue
-
-                hb = None
-                if fw_version > 1000:
-                    debug_print("Treating as unversioned (timestamp)")
-                    hb = decode_messagepack(data)
-                else:
-                    if fw_version == 1:
-                        debug_print("Treating as version 1 heartbeat")
-                        hb = decode_heartbeat_v1(data)
-                    else:
-                        debug_print(f"Unknown firmware version: {fw_version}")
-                        continue
-
-                debug_print(f"Decoded heartbeat: {hb}")
-
-                # Handle dictionary-based heartbeats (v1 and others)
-                if isinstance(hb, dict) and 'timestamp' in hb:
-                    timestamp = hb['timestamp']
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"Successfully parsed dict heartbeat with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        'battery_percentage': hb.get('battery_percentage', 'N/A'),
-                        'battery_voltage': hb.get('battery_voltage', 'N/A'),
-                        'gps_connected': hb.get('gps_connected', False),
-                        'lat': format_coordinate(hb.get('lat', 'N/A')),
-                        'lng': format_coordinate(hb.get('lng', 'N/A')),
-                        'firmware_version': hb.get('firmware_version', 'N/A')
-                    }
-                # Handle list-based "unversioned" heartbeats
-                elif isinstance(hb, list) and len(hb) >= 11:
-                    timestamp = hb[0]
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"Successfully parsed list heartbeat with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        'battery_percentage': hb[1],
-                        'battery_voltage': hb[2],
-                        'gps_connected': bool(hb[10]),
-                        'lat': format_coordinate(hb[8]),
-                        'lng': format_coordinate(hb[7]),
-                        'firmware_version': hb[9]
-                    }
-                else:
-                    debug_print("No timestamp found in heartbeat data or format is unrecognized")
-
-        debug_print(f"No heartbeat data found after searching {max_search} days")
+        log.debug("No heartbeat data found after searching %s days", max_search)
+        if scanner.listing_error is not None:
+            # Some days couldn't be listed (e.g. circuit breaker open), so this isn't a real miss
+            raise scanner.listing_error
+        record_index_miss(box_id, account_id, "heartbeat", max_search)
         return None
+    except DeadlineExceeded:
+        log.debug("Heartbeat walk for %s stopped: request deadline reached", box_id)
+        raise
+    except (CircuitOpenError, OutboundRateLimited):
+        raise
     except Exception as e:
-        debug_print(f"Error getting heartbeat info: {e}")
+        log.warning("Error getting heartbeat info: %s", e)
         # if DEBUG_MODE: # DEBUG_MODE is not defined globally in this context
         #     import traceback
         #     traceback.print_exc()
         return None
+    finally:
+        if owns_scanner and scanner:
+            scanner.close()
 
-def get_latest_registration_info(box_id, account_id, s3_client, max_search=31):
-    """Get latest registration information for a device"""
-    try:
-        bucket_name = find_iotbackup_bucket(s3_client)
-        debug_print(f"REG: Found bucket: {bucket_name}")
-        if not bucket_name:
-            debug_print("REG: No iotbackup bucket found")
-            return None
-
-        search_count = 0
-        now = datetime.now()
-
-        while search_count < max_search:
-            date_to_search = now - timedelta(days=search_count)
-            search_count += 1
-            date_str = date_to_search.strftime("%Y-%m-%d")
-            year, month, day = date_str.split('-')
-
-            base_path = f"{year}/{month}/{day}/Inovia/dev/LittleTheo/"
-            registration_path = f"{base_path}{box_id}/v1-0/registration/push/"
-
-            debug_print(f"REG: Searching date {date_str}, path: {registration_path}")
+@traced("heartbeat history listing")
+def list_heartbeat_keys(s3_client, bucket_name, box_id, days, max_objects):
+    """
+    Returns (keys, truncated): every heartbeat key for the device over the last `days` days,
+    newest day first. Days are listed in parallel on day_probe_executor. Once `max_objects`
+    keys are collected, older days are dropped and `truncated` is True.
+    """
+    def list_day(date_str):
+        prefix = device_day_prefix(date_str, box_id) + "heartbeat/push/"
+        try:
+            return list(keys_under_prefix(s3_client, bucket_name, prefix))
+        except Exception as e:
+            log.warning("HISTORY: Error listing %s: %s", prefix, e)
+            return []
+
+    day_futures = [day_probe_executor.submit(list_day, date_str) for date_str in device_history_dates(days)]
+    keys = []
+    truncated = False
+    for future in day_futures:
+        if truncated:
+            future.cancel()
+            continue
+        day_keys = future.result()
+        if len(keys) + len(day_keys) > max_objects:
+            day_keys = sorted(day_keys, reverse=True)[:max_objects - len(keys)]
+            truncated = True
+        keys.extend(day_keys)
+    return keys, truncated
+
+@traced("heartbeat history download")
+def fetch_heartbeat_history(s3_client, bucket_name, keys):
+    """
+    Downloads and decodes heartbeat objects on heartbeat_fetch_executor, with at most
+    two downloads per worker in flight. Returns (heartbeats, failed_keys); objects that
+    can't be downloaded or decoded are counted as failed.
+    """
+    from .heartbeat_codec import decode_heartbeat
+
+    def fetch(key):
+        data = download_from_s3(s3_client, bucket_name, key)
+        return decode_heartbeat(data) if data else None
+
+    max_in_flight = getattr(config, "HEARTBEAT_HISTORY_FETCH_WORKERS", 16) * 2
+    heartbeats = []
+    failed_keys = []
+    in_flight = {}
+    position = 0
+    while position < len(keys) or in_flight:
+        while position < len(keys) and len(in_flight) < max_in_flight:
+            in_flight[heartbeat_fetch_executor.submit(fetch, keys[position])] = keys[position]
+            position += 1
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = in_flight.pop(future)
+            hb = future.result()
+            if hb is None:
+                failed_keys.append(key)
+            else:
+                heartbeats.append(hb)
+    return heartbeats, failed_keys
 
-            objects = list_all_s3_objects(s3_client, bucket_name, registration_path)
-            debug_print(f"REG: Found {len(objects)} objects in {registration_path}")
+@traced("registration walk")
+def get_latest_registration_info(box_id, account_id, s3_client, max_search=31, scanner=None, deadline=None):
+    """Get latest registration information for a device. `scanner` and `deadline` as for get_latest_heartbeat_info."""
+    from .heartbeat_codec import decode_registration
 
+    owns_scanner = scanner is None
+    try:
+        if owns_scanner:
+            scanner = open_device_history(box_id, account_id, s3_client)
+        if not scanner:
+            log.debug("REG: No iotbackup bucket found")
+            return None
+        bucket_name = scanner.bucket_name
+
+        for date_str, registration_path, objects in indexed_day_walk(
+            scanner, box_id, account_id, "registration", max_search, 1
+        ):
+            if deadline:
+                deadline.check()
+            log.debug("REG: Searched date %s, path: %s", date_str, registration_path)
             if objects:
-                latest_obj = max(objects)
-                debug_print(f"REG: Latest object: {latest_obj}")
+                latest_obj = objects[0]
+                log.debug("REG: Latest object: %s", latest_obj)
 
                 data = download_from_s3(s3_client, bucket_name, latest_obj)
                 if not data:
-                    debug_print(f"REG: Failed to download data from {latest_obj}")
+                    log.warning("REG: Failed to download data from %s", latest_obj)
                     continue
 
-                debug_print(f"REG: Downloaded {len(data)} bytes")
+                log.debug("REG: Downloaded %s bytes", len(data))
 
-                vals = decode_messagepack(data)
-                if not vals or len(vals) == 0:
-                    debug_print("REG: Failed to decode messagepack or empty data")
+                reg = decode_registration(data)
+                payload_log.debug("REG: Decoded registration: %s", reg)
+                if reg is None:
+                    log.warning("REG: Failed to decode registration or no timestamp found")
                     continue
 
-                debug_print(f"REG: Decoded messagepack: {vals}")
-
-                reg = None
-                if isinstance(vals, dict):
-                    reg = vals
-                elif isinstance(vals, list) and len(vals) > 0:
-                    if isinstance(vals[0], dict):
-                        reg = vals[0]
-                    elif len(vals) > 1 and isinstance(vals[1], dict):
-                        reg = vals[1]
-                    else:
-                        reg = vals
-                else:
-                    reg = vals
-
-                debug_print(f"REG: Processed registration data: {reg}")
-
-                if isinstance(reg, dict) and 'timestamp' in reg:
-                    timestamp = reg['timestamp']
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"REG: Successfully parsed registration with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        **{k: v for k, v in reg.items() if k != 'timestamp'}
-                    }
-                elif isinstance(reg, list) and len(reg) > 0 and isinstance(reg[0], (int, float)):
-                    timestamp = reg[0]
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"REG: Successfully parsed registration (list) with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        'raw': reg
-                    }
-                else:
-                    debug_print("REG: No timestamp found in registration data")
+                registration_info = reg.to_info()
+                record_index_hit(box_id, account_id, "registration", latest_obj, date_str)
+                return registration_info
 
-        debug_print(f"REG: No registration data found after searching {max_search} days")
+        log.debug("REG: No registration data found after searching %s days", max_search)
+        if scanner.listing_error is not None:
+            raise scanner.listing_error
+        record_index_miss(box_id, account_id, "registration", max_search)
         return None
 
+    except DeadlineExceeded:
+        log.debug("REG: Registration walk for %s stopped: request deadline reached", box_id)
+        raise
+    except (CircuitOpenError, OutboundRateLimited):
+        raise
     except Exception as e:
-        debug_print(f"REG: Error getting registration info: {e}")
+        log.warning("REG: Error getting registration info: %s", e)
         # if DEBUG_MODE: # DEBUG_MODE is not defined globally in this context
         #     import traceback
         #     traceback.print_exc()
         return None
+    finally:
+        if owns_scanner and scanner:
+            scanner.close()
 
 def format_timestamp(unix_timestamp):
     """Format Unix timestamp to readable format"""
     dt = datetime.fromtimestamp(int(unix_timestamp))
     return dt.strftime("%d %b %Y @ %H:%M:%S")
 
+@traced("battery replacement")
 def check_battery_replacement(iccid):
     """Check if battery has been replaced for this ICCID"""
-    try:
-        response = dev_s3_client.get_object(Bucket=config.S3_BUCKETS['support_bucket'], Key="battery_swap/replacement_battery.txt")
-        content = response['Body'].read().decode('utf-8')
-        replacements = content.strip().splitlines()
-        return iccid in replacements
-    except Exception as e:
-        debug_print(f"Error checking battery replacement: {e}")
-        return False
+    return iccid in load_battery_replacements()
 
 # --- End GOD-Tool Helper Functions ---
 
@@ -1002,6 +1670,9 @@ class DeviceLookupResponse(BaseModel):
     iot: IoTInfo | None = None
     errors: List[str]
 
+class DeviceBatchLookupRequest(BaseModel):
+    iccids: List[str]
+
 class ShadowUpdateRequest(BaseModel):
     iccid: str
     desired_state: Dict[str, Any]
@@ -1012,48 +1683,32 @@ class SetPersonEnabledRequest(BaseModel):
 
 
 # --- Logic ---
-def get_aws_session_for_account(account_id: str) -> boto3.Session | None:
+def get_aws_profile_for_account(account_id: str) -> str | None:
     """
-    Finds the correct AWS profile for a given Account ID by looking up the explicit
-    mapping in the config file and returns a boto3 Session.
+    Finds the AWS profile for a given Account ID from the explicit mapping in the
+    config file. Returns None if the account isn't mapped or the profile doesn't
+    exist on this machine. Clients for it come from AWS_CLIENTS.
     """
     try:
         if not account_id:
-            debug_print("SESSION: No account_id provided to get_aws_session_for_account.")
+            log.debug("SESSION: No account_id provided to get_aws_profile_for_account.")
             return None
 
         # Look up the profile name from the mapping in config.py
         profile_name = config.ACCOUNT_TO_PROFILE_MAPPING.get(account_id)
 
         if profile_name:
-            debug_print(f"SESSION: Found profile '{profile_name}' for Account '{account_id}' in config mapping.")
+            log.debug("SESSION: Found profile '%s' for Account '%s' in config mapping.", profile_name, account_id)
             # Verify the profile exists before trying to use it
-            if profile_name not in boto3.Session().available_profiles:
-                debug_print(f"SESSION: WARNING - Profile '{profile_name}' for Account '{account_id}' is defined in config but NOT FOUND in system's AWS profiles.")
+            if not AWS_CLIENTS.has_profile(profile_name):
+                log.warning("SESSION: Profile '%s' for Account '%s' is defined in config but NOT FOUND in system's AWS profiles.", profile_name, account_id)
                 return None
-            return boto3.Session(profile_name=profile_name)
+            return profile_name
         else:
-            debug_print(f"SESSION: No profile mapping found for Account '{account_id}' in config.ACCOUNT_TO_PROFILE_MAPPING.")
-            return None
-    except Exception as e:
-        debug_print(f"SESSION: Error getting session for Account {account_id}: {e}")
-        return None
-
-def get_aws_session_for_iccid(iccid: str) -> boto3.Session | None:
-    """
-    Finds the correct AWS profile for a given ICCID and returns a boto3 Session.
-    """
-    try:
-        response = device_reg_table.get_item(Key={"ID": iccid, "Metadata": "ACCOUNTALLOCATION"})
-        item = response.get("Item")
-        if not item or not item.get("AccountID"):
-            debug_print(f"SESSION: No AccountID found for ICCID {iccid}")
+            log.debug("SESSION: No profile mapping found for Account '%s' in config.ACCOUNT_TO_PROFILE_MAPPING.", account_id)
             return None
-        
-        account_id = item["AccountID"]
-        return get_aws_session_for_account(account_id)
     except Exception as e:
-        debug_print(f"SESSION: Error getting session for ICCID {iccid}: {e}")
+        log.warning("SESSION: Error getting profile for Account %s: %s", account_id, e)
         return None
 
 def get_aws_profiles() -> List[str]:
@@ -1064,14 +1719,14 @@ def get_aws_profiles() -> List[str]:
     try:
         # Use a set to get all unique profile names from the mapping
         profiles = set(config.ACCOUNT_TO_PROFILE_MAPPING.values())
-        print(f"DEBUG: Returning AWS profiles from mapping: {profiles}")
+        log.debug("Returning AWS profiles from mapping: %s", profiles)
         return sorted(list(profiles))
     except AttributeError:
-        print("DEBUG: config.ACCOUNT_TO_PROFILE_MAPPING not found. Returning empty list.")
+        log.debug("config.ACCOUNT_TO_PROFILE_MAPPING not found. Returning empty list.")
         return []
     except Exception as e:
         # Log the error and return an empty list to prevent crashing
-        print(f"Error reading AWS profiles from config mapping: {e}")
+        log.warning("Error reading AWS profiles from config mapping: %s", e)
         return []
 
 # --- API Endpoints ---
@@ -1080,10 +1735,12 @@ def read_aws_profiles():
     return get_aws_profiles()
 
 @app.get("/api/handlers", response_model=List[str])
+@coalesced(lambda profile: (profile.strip(),))
+@in_pool("logs")
 def get_handlers(profile: str = Query(..., description="The AWS profile to use.")):
+    profile = profile.strip()
     try:
-        session = boto3.Session(profile_name=profile)
-        client = session.client("logs")
+        client = AWS_CLIENTS.client(profile, "logs")
         paginator = client.get_paginator("describe_log_groups")
         handler_names: Set[str] = set()
         handler_regex = re.compile(r'(\w+Handler)')
@@ -1096,35 +1753,53 @@ def get_handlers(profile: str = Query(..., description="The AWS profile to use."
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/search", response_model=List[LogResult])
-def search_logs(request: SearchRequest):
-    try:
-        session = boto3.Session(profile_name=request.profile)
-        client = session.client("logs")
-        log_group_search_string = request.handler
-        paginator = client.get_paginator("describe_log_groups")
-        log_group_names = []
-        for page in paginator.paginate():
-            for group in page["logGroups"]:
-                if log_group_search_string in group["logGroupName"]:
-                    log_group_names.append(group["logGroupName"])
-        if not log_group_names:
-            raise HTTPException(status_code=404, detail=f"No log groups found containing '{log_group_search_string}'")
-        query = f"""fields @timestamp, @message, @logStream, @log
+def start_log_search(request, limits=None):
+    """Finds the handler's log groups and starts the Logs Insights query. Returns (logs client, query id)."""
+    client = AWS_CLIENTS.client(request.profile, "logs", limits=limits)
+    log_group_search_string = request.handler
+    paginator = client.get_paginator("describe_log_groups")
+    log_group_names = []
+    for page in paginator.paginate():
+        for group in page["logGroups"]:
+            if log_group_search_string in group["logGroupName"]:
+                log_group_names.append(group["logGroupName"])
+    if not log_group_names:
+        raise HTTPException(status_code=404, detail=f"No log groups found containing '{log_group_search_string}'")
+    query = f"""fields @timestamp, @message, @logStream, @log
 | filter @message like /{request.search_term}/
 | sort @timestamp desc
 | limit 1000"""
-        start_query_response = client.start_query(
-            logGroupNames=log_group_names,
-            startTime=int(request.start_time.timestamp()),
-            endTime=int(request.end_time.timestamp()),
-            queryString=query,
-        )
-        query_id = start_query_response["queryId"]
+    start_query_response = client.start_query(
+        logGroupNames=log_group_names,
+        startTime=int(request.start_time.timestamp()),
+        endTime=int(request.end_time.timestamp()),
+        queryString=query,
+    )
+    return client, start_query_response["queryId"]
+
+@app.post("/api/search", response_model=List[LogResult])
+async def search_logs(request: SearchRequest, http_response: Response, deadline: Deadline = Depends(request_deadline)):
+    """
+    Runs a Logs Insights query. The AWS calls run on the "logs" pool; the one-second
+    polling waits run on the event loop, so a long query doesn't hold a thread while it waits.
+
+    If the deadline runs out first, the query is stopped and the results it had
+    found so far are returned, with an X-Partial-Results response header.
+    """
+    logs_pool = POOLS["logs"]
+    try:
+        client, query_id = await logs_pool.run(start_log_search, request, deadline_limits(deadline))
         response = None
         while response is None or response["status"] in ["Running", "Scheduled"]:
-            time.sleep(1)
-            response = client.get_query_results(queryId=query_id)
+            if response is not None and deadline.expired():
+                try:
+                    await logs_pool.run(client.stop_query, queryId=query_id)
+                except Exception as e:
+                    log.warning("SEARCH: Error stopping query %s: %s", query_id, e)
+                http_response.headers["X-Partial-Results"] = deadline.skipped_message(["rest of the log search"])
+                break
+            await asyncio.sleep(min(1, deadline.remaining()))
+            response = await logs_pool.run(client.get_query_results, queryId=query_id)
         results = []
         for record in response["results"]:
             result_item = {}
@@ -1138,10 +1813,10 @@ def search_logs(request: SearchRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/s3/list", response_model=List[S3Item])
+@in_pool("s3")
 def s3_list_items(bucket: str, prefix: str = ""):
     try:
-        session = boto3.Session(profile_name='gateway')
-        s3 = session.client("s3")
+        s3 = AWS_CLIENTS.client('gateway', "s3")
         paginator = s3.get_paginator("list_objects_v2")
         items = []
         for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
@@ -1154,42 +1829,41 @@ def s3_list_items(bucket: str, prefix: str = ""):
                 items.append(S3Item(name=os.path.basename(file_key), type="file", key=file_key))
         return items
     except ClientError as e:
-        debug_print(f"S3_LIST_ERROR: ClientError during s3_list_items: {e}")
+        log.warning("S3_LIST_ERROR: ClientError during s3_list_items: %s", e)
         if e.response['Error']['Code'] == 'AccessDenied':
             raise HTTPException(status_code=403, detail="Access Denied. Ensure the 'gateway' AWS profile has s3:ListBucket permissions.")
         else:
             raise HTTPException(status_code=500, detail=f"Boto3 ClientError: {e}")
     except Exception as e:
-        debug_print(f"S3_LIST_ERROR: Unexpected Exception during s3_list_items: {e}")
+        log.warning("S3_LIST_ERROR: Unexpected Exception during s3_list_items: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def decode_png_content(raw):
+    """
+    The image bytes of a label object: PNG bytes as they are, text as base64 (a
+    data URL or bare, whitespace ignored), anything else as it is.
+    """
+    if raw.startswith(b'\x89PNG\r\n\x1a\n'):
+        return raw
+    try:
+        text = raw.decode("utf-8", errors="strict").strip()
+    except UnicodeDecodeError:
+        return raw
+    if text.startswith("data:image/png;base64,"):
+        text = text.split(",", 1)[1].strip()
+    b64 = "".join(text.split())
+    try:
+        return base64.b64decode(b64, validate=True)
+    except (base64.binascii.Error, ValueError):
+        return base64.b64decode(b64, validate=False)
+
 @app.get("/api/s3/object", response_model=S3Object)
+@in_pool("s3")
 def s3_get_object(bucket: str, key: str):
     try:
-        session = boto3.Session(profile_name='gateway')
-        s3 = session.client("s3")
+        s3 = AWS_CLIENTS.client('gateway', "s3")
         obj = s3.get_object(Bucket=bucket, Key=key)
-        raw = obj["Body"].read()
-        
-        img_bytes = None
-        try:
-            text = raw.decode("utf-8", errors="strict").strip()
-        except UnicodeDecodeError:
-            text = None
-
-        if raw.startswith(b'\x89PNG\r\n\x1a\n'):
-            img_bytes = raw
-        elif text is not None:
-            if text.startswith("data:image/png;base64,"):
-                text = text.split(",", 1)[1].strip()
-            b64 = "".join(text.split())
-            try:
-                img_bytes = base64.b64decode(b64, validate=True)
-            except (base64.binascii.Error, ValueError):
-                img_bytes = base64.b64decode(b64, validate=False)
-        else:
-            img_bytes = raw
-
+        img_bytes = decode_png_content(obj["Body"].read())
         if not img_bytes:
             raise HTTPException(status_code=400, detail="Could not decode image content.")
 
@@ -1203,34 +1877,192 @@ def s3_get_object(bucket: str, key: str):
             last_modified=obj["LastModified"]
         )
     except ClientError as e:
-        debug_print(f"S3_OBJECT_ERROR: ClientError during s3_get_object: {e}")
+        log.warning("S3_OBJECT_ERROR: ClientError during s3_get_object: %s", e)
         if e.response['Error']['Code'] == 'AccessDenied':
             raise HTTPException(status_code=403, detail="Access Denied. Ensure the 'gateway' AWS profile has s3:GetObject permissions.")
         else:
             raise HTTPException(status_code=500, detail=f"Boto3 ClientError: {e}")
     except Exception as e:
-        debug_print(f"S3_OBJECT_ERROR: Unexpected Exception during s3_get_object: {e}")
+        log.warning("S3_OBJECT_ERROR: Unexpected Exception during s3_get_object: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/device_lookup", response_model=DeviceLookupResponse)
-def device_lookup(iccid: str = Query(..., description="The ICCID (device ID) to lookup.")):
+# Concurrent lookups of the same ICCID with the same time budget share the first one's result
+@coalesced(lambda iccid, fresh, profile, deadline: (iccid, fresh, profile, deadline.seconds))
+@in_pool("device")
+def device_lookup(
+    iccid: str = Query(..., description="The ICCID (device ID) to lookup."),
+    fresh: bool = Query(False, description="Bypass the lookup cache and fetch every section again."),
+    profile: bool = Query(False, description="Profile the lookup (all its threads) and return {result, profile} instead. Use with fresh=1."),
+    deadline: Deadline = Depends(request_deadline),
+):
     if not re.fullmatch(r"^[0-9]{19,20}$", iccid):
         raise HTTPException(status_code=400, detail="Invalid ICCID format. Must be 19 or 20 digits.")
     try:
-        # user_id=None as this is an API call, not Slack
-        return perform_device_lookup(iccid, user_id=None)
+        with request_profile(profile) as request_prof:
+            result = cached_device_lookup(iccid, fresh=fresh, deadline=deadline)
+        return profiled_response(result, request_prof) if request_prof else result
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        debug_print(f"Error in /api/device_lookup: {e}")
+        log.warning("Error in /api/device_lookup: %s", e)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred during device lookup: {str(e)}")
 
-@app.get("/api/person_lookup")
-def person_lookup(person_id: str = Query(..., description="The Person ID (UUID) to lookup.")):
+# Model each /api/device_lookup/stream section event is serialized with, as in DeviceLookupResponse
+DEVICE_LOOKUP_SECTION_MODELS = {
+    "general": GeneralInfo,
+    "registration": RegistrationInfo,
+    "heartbeat": HeartbeatInfo,
+    "iot": IoTInfo,
+}
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.get("/api/device_lookup/stream")
+async def device_lookup_stream(
+    iccid: str = Query(..., description="The ICCID (device ID) to lookup."),
+    fresh: bool = Query(False, description="Bypass the lookup cache and fetch every section again."),
+    deadline: Deadline = Depends(request_deadline),
+):
+    """
+    Device lookup as Server-Sent Events: one `general`, `registration`, `heartbeat`
+    and `iot` event each, sent as soon as that section is ready (cached sections
+    straight away), followed by a final `errors` event. Each event's data has the
+    same shape as the matching DeviceLookupResponse field.
+    """
+    if not re.fullmatch(r"^[0-9]{19,20}$", iccid):
+        raise HTTPException(status_code=400, detail="Invalid ICCID format. Must be 19 or 20 digits.")
+
+    loop = asyncio.get_running_loop()
+    sections_ready = asyncio.Queue()
+
+    def on_section(section, value, errors):
+        loop.call_soon_threadsafe(sections_ready.put_nowait, (section, value))
+
+    def run_lookup():
+        try:
+            return cached_device_lookup(iccid, fresh=fresh, on_section=on_section, deadline=deadline)
+        finally:
+            loop.call_soon_threadsafe(sections_ready.put_nowait, None)
+
+    async def events():
+        lookup = asyncio.ensure_future(POOLS["device"].run(run_lookup))
+        while (ready := await sections_ready.get()) is not None:
+            section, value = ready
+            model = DEVICE_LOOKUP_SECTION_MODELS[section]
+            yield sse_event(section, model(**value).model_dump(mode="json") if value is not None else None)
+        try:
+            errors = (await lookup)["errors"]
+        except Exception as e:
+            log.warning("Error in /api/device_lookup/stream: %s", e)
+            errors = [f"An unexpected error occurred during device lookup: {str(e)}"]
+        yield sse_event("errors", errors)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/device_lookup/batch")
+def device_lookup_batch(request: DeviceBatchLookupRequest):
+    """
+    Looks up many ICCIDs and streams the results back as NDJSON, one
+    DeviceLookupResponse object per line, in the order devices complete.
+    """
+    iccids = list(dict.fromkeys(iccid.strip() for iccid in request.iccids if iccid.strip()))
+    max_iccids = getattr(config, "DEVICE_BATCH_MAX_ICCIDS", 5000)
+    if not iccids:
+        raise HTTPException(status_code=400, detail="No ICCIDs provided.")
+    if len(iccids) > max_iccids:
+        raise HTTPException(status_code=400, detail=f"Too many ICCIDs. At most {max_iccids} can be looked up at once.")
+    invalid = [iccid for iccid in iccids if not re.fullmatch(r"^[0-9]{19,20}$", iccid)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid ICCID format (must be 19 or 20 digits): {', '.join(invalid[:20])}")
+
+    async def ndjson_lines():
+        # Each next() blocks until a device finishes, so pull results on the "device" pool
+        results = perform_batch_device_lookup(iccids)
+        while True:
+            item = await POOLS["device"].run(next, results, None)
+            if item is None:
+                break
+            iccid, result = item
+            if "error" in result:
+                result = {"general": {"iccid": iccid}, "errors": [result["error"]]}
+            yield DeviceLookupResponse(**result).model_dump_json() + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+HEARTBEAT_HISTORY_MAX_DAYS = getattr(config, "HEARTBEAT_HISTORY_MAX_DAYS", 31)
+
+# Rounding applied to the heartbeat history columns in the response
+HEARTBEAT_HISTORY_DECIMALS = {
+    "battery_percentage": 1, "portal_battery": 0, "battery_voltage": 1,
+    "lat": 6, "lng": 6, "hdop": 2, "ax": 3, "ay": 3, "az": 3,
+}
+
+@app.get("/api/device/{iccid}/heartbeats")
+@in_pool("device")
+def device_heartbeats(
+    iccid: str,
+    days: int = Query(7, ge=1, le=HEARTBEAT_HISTORY_MAX_DAYS, description="Number of days of heartbeats to return, counting today."),
+    max_points: Optional[int] = Query(None, ge=2, description="Downsample to at most this many points, averaged over equal time buckets."),
+):
+    """
+    Returns every heartbeat of a device in the window as columns
+    ({"timestamp": [...], "battery_percentage": [...], ...}, oldest first) rather
+    than one object per heartbeat, plus `portal_battery` and summary stats.
+    """
+    if not re.fullmatch(r"^[0-9]{19,20}$", iccid):
+        raise HTTPException(status_code=400, detail="Invalid ICCID format. Must be 19 or 20 digits.")
     try:
-        return perform_person_lookup(person_id)
+        item = lookup_account_allocation(iccid)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Error checking registration: {str(e)}")
+    account_id = item.get("AccountID") if item else None
+    clients = build_account_clients(account_id) if account_id else None
+    if not clients:
+        raise HTTPException(status_code=404, detail="Device registration not found or AWS profile could not be determined.")
+    bucket_name = find_iotbackup_bucket(clients["s3"], account_id)
+    if not bucket_name:
+        raise HTTPException(status_code=404, detail="No iotbackup bucket found for the device's account.")
+
+    keys, truncated = list_heartbeat_keys(
+        clients["s3"], bucket_name, iccid, days, getattr(config, "HEARTBEAT_HISTORY_MAX_OBJECTS", 20000)
+    )
+    heartbeats, failed_keys = fetch_heartbeat_history(clients["s3"], bucket_name, keys)
+
+    # NumPy is only needed here, so it isn't imported at startup
+    from .heartbeat_history import heartbeat_columns, portal_battery_array, downsample_columns, summarize_columns, columns_to_json
+    columns = heartbeat_columns(heartbeats)
+    if BATTERY_WEIGHTINGS_DATA is None:
+        load_battery_weightings()
+    columns["portal_battery"] = portal_battery_array(columns["battery_percentage"], BATTERY_WEIGHTINGS_DATA)
+    stats = summarize_columns(columns)
+    downsampled = max_points is not None and len(columns["timestamp"]) > max_points
+    columns = downsample_columns(columns, max_points)
+
+    errors = []
+    if truncated:
+        errors.append(f"More than {len(keys)} heartbeats in the window; only the newest {len(keys)} were fetched.")
+    if failed_keys:
+        errors.append(f"{len(failed_keys)} heartbeat object(s) could not be downloaded or decoded.")
+
+    payload = {
+        "iccid": iccid,
+        "days": days,
+        "downsampled": downsampled,
+        "stats": stats,
+        "columns": columns_to_json(columns, HEARTBEAT_HISTORY_DECIMALS),
+        "errors": errors,
+    }
+    # Columns can hold tens of thousands of values, so skip FastAPI's per-item encoding and pretty separators
+    return Response(content=json.dumps(payload, separators=(",", ":")), media_type="application/json")
 
 @app.post("/api/set_person_enabled_status")
+@in_pool("accounts")
 def set_person_enabled_status(request: SetPersonEnabledRequest):
     """
     Enables or disables a Cognito user.
@@ -1238,7 +2070,7 @@ def set_person_enabled_status(request: SetPersonEnabledRequest):
     # Find the account ID from the person ID
     account_id = None
     try:
-        response = pat_labels_table.query(
+        response = pat_labels_table().query(
             IndexName="PersonID-index",
             KeyConditionExpression=boto3.dynamodb.conditions.Key("PersonID").eq(request.person_id)
         )
@@ -1251,19 +2083,18 @@ def set_person_enabled_status(request: SetPersonEnabledRequest):
     if not account_id:
         raise HTTPException(status_code=404, detail="Person not found or no account associated.")
 
-    # Get the session for that account
-    session = get_aws_session_for_account(account_id)
-    if not session:
+    # Get the profile for that account
+    profile = get_aws_profile_for_account(account_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="Could not determine AWS profile for the account.")
+    cognito_client = AWS_CLIENTS.client(profile, "cognito-idp")
 
     # Find the user pool
-    user_pool_id = find_customer_user_pool_id(session)
+    user_pool_id = find_customer_user_pool_id(cognito_client, account_id)
     if not user_pool_id:
         raise HTTPException(status_code=404, detail="No 'Customer' Cognito User Pool found for account.")
 
     try:
-        cognito_client = session.client("cognito-idp")
-        
         if request.enabled:
             cognito_client.admin_enable_user(
                 UserPoolId=user_pool_id,
@@ -1277,46 +2108,59 @@ def set_person_enabled_status(request: SetPersonEnabledRequest):
             )
             message = f"Successfully disabled user {request.person_id}."
         
-        debug_print(f"PERSON ENABLE/DISABLE: {message}")
+        log.info("PERSON ENABLE/DISABLE: %s", message)
         return {"message": message}
 
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ClientError as e:
-        debug_print(f"PERSON ENABLE/DISABLE ERROR: {e}")
+        log.warning("PERSON ENABLE/DISABLE ERROR: %s", e)
         raise HTTPException(status_code=500, detail=f"AWS Error: {e}")
     except Exception as e:
-        debug_print(f"PERSON ENABLE/DISABLE ERROR: {e}")
+        log.warning("PERSON ENABLE/DISABLE ERROR: %s", e)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
 @app.post("/api/update_shadow")
+@in_pool("device")
 def update_shadow(request: ShadowUpdateRequest):
     """
     Updates the 'desired' state of a Thing's shadow.
     """
-    session = get_aws_session_for_iccid(request.iccid)
-    if not session:
+    account_id = None
+    try:
+        item = lookup_account_allocation(request.iccid)
+        account_id = item.get("AccountID") if item else None
+    except Exception as e:
+        log.warning("SESSION: Error getting account for ICCID %s: %s", request.iccid, e)
+    profile = get_aws_profile_for_account(account_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="Device registration not found or AWS profile could not be determined.")
 
     try:
-        iot_data_client = session.client("iot-data", region_name='eu-west-1')
+        iot_data_client = iot_data_client_for_account(profile, AWS_CLIENTS.client(profile, "iot", region='eu-west-1'), account_id)
         
         # The payload for update_thing_shadow must be a JSON string
         payload = {"state": {"desired": request.desired_state}}
         
-        debug_print(f"SHADOW UPDATE: Thing={request.iccid}, Payload={json.dumps(payload)}")
+        log.info("SHADOW UPDATE: Thing=%s, Payload=%s", request.iccid, json.dumps(payload))
 
         iot_data_client.update_thing_shadow(
             thingName=request.iccid,
             payload=json.dumps(payload)
         )
+        # The next lookup must show the new shadow rather than a cached one
+        device_lookup_cache.invalidate(request.iccid, ["iot"])
         
         return {"message": "Shadow update request sent successfully."}
 
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ClientError as e:
-        debug_print(f"SHADOW UPDATE ERROR: {e}")
+        log.warning("SHADOW UPDATE ERROR: %s", e)
         raise HTTPException(status_code=500, detail=f"AWS Error: {e}")
     except Exception as e:
-        debug_print(f"SHADOW UPDATE ERROR: {e}")
+        log.warning("SHADOW UPDATE ERROR: %s", e)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
@@ -1342,8 +2186,8 @@ async def split_csv_file(
             raise HTTPException(status_code=500, detail=f"Could not save uploaded file: {e}")
 
         try:
-            # Call the splitting and zipping logic
-            final_zip_path = split_csv_and_zip(input_csv_path, rows_per_chunk, temp_path)
+            # Call the splitting and zipping logic (CPU and disk bound, so off the event loop)
+            final_zip_path = await POOLS["files"].run(split_csv_and_zip, input_csv_path, rows_per_chunk, temp_path)
 
             # Read the generated zip file into a BytesIO object
             zip_file_content = io.BytesIO()
@@ -1361,8 +2205,182 @@ async def split_csv_file(
             raise HTTPException(status_code=500, detail=f"CSV splitting failed: {e}")
 
 
-@app.get("/health")
+@app.get("/api/admin/discovery-cache")
+def get_discovery_cache():
+    """
+    Shows the cached per-account discovery results (iotbackup bucket, Customer user pool, IoT data endpoint).
+    """
+    return {"ttl_seconds": discovery_cache.ttl_seconds, "accounts": discovery_cache.snapshot()}
+
 
-def read_root():
+@app.post("/api/admin/discovery-cache/invalidate")
+def invalidate_discovery_cache(account_id: str | None = Query(None, description="Only invalidate this account. Omit to invalidate all accounts.")):
+    """
+    Forgets cached discovery results so they are looked up again on next use.
+    """
+    removed = discovery_cache.invalidate(account_id)
+    return {"message": f"Invalidated {removed} cached discovery entries."}
+
+
+@app.get("/api/admin/circuit-breakers")
+async def get_circuit_breakers():
+    """
+    State of every AWS circuit breaker, by (account, service): closed, open or
+    half_open, calls and failures in the current window, and seconds until an
+    open breaker lets a probe call through.
+    """
+    return {"settings": CIRCUIT_BREAKERS.settings, "breakers": CIRCUIT_BREAKERS.stats()}
+
+
+@app.post("/api/admin/circuit-breakers/reset")
+async def reset_circuit_breakers(
+    account: str | None = Query(None, description="Only reset this account's breakers. Omit for all accounts."),
+    service: str | None = Query(None, description="Only reset this service's breakers (e.g. s3, iot, cognito-idp)."),
+):
+    """Closes breakers straight away, e.g. after refreshing an account's credentials."""
+    reset = CIRCUIT_BREAKERS.reset(account, service)
+    return {"message": f"Reset {reset} circuit breakers."}
+
+
+@app.get("/api/admin/rate-limits")
+async def get_rate_limits():
+    """
+    Current outbound rate of every AWS (account, service, operation) token bucket,
+    with its ceiling, calls, throttling responses seen and total time calls waited.
+    """
+    return {"max_rates": RATE_LIMITS.max_rates, "settings": RATE_LIMITS.settings, "buckets": RATE_LIMITS.stats()}
+
+
+@app.get("/api/admin/reports")
+async def get_report_schedule():
+    """
+    The background report jobs: interval, when the stored result was generated,
+    how long the last run took, its error if any and the next scheduled run.
+    """
+    return REPORTS.stats()
+
+
+@app.get("/api/admin/profile/cpu")
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, le=120, description="How long to sample for."),
+    interval_ms: float = Query(5, ge=1, le=1000, description="Time between samples."),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$", description="collapsed (flamegraph.pl) or speedscope JSON."),
+    include_idle: bool = Query(False, description="Keep samples of threads that are only waiting (idle workers, select)."),
+):
+    """
+    Samples the stacks of every thread for `seconds` and returns them as collapsed
+    stacks or a speedscope profile. Stacks are rooted at the thread name
+    (endpoint-device_0, device-lookup_3...). One profile runs at a time.
+    """
+    interval = interval_ms / 1000
+    try:
+        stacks, _ = await anyio.to_thread.run_sync(sample_cpu, seconds, interval, include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "speedscope":
+        return speedscope(stacks, interval)
+    return PlainTextResponse(collapsed(stacks))
+
+
+@app.get("/api/admin/profile/memory")
+async def profile_memory(
+    seconds: float = Query(10, gt=0, le=300, description="Time between the two snapshots."),
+    top: int = Query(25, ge=1, le=500, description="How many allocation sites to return."),
+):
+    """
+    Memory growth over `seconds`: RSS before and after, and the `top` allocation
+    sites by growth between two tracemalloc snapshots. Allocations are slower
+    while this runs.
+    """
+    try:
+        return await anyio.to_thread.run_sync(memory_diff, seconds, top)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/api/admin/traces")
+async def get_recent_traces(limit: int = Query(50, ge=1, le=1000, description="How many of the most recent traces to list.")):
+    """The most recent request traces, newest first, without their spans."""
+    return [trace.to_dict(include_spans=False) for trace in TRACES.recent(limit)]
+
+
+@app.get("/api/admin/traces/{request_id}")
+async def get_trace(request_id: str):
+    """
+    The span tree of a recent request, by the X-Request-ID it was answered with:
+    its phases and every AWS call, each with start offset, duration, thread and
+    the call's bucket/prefix/key or thing.
+    """
+    trace = TRACES.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No trace for request {request_id} (it may have been evicted).")
+    return trace.to_dict()
+
+
+@app.get("/api/admin/pools")
+async def get_pool_stats():
+    """
+    Size, running and queued calls for each endpoint pool, the worker pools lookups
+    fan out onto, Starlette's default threadpool (which serves the remaining sync endpoints),
+    the cached AWS clients, the requests single-flight has coalesced and the log queue.
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter_stats = limiter.statistics()
+    return {
+        "endpoint_pools": {name: pool.stats() for name, pool in POOLS.items()},
+        "worker_pools": {
+            "lookup": executor_stats(lookup_executor),
+            "batch": executor_stats(batch_executor),
+            "day_probe": executor_stats(day_probe_executor),
+            "heartbeat_fetch": executor_stats(heartbeat_fetch_executor),
+            "cache_refresh": executor_stats(cache_refresh_executor),
+        },
+        "default_threadpool": {
+            "max_workers": int(limiter.total_tokens),
+            "active": limiter_stats.borrowed_tokens,
+            "queued": limiter_stats.tasks_waiting,
+        },
+        "aws_clients": AWS_CLIENTS.stats(),
+        "single_flight": SINGLE_FLIGHT.stats(),
+        "logging": logging_stats(),
+    }
+
+
+def prewarm_account(account_id):
+    """Builds an account's clients and fills its discovery cache entries (data endpoint, iotbackup bucket, user pool)."""
+    clients = build_account_clients(account_id)
+    if not clients:
+        raise RuntimeError("no usable AWS profile")
+    find_iotbackup_bucket(clients["s3"], account_id)
+    find_customer_user_pool_id(AWS_CLIENTS.client(get_aws_profile_for_account(account_id), "cognito-idp"), account_id)
+
+def start_prewarm():
+    """
+    Prewarms every account in ACCOUNT_TO_PROFILE_MAPPING, plus the dev/gateway
+    tables, concurrently in the background. Startup doesn't wait for it; the
+    first lookups just find more of their clients and discovery data ready.
+    """
+    started = time.time()
+    executor = ThreadPoolExecutor(max_workers=getattr(config, "PREWARM_WORKERS", 8), thread_name_prefix="prewarm")
+    futures = {executor.submit(prewarm_account, account_id): account_id for account_id in config.ACCOUNT_TO_PROFILE_MAPPING}
+    futures[executor.submit(lambda: (refurb_table(), device_reg_table(), pat_labels_table(), dev_s3_client(), account_mapping()))] = "base"
+
+    def report(_):
+        failed = {name: future.exception() for future, name in futures.items() if future.exception()}
+        for name, error in failed.items():
+            log.warning("PREWARM: %s failed: %s", name, error)
+        log.info("PREWARM: %s/%s done in %.2fs", len(futures) - len(failed), len(futures), time.time() - started)
+        executor.shutdown(wait=False)
+
+    when_all_done(*futures).add_done_callback(report)
 
+@app.get("/metrics")
+async def get_metrics():
+    """Route latencies, in-flight requests and AWS call counts, latencies, retries and errors, in Prometheus' text format."""
+    body, content_type = latest_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/health")
+async def read_root():
     return {"status": "ok"}
@@ -0,0 +1,127 @@
+"""
+Prometheus metrics for the backend, served by GET /metrics.
+
+- Per route: request latency histogram (by method, route template and status)
+  and an in-flight gauge, recorded by MetricsMiddleware.
+- Per AWS (service, operation, account): calls, latency, retries and error
+  codes, recorded through botocore's before-call / after-call /
+  after-call-error events (see instrument_aws_client), so every boto3 call
+  is covered without touching its call site.
+"""
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "webtools_http_request_duration_seconds",
+    "Time to serve a request, until the last byte of the response body was sent.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "webtools_http_requests_in_flight",
+    "Requests being served right now.",
+    ["method", "route"],
+)
+AWS_CALLS = Counter(
+    "webtools_aws_calls_total",
+    "AWS API calls made (one per boto3 call, retries not counted separately).",
+    ["service", "operation", "account"],
+)
+AWS_CALL_SECONDS = Histogram(
+    "webtools_aws_call_duration_seconds",
+    "Time an AWS API call took, retries and rate-limit waits included.",
+    ["service", "operation", "account"],
+    buckets=LATENCY_BUCKETS,
+)
+AWS_CALL_RETRIES = Counter(
+    "webtools_aws_call_retries_total",
+    "Retried attempts botocore made on top of the first attempt.",
+    ["service", "operation", "account"],
+)
+AWS_CALL_ERRORS = Counter(
+    "webtools_aws_call_errors_total",
+    "AWS API calls that failed, by AWS error code or exception class.",
+    ["service", "operation", "account", "code"],
+)
+
+
+def latest():
+    """The current metrics in Prometheus' text format, as (body, content_type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def instrument_aws_client(client, account, service):
+    """Records every call `client` makes under (service, operation, account)."""
+
+    def before_call(context=None, **kwargs):
+        context["metrics_started"] = time.perf_counter()
+
+    def finish(event_name, context, code):
+        started = context.pop("metrics_started", None)
+        labels = (service, event_name.rsplit(".", 1)[-1], account)
+        AWS_CALLS.labels(*labels).inc()
+        if started is not None:
+            AWS_CALL_SECONDS.labels(*labels).observe(time.perf_counter() - started)
+        attempts = context.get("retries", {}).get("attempt", 1)
+        if attempts > 1:
+            AWS_CALL_RETRIES.labels(*labels).inc(attempts - 1)
+        if code:
+            AWS_CALL_ERRORS.labels(*labels, code).inc()
+
+    def after_call(event_name=None, http_response=None, parsed=None, context=None, **kwargs):
+        code = None
+        if http_response is not None and http_response.status_code >= 300:
+            code = (parsed or {}).get("Error", {}).get("Code") or str(http_response.status_code)
+        finish(event_name, context, code)
+
+    def after_call_error(event_name=None, exception=None, context=None, **kwargs):
+        finish(event_name, context, type(exception).__name__)
+
+    client.meta.events.register("before-call", before_call)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+
+
+def route_template(routes, scope):
+    """The path template ("/api/device/{iccid}/heartbeats") of the route `scope` is for, so labels stay bounded."""
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path  # path matches but the method doesn't (405)
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and in-flight requests per route. Streaming responses are timed to their end."""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        route = route_template(self.routes, scope)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(method, route, str(status[0])).observe(time.perf_counter() - started)
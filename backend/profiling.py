@@ -0,0 +1,259 @@
+"""
+On-demand profiling of a running backend, stdlib only.
+
+- sample_cpu(): a sampling CPU profiler. A thread reads every other thread's
+  stack (sys._current_frames) at a fixed interval for N seconds; the result is
+  returned as collapsed stacks (flamegraph.pl / speedscope import) or
+  speedscope JSON.
+- memory_diff(): a tracemalloc snapshot diff between now and N seconds later,
+  grouped by allocation site.
+- request_profile(): deterministic cProfile of one request (`?profile=1`),
+  including the work it hands to ContextThreadPoolExecutor pools.
+
+One profile of any kind runs at a time; the others raise ProfilerBusy.
+"""
+import contextvars
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# Leaf functions of threads that are just waiting (idle pool workers, the event loop in select...)
+IDLE_FUNCTIONS = frozenset({"wait", "select", "poll", "epoll", "get", "_worker", "accept", "sleep", "_wait_for_tstate_lock"})
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py", "socket.py")
+
+_profiling_lock = threading.Lock()
+
+# From Python 3.12 cProfile hooks sys.monitoring, which is process-wide: one enabled
+# Profile sees every thread, and enabling a second one raises ValueError
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame):
+    return frame.f_code.co_name in IDLE_FUNCTIONS and frame.f_code.co_filename.endswith(IDLE_FILES)
+
+
+def sample_cpu(seconds, interval=0.005, include_idle=False):
+    """
+    Samples every thread's stack each `interval` seconds for `seconds`. Returns
+    ({(thread name, frame name, ...): samples}, samples taken). Raises ProfilerBusy
+    if another profile is running.
+    """
+    if not _profiling_lock.acquire(blocking=False):
+        raise ProfilerBusy("Another profile is already running")
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        ticks = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not include_idle and _is_idle(frame)):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame.f_code))
+                    frame = frame.f_back
+                stacks[(names.get(ident, str(ident)), *reversed(stack))] += 1
+            ticks += 1
+            time.sleep(interval)
+        return stacks, ticks
+    finally:
+        _profiling_lock.release()
+
+
+def collapsed(stacks):
+    """Brendan Gregg's collapsed-stack format: "thread;outer;...;leaf count" per line."""
+    return "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def speedscope(stacks, interval, name="webtools backend"):
+    """A speedscope.app "sampled" profile; weights are milliseconds."""
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, count in stacks.items():
+        sample = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame})
+            sample.append(index[frame])
+        samples.append(sample)
+        weights.append(count * interval * 1000)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "webtools backend profiling",
+    }
+
+
+def rss_bytes():
+    """Current resident set size (Linux), or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def memory_diff(seconds, top=25, frames=10):
+    """
+    Allocation growth over `seconds`: a tracemalloc snapshot now and one at the end,
+    compared by allocation site. tracemalloc is started for the duration if it
+    isn't tracing already (it slows allocations down while it is).
+    """
+    if not _profiling_lock.acquire(blocking=False):
+        raise ProfilerBusy("Another profile is already running")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(frames)
+        rss_before = rss_bytes()
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        rss_after = rss_bytes()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "seconds": seconds,
+            "rss_before": rss_before,
+            "rss_after": rss_after,
+            "traced_current": current,
+            "traced_peak": peak,
+            "top": [
+                {
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                    "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                }
+                for stat in stats[:top]
+            ],
+        }
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _profiling_lock.release()
+
+
+class RequestProfile:
+    """cProfile profiles of every thread that worked on one request, merged on demand."""
+
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self.profiles.append(profile)
+
+    def summary(self, top=40):
+        """The `top` functions by cumulative time, summed over the request's threads."""
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return {"threads": 0, "total_calls": 0, "functions": []}
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        return {
+            "threads": len(profiles),
+            "total_calls": stats.total_calls,
+            "functions": [
+                {
+                    "function": f"{name} ({os.path.basename(filename)}:{line})",
+                    "calls": calls,
+                    "own_ms": round(own * 1000, 2),
+                    "cumulative_ms": round(cumulative * 1000, 2),
+                }
+                for (filename, line, name), (_, calls, own, cumulative, _) in rows
+            ],
+        }
+
+
+_request_profile = contextvars.ContextVar("request_profile", default=None)
+
+
+def run_profiled(fn, *args, **kwargs):
+    """
+    Runs `fn` under its own cProfile if the current request is being profiled and
+    profilers are per thread (before 3.12). Otherwise the request's profiler, if
+    any, already sees this thread.
+    """
+    request = _request_profile.get()
+    if request is None or PROCESS_WIDE_CPROFILE or sys.getprofile() is not None:
+        return fn(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:  # another profiling tool is active
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.disable()
+        request.add(profile)
+
+
+@contextmanager
+def request_profile(enabled=True):
+    """
+    Profiles the block, and the pool tasks it submits, when `enabled`. Yields the
+    RequestProfile (None when not enabled). Pool tasks still running when the block
+    ends aren't included. From Python 3.12 the one profiler covers every thread of
+    the process, so work of other requests running meanwhile is included too.
+    Raises ProfilerBusy if another profile is running.
+    """
+    if not enabled:
+        yield None
+        return
+    if not _profiling_lock.acquire(blocking=False):
+        raise ProfilerBusy("Another profile is already running")
+    try:
+        request = RequestProfile()
+        profile = cProfile.Profile() if PROCESS_WIDE_CPROFILE or sys.getprofile() is None else None
+        if profile:
+            try:
+                profile.enable()
+            except ValueError as e:  # e.g. a debugger or coverage tool holds sys.monitoring
+                raise ProfilerBusy(str(e))
+        token = _request_profile.set(request)
+        try:
+            yield request
+        finally:
+            _request_profile.reset(token)
+            if profile:
+                profile.disable()
+                request.add(profile)
+    finally:
+        _profiling_lock.release()
@@ -0,0 +1,153 @@
+"""
+Adaptive outbound rate limits for AWS calls, one token bucket per
+(account, service, operation).
+
+Each HTTP attempt a client sends, retries included, takes a token first
+(botocore before-send event). A throttling answer (ThrottlingException,
+SlowDown, 429...) halves that bucket's rate, and every successful answer
+raises it a little, additive-increase/multiplicative-decrease style, so the
+backend settles just under what AWS lets each account do instead of
+retrying into the limit.
+"""
+import threading
+import time
+
+THROTTLING_ERROR_CODES = frozenset({
+    "Throttling", "ThrottlingException", "ThrottledException", "TooManyRequestsException",
+    "RequestLimitExceeded", "SlowDown", "ProvisionedThroughputExceededException",
+    "RequestThrottled", "RequestThrottledException", "LimitExceededException",
+})
+
+
+class OutboundRateLimited(Exception):
+    """Raised when a call would have to wait longer than `max_wait` for a token."""
+
+    # Our own back-pressure, not a sign that AWS is failing (see circuit_breakers)
+    breaker_neutral = True
+
+
+class AdaptiveTokenBucket:
+    def __init__(self, max_rate, min_rate=1.0, decrease=0.5, increase=1.0):
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.decrease = decrease
+        self.increase = increase
+        self.rate = self.max_rate
+        self.tokens = self.max_rate
+        self.calls = 0
+        self.throttles = 0
+        self.waited_seconds = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Caller holds self._lock. Burst capacity is one second's worth of calls.
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, max_wait):
+        """Takes a token, sleeping until one is available. Raises OutboundRateLimited after `max_wait` seconds."""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    self.waited_seconds += now - start
+                    return now - start
+                wait = (1 - self.tokens) / self.rate
+            if now + wait - start > max_wait:
+                raise OutboundRateLimited(f"waited {now - start:.1f}s for an outbound AWS call slot (rate {self.rate:.1f}/s)")
+            time.sleep(wait)
+
+    def on_throttled(self):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, self.rate)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                # +`increase` calls/s for roughly every second's worth of successful calls
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "max_rate": self.max_rate,
+                "calls": self.calls,
+                "throttles": self.throttles,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+class OutboundRateLimits:
+    """
+    The token buckets by (account, service, operation), created on first use.
+    `max_rates` is {service: calls per second} with a "default" entry;
+    `settings` holds min_rate, decrease, increase and max_wait.
+    """
+
+    def __init__(self, max_rates=None, **settings):
+        self.max_rates = {"default": 50, **(max_rates or {})}
+        self.settings = {"min_rate": 1.0, "decrease": 0.5, "increase": 1.0, "max_wait": 5.0, **settings}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_rates=None, **settings):
+        """Changes the limits new buckets are created with."""
+        if max_rates:
+            self.max_rates.update(max_rates)
+        self.settings.update(settings)
+
+    def bucket(self, account, service, operation):
+        key = (account, service, operation)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = AdaptiveTokenBucket(
+                        self.max_rates.get(service, self.max_rates["default"]),
+                        min_rate=self.settings["min_rate"],
+                        decrease=self.settings["decrease"],
+                        increase=self.settings["increase"],
+                    )
+        return bucket
+
+    def instrument(self, client, account, service):
+        """Makes every HTTP attempt `client` sends take a token from its (account, service, operation) bucket."""
+
+        def operation_of(event_name):
+            return event_name.rsplit(".", 1)[-1]
+
+        def before_send(event_name=None, **kwargs):
+            self.bucket(account, service, operation_of(event_name)).acquire(self.settings["max_wait"])
+
+        def response_received(event_name=None, parsed_response=None, response_dict=None, **kwargs):
+            bucket = self.bucket(account, service, operation_of(event_name))
+            code = (parsed_response or {}).get("Error", {}).get("Code")
+            status = (response_dict or {}).get("status_code")
+            if code in THROTTLING_ERROR_CODES or status == 429:
+                bucket.on_throttled()
+            elif parsed_response is not None and status is not None and status < 400:
+                bucket.on_success()
+
+        client.meta.events.register("before-send", before_send)
+        client.meta.events.register("response-received", response_received)
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return [
+            {"account": account, "service": service, "operation": operation, **bucket.stats()}
+            for (account, service, operation), bucket in sorted(buckets.items())
+        ]
+
+
+# Buckets are per account, so all of an account's clients draw on the same tokens
+RATE_LIMITS = OutboundRateLimits()
@@ -0,0 +1,135 @@
+"""
+Background precomputation of slow reports (label counts, refurb stats).
+
+Each job has an interval in seconds and runs on wall-clock multiples of it,
+cron style: a 300 s job runs at :00, :05, :10... past the hour. Its latest
+result is stored with the time it was generated, and endpoints serve that
+stored copy instead of computing the report per request.
+
+A job can also have a `version` callable (e.g. today's date). A stored result
+is only served while the version it was computed for is still current, so a
+"today" report never outlives its day.
+"""
+import threading
+import time
+from datetime import datetime
+
+from .app_logging import log
+from .single_flight import SINGLE_FLIGHT
+
+
+class ReportJob:
+    def __init__(self, name, compute, interval, version=None, keep=None):
+        self.name = name
+        self.compute = compute
+        self.interval = interval  # seconds; 0/None = no background runs
+        self.version = version or (lambda: None)
+        self.keep = keep or (lambda result: True)  # whether a result may be stored
+        self.result = None
+        self.result_version = None
+        self.generated_at = None
+        self.duration = None
+        self.runs = 0
+        self.last_error = None
+        self.next_run = None
+
+    def stored(self):
+        """The stored (result, generated_at), or None if there isn't a current one (or the job isn't scheduled)."""
+        if not self.interval or self.generated_at is None or self.result_version != self.version():
+            return None
+        return self.result, self.generated_at
+
+    def schedule_next(self, now):
+        self.next_run = (now // self.interval + 1) * self.interval if self.interval else None
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "generated_at": self.generated_at,
+            "duration": round(self.duration, 3) if self.duration is not None else None,
+            "runs": self.runs,
+            "last_error": self.last_error,
+            "next_run": datetime.fromtimestamp(self.next_run).strftime("%Y-%m-%d %H:%M:%S") if self.next_run else None,
+        }
+
+
+class ReportScheduler:
+    def __init__(self):
+        self.jobs = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add_job(self, name, compute, interval, version=None, keep=None):
+        self.jobs[name] = ReportJob(name, compute, interval, version, keep)
+
+    def run(self, name):
+        """
+        Computes job `name` now (joining a run already in flight) and stores the result.
+        Returns (result, generated_at). Exceptions propagate; the previous result stays stored.
+        """
+        return SINGLE_FLIGHT.do(("report", name), self._run, self.jobs[name])
+
+    def _run(self, job):
+        version = job.version()
+        started = time.time()
+        try:
+            result = job.compute()
+        except Exception as e:
+            job.last_error = f"{type(e).__name__}: {e}"
+            raise
+        generated_at = datetime.fromtimestamp(started).strftime("%Y-%m-%d %H:%M:%S")
+        job.duration = time.time() - started
+        job.runs += 1
+        if job.keep(result):
+            job.result, job.result_version, job.generated_at = result, version, generated_at
+            job.last_error = None
+        else:
+            job.last_error = f"result not stored: {str(result)[:200]}"
+        return result, generated_at
+
+    def get(self, name, refresh=False):
+        """
+        The stored result of job `name` as (result, generated_at). Computes it instead
+        with `refresh`, when there's no current one, or when the scheduler isn't running
+        (nothing would keep a stored result up to date).
+        """
+        stored = None if refresh or not self.running() else self.jobs[name].stored()
+        return stored or self.run(name)
+
+    def _loop(self):
+        now = time.time()
+        for job in self.jobs.values():
+            # First run straight away, so the stores are filled soon after startup
+            job.next_run = now if job.interval else None
+        while not self._stop.is_set():
+            due = [job for job in self.jobs.values() if job.next_run is not None and job.next_run <= time.time()]
+            for job in due:
+                try:
+                    self.run(job.name)
+                except Exception as e:
+                    log.warning("Scheduled report '%s' failed: %s", job.name, e)
+                job.schedule_next(time.time())
+            pending = [job.next_run for job in self.jobs.values() if job.next_run is not None]
+            if not pending:
+                return
+            self._stop.wait(max(0.0, min(pending) - time.time()))
+
+    def start(self):
+        """Starts the background thread that runs jobs with an interval (no-op if already running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="report-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        return {
+            "running": self.running(),
+            "jobs": {name: job.stats() for name, job in self.jobs.items()},
+        }
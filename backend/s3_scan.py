@@ -0,0 +1,143 @@
+"""
+S3 listing primitives shared by the backend and the GOD-Tool Slack daemon
+(python_scripts/v2), which imports this module directly from the backend
+directory. Keep it free of relative imports and backend config.
+"""
+import heapq
+import threading
+from concurrent.futures import Future
+
+
+def keys_under_prefix(s3_client, bucket_name, prefix, stop_event=None):
+    """Yields every key under `prefix` in listing order, page by page. Stops early once `stop_event` is set."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        if stop_event is not None and stop_event.is_set():
+            return
+        for obj in page.get('Contents', ()):
+            yield obj['Key']
+
+
+def message_path_of(relative_key):
+    """
+    Returns the message path a key belongs to, given the key relative to a
+    device's version prefix: 'heartbeat/push/<file>' -> 'heartbeat/push/'.
+    Keys that aren't at least two folders deep are grouped under their own
+    folder (or '' for files directly under the prefix).
+    """
+    parts = relative_key.split('/', 2)
+    if len(parts) < 3:
+        return parts[0] + '/' if len(parts) == 2 else ''
+    return f"{parts[0]}/{parts[1]}/"
+
+
+def latest_keys_by_message_path(s3_client, bucket_name, prefix, top_n=1, stop_event=None):
+    """
+    Lists `prefix` once and returns {message_path: [keys]} with the `top_n`
+    greatest keys per message path (see message_path_of), greatest first.
+
+    Pages are streamed and only the running top-N per message path is kept,
+    so a day with thousands of objects never builds a full key list. Stops
+    paginating early once `stop_event` is set, like keys_under_prefix. AWS
+    errors are raised to the caller.
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    tops = {}  # message_path -> min-heap of the greatest keys seen so far
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        if stop_event is not None and stop_event.is_set():
+            break
+        for obj in page.get('Contents', ()):
+            key = obj['Key']
+            top = tops.setdefault(message_path_of(key[len(prefix):]), [])
+            if len(top) < top_n:
+                heapq.heappush(top, key)
+            elif key > top[0]:
+                heapq.heapreplace(top, key)
+    return {path: sorted(top, reverse=True) for path, top in tops.items()}
+
+
+def device_day_prefix(date_str, box_id):
+    """Returns a device's version prefix for a YYYY-MM-DD day in the iotbackup bucket."""
+    year, month, day = date_str.split('-')
+    return f"{year}/{month}/{day}/Inovia/dev/LittleTheo/{box_id}/v1-0/"
+
+
+class DeviceHistoryScanner:
+    """
+    Lists a device's `{date}/Inovia/dev/LittleTheo/{box_id}/v1-0/` day prefixes
+    at most once each and sorts the keys by message path, so the registration
+    and heartbeat walks (and any other message type) share one listing per day
+    instead of each listing their own `{kind}/push/` prefix.
+
+    Day listings are futures keyed by date. With an `executor`, walks can list
+    days ahead of the one they're on; without one, each day is listed in the
+    thread that first asks for it. A listing that fails is logged through
+    `log` and treated as an empty day, like the per-kind walks did; the last
+    such error is kept in `listing_error`, so a walk that found nothing can
+    tell "no objects" from "couldn't list every day".
+
+    Call close() once every walk using the scanner is done, to cancel queued
+    listings and stop in-flight ones at their next page.
+    """
+
+    def __init__(self, s3_client, bucket_name, box_id, executor=None, log=None):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.box_id = box_id
+        self.executor = executor
+        self.log = log
+        self.listing_error = None
+        self._days = {}  # date_str -> Future of {message_path: [keys]}
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def day_listing(self, date_str, run_now=False):
+        """
+        Returns the future for a day's listing, starting it if nobody has yet:
+        inline when `run_now` is set or there's no executor, otherwise on the executor.
+        """
+        with self._lock:
+            future = self._days.get(date_str)
+            if future is not None:
+                return future
+            future = self._days[date_str] = Future()
+        if run_now or self.executor is None:
+            self._list_day(date_str, future)
+        else:
+            self.executor.submit(self._list_day, date_str, future)
+        return future
+
+    def walk(self, message_path, dates, window=1):
+        """
+        Yields (date_str, prefix, keys) for `message_path` on each of `dates` in order,
+        where `keys` holds that day's newest key for the message path (empty if none).
+        Up to `window` days are listed ahead when the scanner has an executor.
+        """
+        dates = list(dates)
+        for i, date_str in enumerate(dates):
+            if self.executor is not None:
+                for ahead in dates[i + 1:i + window]:
+                    self.day_listing(ahead)
+            by_path = self.day_listing(date_str, run_now=True).result()
+            yield date_str, device_day_prefix(date_str, self.box_id) + message_path, by_path.get(message_path, [])[:1]
+
+    def close(self):
+        self._stop_event.set()
+        with self._lock:
+            futures = list(self._days.values())
+        for future in futures:
+            future.cancel()
+
+    def _list_day(self, date_str, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            by_path = latest_keys_by_message_path(
+                self.s3_client, self.bucket_name, device_day_prefix(date_str, self.box_id), 1, self._stop_event
+            )
+        except Exception as e:
+            if self.log:
+                self.log(f"Error listing {date_str} for {self.box_id}: {e}")
+            self.listing_error = e
+            by_path = {}
+        future.set_result(by_path)
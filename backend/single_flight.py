@@ -0,0 +1,86 @@
+"""
+Single-flight request coalescing. While a call for a key is in flight, further
+calls with the same key wait for it and all get its result (or exception)
+instead of running the same work again. Nothing is kept once the call finishes,
+so this only merges concurrent duplicates; it isn't a cache.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._started = 0
+        self._coalesced = 0
+
+    def _join(self, key):
+        """Returns (future, leader): the key's in-flight future, and whether the caller has to run it."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future, False
+            future = self._flights[key] = Future()
+            self._started += 1
+            return future, True
+
+    def _land(self, key, future, result=None, exception=None):
+        with self._lock:
+            del self._flights[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key, func, *args, **kwargs):
+        """Runs `func(*args, **kwargs)` unless a call for `key` is already in flight, and returns its result."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._land(key, future, exception=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    async def run(self, key, func, *args, **kwargs):
+        """Async do(): awaits `func(*args, **kwargs)` (a coroutine function) unless `key` is already in flight."""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            self._land(key, future, exception=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), "started": self._started, "coalesced": self._coalesced}
+
+
+# coalesced() keys start with the endpoint name, the report scheduler's with "report"
+SINGLE_FLIGHT = SingleFlight()
+
+
+def coalesced(key):
+    """
+    Makes concurrent requests to an async endpoint share one call when they have
+    the same endpoint and `key(**params)`, a tuple of the normalized parameters.
+    Goes above in_pool, so the requests that wait don't hold pool threads.
+    The signature is kept (functools.wraps), so FastAPI still sees the same parameters.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        async def endpoint(*args, **kwargs):
+            return await SINGLE_FLIGHT.run((func.__name__,) + tuple(key(**kwargs)), func, *args, **kwargs)
+        return endpoint
+    return decorate
@@ -0,0 +1,260 @@
+"""
+Per-request traces: a tree of spans for the internal phases of a request
+(registration walk, heartbeat walk, shadow...) and every AWS call it made.
+
+TracingMiddleware starts a trace for each request and keeps it in a context
+variable. Phases are marked with span() / @traced, and AWS calls get a span
+each through botocore events (trace_aws_client). Work handed to a
+ContextThreadPoolExecutor (see endpoint_pools) carries the context along, so
+spans from pool threads land under the span that submitted them.
+
+Each response gets a Server-Timing header summarizing the trace and an
+X-Request-ID header. Finished traces are kept in a fixed-size ring buffer
+(TRACES) for /api/admin/traces.
+"""
+import contextvars
+import functools
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# API parameters copied onto AWS call spans (they say which day, object or thing a call was for)
+TRACED_PARAMS = ("Bucket", "Prefix", "Key", "TableName", "IndexName", "thingName", "UserPoolId", "Username", "queryId")
+
+_current = contextvars.ContextVar("trace_span", default=None)  # (Trace, Span) of the running code
+
+
+class Span:
+    __slots__ = ("name", "parent", "start", "end", "attrs", "thread")
+
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+        self.thread = threading.current_thread().name
+
+    def finish(self, **attrs):
+        self.end = time.perf_counter()
+        self.attrs.update(attrs)
+
+    def duration_ms(self):
+        return None if self.end is None else (self.end - self.start) * 1000
+
+
+class Trace:
+    def __init__(self, request_id, method, path, max_spans=2000):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.max_spans = max_spans
+        self.dropped_spans = 0
+        self.root = Span(f"{method} {path}", None, {})
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    def add(self, name, parent, attrs):
+        """Starts a span under `parent`, or returns None once the trace is full."""
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped_spans += 1
+                return None
+            span = Span(name, parent, attrs)
+            self.spans.append(span)
+            return span
+
+    def summary(self):
+        """[(name, count, total ms)] of the finished spans below the root, by first start."""
+        totals = {}
+        with self._lock:
+            spans = self.spans[1:]
+        for span in spans:
+            if span.end is not None:
+                count, total = totals.get(span.name, (0, 0.0))
+                totals[span.name] = (count + 1, total + span.duration_ms())
+        return [(name, count, total) for name, (count, total) in totals.items()]
+
+    def server_timing(self, limit=30):
+        """Server-Timing header value: total time so far, then each span name with its count and summed duration."""
+        entries = [f"total;dur={(time.perf_counter() - self.root.start) * 1000:.1f}"]
+        for name, count, total in self.summary()[:limit]:
+            token = "".join(c if c.isalnum() or c in ".-_" else "-" for c in name)
+            entries.append(f'{token};dur={total:.1f};desc="{count}x"')
+        return ", ".join(entries)
+
+    def to_dict(self, include_spans=True):
+        trace = {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.root.duration_ms(), 1) if self.root.end is not None else None,
+            "span_count": len(self.spans),
+            "dropped_spans": self.dropped_spans,
+        }
+        if include_spans:
+            with self._lock:
+                spans = list(self.spans)
+            children = {}
+            for span in spans[1:]:
+                children.setdefault(id(span.parent), []).append(span)
+
+            def node(span):
+                duration = span.duration_ms()
+                return {
+                    "name": span.name,
+                    "start_ms": round((span.start - self.root.start) * 1000, 1),
+                    "duration_ms": round(duration, 1) if duration is not None else None,
+                    "thread": span.thread,
+                    **({"attrs": span.attrs} if span.attrs else {}),
+                    **({"children": [node(child) for child in children[id(span)]]} if id(span) in children else {}),
+                }
+
+            trace["spans"] = node(self.root)
+        return trace
+
+
+class TraceBuffer:
+    """The most recent finished traces, oldest dropped first."""
+
+    def __init__(self, size=200):
+        self._traces = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def resize(self, size):
+        with self._lock:
+            self._traces = deque(self._traces, maxlen=size)
+
+    def add(self, trace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def get(self, request_id):
+        with self._lock:
+            return next((trace for trace in reversed(self._traces) if trace.request_id == request_id), None)
+
+    def recent(self, limit=50):
+        with self._lock:
+            return list(self._traces)[-limit:][::-1]
+
+
+# Read by /api/admin/traces
+TRACES = TraceBuffer()
+
+
+def current_request_id():
+    """The request ID of the trace the running code belongs to, or None."""
+    current = _current.get()
+    return current[0].request_id if current else None
+
+
+def new_span(name, **attrs):
+    """Starts a span under the current one without making it current (for leaf work); None outside a trace."""
+    current = _current.get()
+    if current is None:
+        return None
+    trace, parent = current
+    return trace.add(name, parent, attrs)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Runs the block as a span of the current trace; code in it (and work it submits) nests under it."""
+    current = _current.get()
+    started = current[0].add(name, current[1], attrs) if current else None
+    if started is None:
+        yield None
+        return
+    token = _current.set((current[0], started))
+    try:
+        yield started
+    finally:
+        _current.reset(token)
+        started.finish()
+
+
+def traced(name):
+    """Decorator running each call of the function as a span named `name`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace_aws_client(client, account, service):
+    """Gives every call `client` makes within a trace its own span, with the call's key parameters."""
+
+    def before_parameter_build(params=None, context=None, **kwargs):
+        if _current.get() is None:
+            return
+        context["trace_params"] = {name: params[name] for name in TRACED_PARAMS if name in (params or {})}
+
+    def before_call(event_name=None, context=None, **kwargs):
+        operation = event_name.rsplit(".", 1)[-1]
+        context["trace_span"] = new_span(f"{service}.{operation}", account=account, **context.get("trace_params", {}))
+
+    def finish(context, **attrs):
+        call_span = context.pop("trace_span", None)
+        if call_span is not None:
+            attempts = context.get("retries", {}).get("attempt", 1)
+            call_span.finish(**attrs, **({"retries": attempts - 1} if attempts > 1 else {}))
+
+    def after_call(http_response=None, parsed=None, context=None, **kwargs):
+        status = http_response.status_code if http_response is not None else None
+        code = (parsed or {}).get("Error", {}).get("Code")
+        finish(context, status=status, **({"error": code} if code else {}))
+
+    def after_call_error(exception=None, context=None, **kwargs):
+        finish(context, error=type(exception).__name__)
+
+    client.meta.events.register("before-parameter-build", before_parameter_build)
+    client.meta.events.register("before-call", before_call)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware tracing each request. The request ID comes from an X-Request-ID
+    header or is generated, and is sent back with the Server-Timing summary.
+    Paths starting with one of `skip_paths` aren't traced.
+    """
+
+    def __init__(self, app, max_spans=2000, skip_paths=()):
+        self.app = app
+        self.max_spans = max_spans
+        self.skip_paths = tuple(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        trace = Trace(request_id, scope["method"], scope["path"], self.max_spans)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1")),
+                    (b"server-timing", trace.server_timing().encode("latin-1")),
+                ]
+            await send(message)
+
+        token = _current.set((trace, trace.root))
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.root.finish()
+            TRACES.add(trace)
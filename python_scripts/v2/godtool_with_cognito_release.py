@@ -11,7 +11,6 @@ from datetime import datetime, timedelta
 import threading
 import time
 import json
-import msgpack
 import sys
 import signal
 import re
@@ -28,6 +27,10 @@ V2_CONFIG_FILE_PATH = os.path.join(SCRIPT_DIR, "config.json")
 BACKEND_ROOT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..', 'backend')) # Path to /api_tool/backend
 SECRETS_CONFIG_FILE_PATH = os.path.join(BACKEND_ROOT_DIR, "config.yaml")
 
+# Shared helpers live in the backend directory (s3_scan.py, heartbeat_codec.py)
+sys.path.append(BACKEND_ROOT_DIR)
+from s3_scan import DeviceHistoryScanner
+from heartbeat_codec import decode_heartbeat, decode_registration, format_coordinate
 
 try:
     with open(V2_CONFIG_FILE_PATH, "r") as f:
@@ -543,8 +546,10 @@ def perform_slack_lookup(iccid, user_id=None):
                 try:
                     session = boto3.Session(profile_name=matched_profile)
                     s3_client_local = session.client("s3")
+                    # Heartbeat and registration walks share one listing per day
+                    history = open_device_history(iccid, s3_client_local)
 
-                    heartbeat_info = get_latest_heartbeat_info(iccid, account_id, s3_client_local, max_search=CONFIG['settings']['heartbeat_max_search_days'])
+                    heartbeat_info = get_latest_heartbeat_info(iccid, account_id, s3_client_local, max_search=CONFIG['settings']['heartbeat_max_search_days'], scanner=history)
                     if heartbeat_info:
                         found_anything = True
                         # Use battery_percentage for the portal display calculation
@@ -576,7 +581,7 @@ def perform_slack_lookup(iccid, user_id=None):
                         result_lines.append("💓 No heartbeat in last 31 days")
 
                     # Registration info
-                    registration_info = get_latest_registration_info(iccid, account_id, s3_client_local)
+                    registration_info = get_latest_registration_info(iccid, account_id, s3_client_local, scanner=history)
                     if registration_info:
                         found_anything = True
                         reg_raw = registration_info.get('raw')
@@ -673,20 +678,13 @@ def find_iotbackup_bucket(s3_client):
         debug_print(f"Error finding iotbackup bucket: {e}")
         return None
 
-def list_all_s3_objects(s3_client, bucket_name, prefix):
-    """List all S3 objects with given prefix"""
-    try:
-        paginator = s3_client.get_paginator('list_objects_v2')
-        page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-        objects = []
-        for page in page_iterator:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    objects.append(obj['Key'])
-        return objects
-    except Exception as e:
-        debug_print(f"Error listing objects: {e}")
-        return []
+def open_device_history(box_id, s3_client):
+    """Returns a DeviceHistoryScanner over the iotbackup bucket (each day listed once, shared by every walk), or None"""
+    bucket_name = find_iotbackup_bucket(s3_client)
+    debug_print(f"Found bucket: {bucket_name}")
+    if not bucket_name:
+        return None
+    return DeviceHistoryScanner(s3_client, bucket_name, box_id, log=debug_print)
 
 def download_from_s3(s3_client, bucket_name, key):
     """Download object from S3"""
@@ -697,42 +695,6 @@ def download_from_s3(s3_client, bucket_name, key):
         debug_print(f"Error downloading from S3: {e}")
         return None
 
-def decode_messagepack(data):
-    """Decode MessagePack data"""
-    try:
-        return msgpack.unpackb(data, raw=False)
-    except Exception as e:
-        debug_print(f"Error decoding MessagePack: {e}")
-        return None
-
-def decode_heartbeat_v1(data):
-    """Decode version 1 heartbeat data"""
-    try:
-        unpacked = msgpack.unpackb(data, raw=False)
-        if isinstance(unpacked, (list, tuple)) and len(unpacked) > 1 and isinstance(unpacked[1], dict):
-            return unpacked[1]
-        if isinstance(unpacked, dict):
-            return unpacked
-        if isinstance(unpacked, list) and len(unpacked) >= 12:
-            return {
-                'timestamp': unpacked[1],
-                'battery_percentage': unpacked[2],
-                'battery_voltage': unpacked[3],
-                'ax': unpacked[4],
-                'ay': unpacked[5],
-                'az': unpacked[6],
-                'hdop': unpacked[7],
-                'lng': unpacked[8],
-                'lat': unpacked[9],
-                'firmware_version': unpacked[10],
-                'gps_connected': bool(unpacked[11]) if len(unpacked) > 11 else False
-            }
-        debug_print(f"Unexpected unpacked type in decode_heartbeat_v1: {type(unpacked)} - {unpacked}")
-        return None
-    except Exception as e:
-        debug_print(f"Error decoding heartbeat v1: {e}")
-        return None
-
 def format_gps_location(lat, lng):
     """Format GPS coordinates with Google Maps link"""
     if lat == 'N/A' or lng == 'N/A' or lat is None or lng is None:
@@ -752,42 +714,27 @@ def format_gps_location(lat, lng):
         debug_print(f"Error formatting GPS location: {e}")
         return f"{lat}, {lng}"
 
-def format_coordinate(coord):
-    """Format coordinate to 6 decimal places"""
-    if coord == 'N/A' or coord is None:
-        return 'N/A'
-    try:
-        return f"{float(coord):.6f}"
-    except (ValueError, TypeError):
-        return 'N/A'
-
-def get_latest_heartbeat_info(box_id, account_id, s3_client, max_search=31):
-    """Get latest heartbeat information for a device"""
+def get_latest_heartbeat_info(box_id, account_id, s3_client, max_search=31, scanner=None):
+    """
+    Get latest heartbeat information for a device.
+    Pass a `scanner` (see open_device_history) to reuse day listings from another walk.
+    """
     try:
-        bucket_name = find_iotbackup_bucket(s3_client)
-        debug_print(f"Found bucket: {bucket_name}")
-        if not bucket_name:
+        if scanner is None:
+            scanner = open_device_history(box_id, s3_client)
+        if not scanner:
             debug_print("No iotbackup bucket found")
             return None
+        bucket_name = scanner.bucket_name
 
-        search_count = 0
         now = datetime.now()
+        dates = [(now - timedelta(days=search_count)).strftime("%Y-%m-%d") for search_count in range(max_search)]
 
-        while search_count < max_search:
-            date_to_search = now - timedelta(days=search_count)
-            search_count += 1
-            date_str = date_to_search.strftime("%Y-%m-%d")
-            year, month, day = date_str.split('-')
-            base_path = f"{year}/{month}/{day}/Inovia/dev/LittleTheo/"
-            heartbeat_path = f"{base_path}{box_id}/v1-0/heartbeat/push/"
-
+        for date_str, heartbeat_path, objects in scanner.walk("heartbeat/push/", dates):
             debug_print(f"Searching date {date_str}, path: {heartbeat_path}")
 
-            objects = list_all_s3_objects(s3_client, bucket_name, heartbeat_path)
-            debug_print(f"Found {len(objects)} objects in {heartbeat_path}")
-
             if objects:
-                latest_obj = max(objects)
+                latest_obj = objects[0]
                 debug_print(f"Latest object: {latest_obj}")
 
                 data = download_from_s3(s3_client, bucket_name, latest_obj)
@@ -797,64 +744,13 @@ def get_latest_heartbeat_info(box_id, account_id, s3_client, max_search=31):
 
                 debug_print(f"Downloaded {len(data)} bytes")
 
-                vals = decode_messagepack(data)
-                if not vals or len(vals) == 0:
-                    debug_print("Failed to decode messagepack or empty data")
-                    continue
-
-                debug_print(f"Decoded messagepack, first value: {vals[0] if len(vals) > 0 else 'None'}")
-
-                try:
-                    fw_version = int(str(vals[0]))
-                    debug_print(f"Firmware version: {fw_version}")
-                except (ValueError, IndexError):
-                    debug_print(f"Failed to parse firmware version from {vals[0] if len(vals) > 0 else 'None'}")
-                    continue
-
-                hb = None
-                if fw_version > 1000:
-                    debug_print("Treating as unversioned (timestamp)")
-                    hb = decode_messagepack(data)
-                else:
-                    if fw_version == 1:
-                        debug_print("Treating as version 1 heartbeat")
-                        hb = decode_heartbeat_v1(data)
-                    else:
-                        debug_print(f"Unknown firmware version: {fw_version}")
-                        continue
-
+                hb = decode_heartbeat(data)
                 debug_print(f"Decoded heartbeat: {hb}")
+                if hb is None:
+                    debug_print("Failed to decode heartbeat, unknown version or format is unrecognized")
+                    continue
 
-                # Handle dictionary-based heartbeats (v1 and others)
-                if isinstance(hb, dict) and 'timestamp' in hb:
-                    timestamp = hb['timestamp']
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"Successfully parsed dict heartbeat with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        'battery_percentage': hb.get('battery_percentage', 'N/A'),
-                        'battery_voltage': hb.get('battery_voltage', 'N/A'),
-                        'gps_connected': hb.get('gps_connected', False),
-                        'lat': format_coordinate(hb.get('lat', 'N/A')),
-                        'lng': format_coordinate(hb.get('lng', 'N/A')),
-                        'firmware_version': hb.get('firmware_version', 'N/A')
-                    }
-                # Handle list-based "unversioned" heartbeats
-                elif isinstance(hb, list) and len(hb) >= 11:
-                    timestamp = hb[0]
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"Successfully parsed list heartbeat with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        'battery_percentage': hb[1],
-                        'battery_voltage': hb[2],
-                        'gps_connected': bool(hb[10]),
-                        'lat': format_coordinate(hb[8]),
-                        'lng': format_coordinate(hb[7]),
-                        'firmware_version': hb[9]
-                    }
-                else:
-                    debug_print("No timestamp found in heartbeat data or format is unrecognized")
+                return hb.to_info()
 
         debug_print(f"No heartbeat data found after searching {max_search} days")
         return None
@@ -865,34 +761,27 @@ def get_latest_heartbeat_info(box_id, account_id, s3_client, max_search=31):
             traceback.print_exc()
         return None
 
-def get_latest_registration_info(box_id, account_id, s3_client, max_search=31):
-    """Get latest registration information for a device"""
+def get_latest_registration_info(box_id, account_id, s3_client, max_search=31, scanner=None):
+    """
+    Get latest registration information for a device.
+    Pass a `scanner` (see open_device_history) to reuse day listings from another walk.
+    """
     try:
-        bucket_name = find_iotbackup_bucket(s3_client)
-        debug_print(f"REG: Found bucket: {bucket_name}")
-        if not bucket_name:
+        if scanner is None:
+            scanner = open_device_history(box_id, s3_client)
+        if not scanner:
             debug_print("REG: No iotbackup bucket found")
             return None
+        bucket_name = scanner.bucket_name
 
-        search_count = 0
         now = datetime.now()
+        dates = [(now - timedelta(days=search_count)).strftime("%Y-%m-%d") for search_count in range(max_search)]
 
-        while search_count < max_search:
-            date_to_search = now - timedelta(days=search_count)
-            search_count += 1
-            date_str = date_to_search.strftime("%Y-%m-%d")
-            year, month, day = date_str.split('-')
-
-            base_path = f"{year}/{month}/{day}/Inovia/dev/LittleTheo/"
-            registration_path = f"{base_path}{box_id}/v1-0/registration/push/"
-
+        for date_str, registration_path, objects in scanner.walk("registration/push/", dates):
             debug_print(f"REG: Searching date {date_str}, path: {registration_path}")
 
-            objects = list_all_s3_objects(s3_client, bucket_name, registration_path)
-            debug_print(f"REG: Found {len(objects)} objects in {registration_path}")
-
             if objects:
-                latest_obj = max(objects)
+                latest_obj = objects[0]
                 debug_print(f"REG: Latest object: {latest_obj}")
 
                 data = download_from_s3(s3_client, bucket_name, latest_obj)
@@ -902,46 +791,13 @@ def get_latest_registration_info(box_id, account_id, s3_client, max_search=31):
 
                 debug_print(f"REG: Downloaded {len(data)} bytes")
 
-                vals = decode_messagepack(data)
-                if not vals or len(vals) == 0:
-                    debug_print("REG: Failed to decode messagepack or empty data")
+                reg = decode_registration(data)
+                debug_print(f"REG: Decoded registration: {reg}")
+                if reg is None:
+                    debug_print("REG: Failed to decode registration or no timestamp found")
                     continue
 
-                debug_print(f"REG: Decoded messagepack: {vals}")
-
-                reg = None
-                if isinstance(vals, dict):
-                    reg = vals
-                elif isinstance(vals, list) and len(vals) > 0:
-                    if isinstance(vals[0], dict):
-                        reg = vals[0]
-                    elif len(vals) > 1 and isinstance(vals[1], dict):
-                        reg = vals[1]
-                    else:
-                        reg = vals
-                else:
-                    reg = vals
-
-                debug_print(f"REG: Processed registration data: {reg}")
-
-                if isinstance(reg, dict) and 'timestamp' in reg:
-                    timestamp = reg['timestamp']
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"REG: Successfully parsed registration with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        **{k: v for k, v in reg.items() if k != 'timestamp'}
-                    }
-                elif isinstance(reg, list) and len(reg) > 0 and isinstance(reg[0], (int, float)):
-                    timestamp = reg[0]
-                    dt = datetime.fromtimestamp(timestamp)
-                    debug_print(f"REG: Successfully parsed registration (list) with timestamp: {timestamp}")
-                    return {
-                        'last_seen': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        'raw': reg
-                    }
-                else:
-                    debug_print("REG: No timestamp found in registration data")
+                return reg.to_info()
 
         debug_print(f"REG: No registration data found after searching {max_search} days")
         return None